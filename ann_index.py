@@ -0,0 +1,147 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Rows are assigned to centroids in blocks to bound the (rows x nlist) score matrix.
+_ASSIGN_BLOCK = 16_384
+
+
+def default_nlist(n: int) -> int:
+    return int(np.clip(4 * np.sqrt(max(n, 1)), 1, 65_536))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+
+def assign_to_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    assign = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], _ASSIGN_BLOCK):
+        block = vectors[start:start + _ASSIGN_BLOCK]
+        assign[start:start + block.shape[0]] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+def spherical_kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """k-means on the unit sphere (cosine similarity); returns normalized centroids."""
+    rng = np.random.default_rng(seed)
+    n = vectors.shape[0]
+    k = min(k, n)
+    centroids = vectors[rng.choice(n, k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = assign_to_centroids(vectors, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=k)
+        present = np.flatnonzero(counts)
+        offsets = np.concatenate([[0], np.cumsum(counts[present])[:-1]])
+        centroids[present] = np.add.reduceat(vectors[order], offsets, axis=0)
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(n, len(empty), replace=False)]
+        centroids = _normalize(centroids)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file ANN index over the rows of a VectorStore.
+
+    Rows are bucketed by their nearest k-means centroid. A query scores the
+    centroids, then scores exactly only the rows in its nprobe closest
+    buckets. The index stores row ids only; vectors stay in the VectorStore.
+    """
+
+    def __init__(self, centroids: np.ndarray, nprobe: Optional[int] = None, trained_rows: int = 0):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.nprobe = nprobe or max(8, self.nlist // 16)
+        self.trained_rows = trained_rows
+        self._assign = np.empty(0, dtype=np.int32)
+        # CSR layout of the inverted lists; rows added since the last rebuild
+        # sit in the pending tail and are scanned by assignment instead.
+        self._order = np.empty(0, dtype=np.int64)
+        self._offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+        self._indexed = 0
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    def __len__(self) -> int:
+        return self._assign.shape[0]
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, nlist: Optional[int] = None, nprobe: Optional[int] = None,
+              iterations: int = 10, max_training_rows: int = 256, seed: int = 0) -> "IVFIndex":
+        """Train centroids on a sample of (normalized) vectors and index all of them.
+
+        max_training_rows is per centroid.
+        """
+        n = vectors.shape[0]
+        nlist = min(nlist or default_nlist(n), n)
+        sample_size = min(n, nlist * max_training_rows)
+        sample = vectors
+        if sample_size < n:
+            sample = vectors[np.sort(np.random.default_rng(seed).choice(n, sample_size, replace=False))]
+        index = cls(spherical_kmeans(np.asarray(sample, dtype=np.float32), nlist, iterations, seed), nprobe, n)
+        index.add(vectors)
+        index._rebuild()
+        return index
+
+    def add(self, vectors: np.ndarray):
+        """Assign new rows (appended after the existing ones) to their buckets."""
+        self._assign = np.concatenate([self._assign, assign_to_centroids(vectors, self.centroids)])
+        if len(self) - self._indexed > max(1024, self._indexed // 10):
+            self._rebuild()
+
+    def _rebuild(self):
+        self._order = np.argsort(self._assign, kind="stable").astype(np.int64)
+        counts = np.bincount(self._assign, minlength=self.nlist)
+        self._offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self._indexed = len(self)
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        probes = np.argpartition(-(self.centroids @ query), min(nprobe, self.nlist) - 1)[:nprobe]
+        parts = [self._order[self._offsets[c]:self._offsets[c + 1]] for c in probes]
+        if self._indexed < len(self):
+            pending = self._assign[self._indexed:]
+            parts.append(self._indexed + np.flatnonzero(np.isin(pending, probes)))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def search(self, matrix: np.ndarray, queries: np.ndarray, top_k: int, nprobe: Optional[int] = None,
+               mask: Optional[np.ndarray] = None) -> List[Optional[Tuple[np.ndarray, np.ndarray]]]:
+        """Approximate top_k per normalized query; None where too few candidates survive the mask."""
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        results = []
+        for query in queries:
+            rows = self.candidates(query, nprobe)
+            if mask is not None:
+                rows = rows[mask[rows]]
+            if rows.shape[0] < top_k:
+                results.append(None)
+                continue
+            scores = matrix[rows] @ query
+            k = min(top_k, rows.shape[0])
+            best = np.argpartition(-scores, k - 1)[:k] if k < rows.shape[0] else np.arange(rows.shape[0])
+            best = best[np.argsort(-scores[best], kind="stable")]
+            results.append((rows[best], scores[best]))
+        return results
+
+    def reassigned(self, vectors: np.ndarray) -> "IVFIndex":
+        """Same centroids and settings, re-indexing a new set of rows (e.g. after compaction)."""
+        index = IVFIndex(self.centroids, self.nprobe, self.trained_rows)
+        index.add(vectors)
+        index._rebuild()
+        return index
+
+    def save(self, file):
+        np.savez(file, centroids=self.centroids, assign=self._assign,
+                 nprobe=np.int64(self.nprobe), trained_rows=np.int64(self.trained_rows))
+
+    @classmethod
+    def load(cls, file) -> "IVFIndex":
+        with np.load(file) as data:
+            index = cls(data["centroids"], int(data["nprobe"]), int(data["trained_rows"]))
+            index._assign = data["assign"].astype(np.int32)
+        index._rebuild()
+        return index
@@ -0,0 +1,157 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Optional
+
+import numpy as np
+
+from embedding_cache import normalize_text
+
+
+def normalize_question(question: str) -> str:
+    return normalize_text(question).lower().rstrip("?!. ")
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    embedding: Optional[np.ndarray]
+    created_at: float
+
+
+class AnswerCache:
+    """Two-level cache of answers, keyed by corpus scope.
+
+    Level one matches the normalized question text exactly. Level two reuses
+    an answer whose question embedding has cosine similarity of at least
+    similarity_threshold with the new question, within the same scope. The
+    scope (see Corpus.cache_scope) includes the corpus version, so entries for
+    documents that have since changed are never returned. Entries expire
+    after ttl_seconds, and the least recently used are evicted beyond
+    max_entries.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600.0, similarity_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: "OrderedDict[tuple, CachedAnswer]" = OrderedDict()
+        # Per scope: question keys and a lazily rebuilt matrix of their unit embeddings
+        self._scope_keys: Dict[Hashable, List[str]] = {}
+        self._scope_matrix: Dict[Hashable, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _expired(self, entry: CachedAnswer, now: float) -> bool:
+        return now - entry.created_at > self.ttl_seconds
+
+    def _remove(self, key: tuple):
+        entry = self._entries.pop(key)
+        if entry.embedding is None:
+            return
+        scope, question = key
+        keys = self._scope_keys.get(scope)
+        if keys is not None:
+            keys.remove(question)
+            self._scope_matrix.pop(scope, None)
+            if not keys:
+                del self._scope_keys[scope]
+
+    def get(self, scope: Hashable, question: str, count_miss: bool = True) -> Optional[str]:
+        """Exact lookup on the normalized question.
+
+        Callers that look the question up again with get_similar pass
+        count_miss=False, so a question counts one miss, not two; if that
+        lookup does not happen they call record_miss instead.
+        """
+        key = (scope, normalize_question(question))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                if count_miss:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry.answer
+
+    def get_similar(self, scope: Hashable, embedding) -> Optional[str]:
+        """Semantic lookup; counts a miss when nothing is close enough."""
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        now = time.time()
+        with self._lock:
+            keys = self._scope_keys.get(scope)
+            if not keys:
+                self.misses += 1
+                return None
+            matrix = self._scope_matrix.get(scope)
+            if matrix is None:
+                matrix = np.stack([self._entries[(scope, q)].embedding for q in keys])
+                self._scope_matrix[scope] = matrix
+            scores = matrix @ query
+            for i in np.argsort(-scores):
+                if scores[i] < self.similarity_threshold:
+                    break
+                key = (scope, keys[i])
+                entry = self._entries[key]
+                if self._expired(entry, now):
+                    continue
+                self._entries.move_to_end(key)
+                self.semantic_hits += 1
+                return entry.answer
+            self.misses += 1
+            return None
+
+    def record_miss(self, count: int = 1):
+        with self._lock:
+            self.misses += count
+
+    def put(self, scope: Hashable, question: str, answer: str, embedding=None):
+        key = (scope, normalize_question(question))
+        vector = None
+        if embedding is not None:
+            vector = np.asarray(embedding, dtype=np.float32)
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = CachedAnswer(answer, vector, time.time())
+            if vector is not None:
+                self._scope_keys.setdefault(scope, []).append(key[1])
+                self._scope_matrix.pop(scope, None)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._scope_keys.clear()
+            self._scope_matrix.clear()
+
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,79 @@
+"""Recall@k and latency of IVF search against exact search on synthetic embeddings.
+
+    python -m benchmarks.ann_recall --rows 200000 --nprobe 4 8 16 32 64
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from vector_store import VectorStore
+
+
+def synthetic_embeddings(rows: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Clustered unit vectors, closer to real text embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, rows)
+    return centers[labels] + 1.5 * rng.normal(size=(rows, dim)).astype(np.float32)
+
+
+def percentile_ms(samples, q):
+    return round(float(np.percentile(samples, q)) * 1000, 3)
+
+
+def timed_search(store, queries, top_k, **kwargs):
+    ids = []
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        row_ids, _ = store.search(query, top_k, **kwargs)
+        latencies.append(time.perf_counter() - started)
+        ids.append(row_ids)
+    return ids, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    vectors = synthetic_embeddings(args.rows, args.dim, args.clusters)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(args.rows, args.queries, replace=False)]
+    queries = queries + 0.3 * rng.normal(size=queries.shape).astype(np.float32)
+
+    store = VectorStore(args.dim)
+    store.add(vectors)
+    exact_ids, exact_latency = timed_search(store, queries, args.top_k, exact=True)
+    print(json.dumps({
+        "mode": "exact", "rows": args.rows, "top_k": args.top_k, "recall": 1.0,
+        "p50_ms": percentile_ms(exact_latency, 50), "p95_ms": percentile_ms(exact_latency, 95),
+    }))
+
+    started = time.perf_counter()
+    ann = store.build_ann(nlist=args.nlist)
+    build_seconds = time.perf_counter() - started
+
+    for nprobe in args.nprobe:
+        ann_ids, latency = timed_search(store, queries, args.top_k, nprobe=nprobe)
+        recall = np.mean([
+            len(set(a.tolist()) & set(e.tolist())) / len(e) for a, e in zip(ann_ids, exact_ids)
+        ])
+        print(json.dumps({
+            "mode": "ivf", "rows": args.rows, "top_k": args.top_k, "nlist": ann.nlist, "nprobe": nprobe,
+            "recall": round(float(recall), 4),
+            "p50_ms": percentile_ms(latency, 50), "p95_ms": percentile_ms(latency, 95),
+            "build_seconds": round(build_seconds, 3),
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Compare the token-budgeted chunker with the fixed 1000-character splitter.
+
+For each document: chunk count, tokens sent to the embeddings API, and
+retrieval quality, i.e. how often a chunk among the top k contains the whole
+sentence a query was taken from. Retrieval uses BM25 by default, so no API
+calls are made; --dense embeds with the OpenAI API instead.
+
+    python -m benchmarks.chunking path/to/a.pdf path/to/b.pdf --max-tokens 256 512
+"""
+import argparse
+import json
+import os
+import random
+import re
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import synthetic_document
+from chunker import TokenCounter, token_chunk_spans
+from lexical_index import BM25Index, tokenize
+from pdf_extract import iter_pages
+from rag_system import chunk_spans
+from vector_store import VectorStore
+
+_SENTENCE_RE = re.compile(r"[A-Z][^.!?]{40,400}[.!?]")
+
+
+def sample_queries(text: str, n: int, seed: int = 0):
+    """(query, sentence span) pairs; each query is half of a sentence's words."""
+    rng = random.Random(seed)
+    sentences = [m.span() for m in _SENTENCE_RE.finditer(text)]
+    queries = []
+    for start, end in rng.sample(sentences, min(n, len(sentences))):
+        words = text[start:end].split()
+        size = max(4, len(words) // 2)
+        offset = rng.randint(0, len(words) - size)
+        queries.append((" ".join(words[offset:offset + size]), (start, end)))
+    return queries
+
+
+def lexical_ranker(texts, queries, top_k):
+    index = BM25Index()
+    index.add([tokenize(text) for text in texts])
+    return [index.search(tokenize(query), top_k)[0] for query, _ in queries]
+
+
+def dense_ranker(texts, queries, top_k):
+    from openai import OpenAI
+    from embedding_pipeline import EmbeddingPipeline
+
+    pipeline = EmbeddingPipeline(OpenAI(api_key=os.environ.get("OPENAI_API_KEY", "sk-local")))
+    store = VectorStore()
+    store.add(pipeline.embed(texts))
+    ids, _ = store.search_batch(pipeline.embed([query for query, _ in queries]), top_k)
+    return list(ids)
+
+
+def evaluate(name, text, spans, counter, queries, ranker, top_k, seconds):
+    texts = [text[start:end] for start, end in spans]
+    tokens = counter.count_many(texts)
+    document_tokens = counter.count(text)
+    rankings = ranker(texts, queries, top_k)
+    hits = []
+    reciprocal_ranks = []
+    for (_, (start, end)), ranking in zip(queries, rankings):
+        rank = next((r for r, i in enumerate(ranking) if spans[i][0] <= start and end <= spans[i][1]), None)
+        hits.append(rank is not None)
+        reciprocal_ranks.append(0.0 if rank is None else 1.0 / (rank + 1))
+    return {
+        "chunker": name,
+        "chunks": len(spans),
+        "embedded_tokens": int(sum(tokens)),
+        "document_tokens": document_tokens,
+        "token_overhead": round(sum(tokens) / max(document_tokens, 1) - 1, 4),
+        "mean_chunk_tokens": round(float(np.mean(tokens)), 1) if tokens else 0.0,
+        "max_chunk_tokens": max(tokens, default=0),
+        "chunking_ms": round(seconds * 1000, 1),
+        "queries": len(queries),
+        f"sentence_hit@{top_k}": round(float(np.mean(hits)), 4) if hits else None,
+        "mrr": round(float(np.mean(reciprocal_ranks)), 4) if hits else None,
+    }
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdfs", nargs="*", help="PDF files; a synthetic document is used if none are given")
+    parser.add_argument("--max-tokens", type=int, nargs="+", default=[256])
+    parser.add_argument("--overlap-tokens", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--dense", action="store_true", help="rank with OpenAI embeddings instead of BM25")
+    args = parser.parse_args()
+
+    counter = TokenCounter()
+    ranker = dense_ranker if args.dense else lexical_ranker
+    documents = [(path, "".join(page.text for page in iter_pages(path))) for path in args.pdfs]
+    documents = documents or [("synthetic", synthetic_document())]
+
+    for name, text in documents:
+        queries = sample_queries(text, args.queries)
+        spans, seconds = timed(chunk_spans, text)
+        result = evaluate("chars-1000/200", text, spans, counter, queries, ranker, args.top_k, seconds)
+        print(json.dumps({"document": name, "tokenizer": counter.name, **result}))
+        for max_tokens in args.max_tokens:
+            spans, seconds = timed(token_chunk_spans, text, max_tokens, args.overlap_tokens, counter)
+            result = evaluate(f"tokens-{max_tokens}/{args.overlap_tokens}", text, spans, counter, queries, ranker,
+                              args.top_k, seconds)
+            print(json.dumps({"document": name, "tokenizer": counter.name, **result}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Compare two result files written with --output by benchmarks.pipeline or benchmarks.load_test.
+
+Prints one JSON line per stage present in both files with the relative
+change of p50/p95/p99 latency and throughput; exits with status 1 if any
+p95 latency grew, or throughput fell, by more than --threshold.
+
+    python -m benchmarks.compare before.json after.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+LATENCIES = ("p50_ms", "p95_ms", "p99_ms")
+THROUGHPUTS = ("throughput_per_s", "throughput_rps")
+
+
+def result_key(result: dict) -> tuple:
+    return result["stage"], result.get("mode"), result.get("concurrency")
+
+
+def change(before, after):
+    if before is None or after is None or before == 0:
+        return None
+    return round(after / before - 1, 4)
+
+
+def compare(before: dict, after: dict, threshold: float):
+    """(rows, regressed) for the stages present in both result files."""
+    baseline = {result_key(result): result for result in before["results"]}
+    rows = []
+    regressed = False
+    for result in after["results"]:
+        old = baseline.get(result_key(result))
+        if old is None:
+            continue
+        row = {"stage": result["stage"]}
+        for field in ("mode", "concurrency"):
+            if result.get(field) is not None:
+                row[field] = result[field]
+        for field in LATENCIES + THROUGHPUTS:
+            if field in result:
+                row[field] = [old.get(field), result[field], change(old.get(field), result[field])]
+        p95 = row.get("p95_ms", [None, None, None])[2]
+        throughput = next((row[field][2] for field in THROUGHPUTS if field in row), None)
+        row["regression"] = (p95 is not None and p95 > threshold) or (throughput is not None and throughput < -threshold)
+        regressed = regressed or row["regression"]
+        rows.append(row)
+    return rows, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    if before.get("benchmark") != after.get("benchmark"):
+        sys.exit(f"cannot compare {before.get('benchmark')} results with {after.get('benchmark')} results")
+    rows, regressed = compare(before, after, args.threshold)
+    print(json.dumps({"before": before["environment"].get("commit"), "after": after["environment"].get("commit")}))
+    for row in rows:
+        print(json.dumps(row))
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Measure EmbeddingPipeline throughput for a grid of batch/concurrency settings.
+
+Point it at a local stand-in for the embeddings API to tune without spending quota:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 python -m benchmarks.embedding_throughput
+"""
+import argparse
+import json
+import os
+import random
+
+from openai import OpenAI
+
+from embedding_pipeline import EmbeddingPipeline
+
+WORDS = "the of and to in is for on that with as by this be are from at or an it".split()
+
+
+def synthetic_chunks(n: int, chars: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    chunks = []
+    for _ in range(n):
+        words = []
+        length = 0
+        while length < chars:
+            word = rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        chunks.append(" ".join(words)[:chars])
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default=os.environ.get("OPENAI_BASE_URL"))
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--chunk-chars", type=int, default=1000)
+    parser.add_argument("--batch-tokens", type=int, nargs="+", default=[8_000, 30_000, 60_000])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY", "sk-local"), base_url=args.base_url)
+    texts = synthetic_chunks(args.chunks, args.chunk_chars)
+
+    for batch_tokens in args.batch_tokens:
+        for concurrency in args.concurrency:
+            pipeline = EmbeddingPipeline(client, max_batch_tokens=batch_tokens, concurrency=concurrency)
+            pipeline.embed(texts)
+            result = {"batch_tokens": batch_tokens, "concurrency": concurrency}
+            result.update(pipeline.last_stats.as_dict())
+            print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Local stand-in for the OpenAI embeddings and chat completions endpoints.
+
+Latency, streaming speed and rate limiting are configurable, and nothing
+leaves the machine. Embeddings are deterministic bag-of-words projections, so
+texts sharing words get similar vectors and retrieval behaves plausibly.
+
+    python -m benchmarks.fake_openai --port 8001 --latency-ms 80 --rate-limit-rps 50
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 uvicorn main:app
+"""
+import argparse
+import asyncio
+import base64
+import contextlib
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
+
+import httpx
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+_WORD_RE = re.compile(r"\w+")
+HASH_BUCKETS = 4096
+ANSWER = ("Based on the provided context, the document describes the requested procedure in detail. "
+          "The relevant section lists the required values and the steps to follow.")
+
+
+@dataclass
+class FakeSettings:
+    latency_ms: float = 50.0  # per request
+    per_input_ms: float = 0.05  # per embedded text
+    jitter_ms: float = 10.0
+    token_delay_ms: float = 15.0  # between streamed chat tokens
+    rate_limit_rps: float = 0.0  # token bucket; 0 disables
+    error_rate: float = 0.0  # share of requests answered with 429 regardless of the bucket
+    retry_after: float = 0.5
+    dim: int = 1536
+    seed: int = 0
+
+
+class _TokenBucket:
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+def create_app(settings: Optional[FakeSettings] = None) -> FastAPI:
+    settings = settings or FakeSettings()
+    app = FastAPI(title="Fake OpenAI")
+    projection = np.random.default_rng(settings.seed).standard_normal((HASH_BUCKETS, settings.dim)).astype(np.float32)
+    bucket = _TokenBucket(settings.rate_limit_rps) if settings.rate_limit_rps > 0 else None
+    rng = random.Random(settings.seed)
+    counters = {"requests": 0, "rate_limited": 0, "embedded_inputs": 0, "chat_completions": 0}
+
+    def embed(texts: List[str]) -> np.ndarray:
+        counts = np.zeros((len(texts), HASH_BUCKETS), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in _WORD_RE.findall(text.lower()):
+                counts[i, zlib.crc32(word.encode()) % HASH_BUCKETS] += 1
+        vectors = counts @ projection
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    async def delay(extra_ms: float = 0.0):
+        jitter = rng.uniform(-settings.jitter_ms, settings.jitter_ms) if settings.jitter_ms else 0.0
+        await asyncio.sleep(max(0.0, settings.latency_ms + extra_ms + jitter) / 1000)
+
+    def rate_limited() -> Optional[JSONResponse]:
+        counters["requests"] += 1
+        if (bucket is not None and not bucket.take()) or (settings.error_rate and rng.random() < settings.error_rate):
+            counters["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429, headers={"retry-after": str(settings.retry_after)},
+            )
+        return None
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        limited = rate_limited()
+        if limited is not None:
+            return limited
+        texts = [body["input"]] if isinstance(body["input"], str) else body["input"]
+        await delay(settings.per_input_ms * len(texts))
+        vectors = await asyncio.to_thread(embed, texts)
+        counters["embedded_inputs"] += len(texts)
+        as_base64 = body.get("encoding_format") == "base64"
+        data = [
+            {"object": "embedding", "index": i,
+             "embedding": base64.b64encode(vector.tobytes()).decode() if as_base64 else vector.tolist()}
+            for i, vector in enumerate(vectors)
+        ]
+        tokens = sum(len(text) // 4 for text in texts)
+        return {"object": "list", "model": body["model"], "data": data,
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        limited = rate_limited()
+        if limited is not None:
+            return limited
+        counters["chat_completions"] += 1
+        prompt_tokens = sum(len(m.get("content") or "") for m in body["messages"]) // 4
+        words = ANSWER.split(" ")
+        await delay()
+        if not body.get("stream"):
+            return {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": ANSWER}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                          "total_tokens": prompt_tokens + len(words)},
+            }
+
+        async def events():
+            for i, word in enumerate(words):
+                if i:
+                    await asyncio.sleep(settings.token_delay_ms / 1000)
+                chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": body["model"],
+                         "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word},
+                                      "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return counters
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url: str, timeout: float = 30.0, process: Optional[subprocess.Popen] = None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise TimeoutError(f"{url} did not come up within {timeout}s")
+
+
+def settings_args(settings: FakeSettings) -> List[str]:
+    return [
+        "--latency-ms", str(settings.latency_ms), "--per-input-ms", str(settings.per_input_ms),
+        "--jitter-ms", str(settings.jitter_ms), "--token-delay-ms", str(settings.token_delay_ms),
+        "--rate-limit-rps", str(settings.rate_limit_rps), "--error-rate", str(settings.error_rate),
+        "--retry-after", str(settings.retry_after), "--dim", str(settings.dim), "--seed", str(settings.seed),
+    ]
+
+
+@contextlib.contextmanager
+def running_fake_server(settings: Optional[FakeSettings] = None, port: Optional[int] = None) -> Iterator[str]:
+    """Run the fake server in a subprocess; yields its base URL (ending in /v1)."""
+    port = port or free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_openai", "--port", str(port)] + settings_args(settings or FakeSettings()),
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    try:
+        wait_until_up(f"http://127.0.0.1:{port}/stats", process=process)
+        yield f"http://127.0.0.1:{port}/v1"
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def add_settings_arguments(parser: argparse.ArgumentParser):
+    defaults = FakeSettings()
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms)
+    parser.add_argument("--per-input-ms", type=float, default=defaults.per_input_ms)
+    parser.add_argument("--jitter-ms", type=float, default=defaults.jitter_ms)
+    parser.add_argument("--token-delay-ms", type=float, default=defaults.token_delay_ms)
+    parser.add_argument("--rate-limit-rps", type=float, default=defaults.rate_limit_rps)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after)
+    parser.add_argument("--dim", type=int, default=defaults.dim)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def settings_from_args(args: argparse.Namespace) -> FakeSettings:
+    return FakeSettings(args.latency_ms, args.per_input_ms, args.jitter_ms, args.token_delay_ms, args.rate_limit_rps,
+                        args.error_rate, args.retry_after, args.dim, args.seed)
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(settings_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""Load-test the FastAPI app with concurrent clients against a local fake OpenAI server.
+
+Starts the fake server and `uvicorn main:app` in subprocesses (with a fresh
+index directory and the embedding cache off), uploads synthetic PDFs, waits
+for ingest, then drives /ask and /ask/stream at each concurrency level.
+Reports latency percentiles, throughput, errors, time to first token for
+streams and the server's peak RSS as JSON lines; --output also writes them
+to a file for benchmarks.compare.
+
+    python -m benchmarks.load_test --concurrency 1 8 32 --requests 200 --latency-ms 300
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.fake_openai import add_settings_arguments, free_port, running_fake_server, settings_from_args, wait_until_up
+from benchmarks.stats import environment, latency_summary, peak_rss_mb
+from benchmarks.synthetic import synthetic_pdf, synthetic_questions
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FINISHED = ("completed", "failed", "cancelled")
+
+
+def start_app(base_url: str, workdir: str, port: int, answer_cache: bool) -> subprocess.Popen:
+    env = dict(os.environ, OPENAI_BASE_URL=base_url, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "sk-local"),
+               RAG_EMBEDDING_CACHE="", RAG_INDEX_DIR=os.path.join(workdir, "index"))
+    if not answer_cache:
+        env["RAG_ANSWER_CACHE_SIZE"] = "0"
+    # cwd is the scratch directory so temp_uploads/ is created there, not in the checkout
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", REPO_DIR, "--port", str(port),
+         "--log-level", "warning"],
+        cwd=workdir, env=env,
+    )
+
+
+async def ingest(client: httpx.AsyncClient, paths: list, timeout: float) -> dict:
+    """Upload all PDFs at once and wait until every job has finished."""
+    async def upload(path):
+        started = time.perf_counter()
+        with open(path, "rb") as f:
+            response = await client.post("/upload", files={"file": (os.path.basename(path), f, "application/pdf")})
+        response.raise_for_status()
+        return response.json()["job_id"], time.perf_counter() - started
+
+    started = time.perf_counter()
+    uploads = await asyncio.gather(*(upload(path) for path in paths))
+    jobs = {}
+    deadline = time.monotonic() + timeout
+    while len(jobs) < len(uploads):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"ingest did not finish within {timeout}s")
+        for job_id, _ in uploads:
+            if job_id not in jobs:
+                job = (await client.get(f"/jobs/{job_id}")).json()
+                if job["status"] in FINISHED:
+                    jobs[job_id] = job
+        await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - started
+    failed = [job for job in jobs.values() if job["status"] != "completed"]
+    if failed:
+        raise RuntimeError(f"ingest failed: {failed[0].get('error')}")
+    return {
+        "stage": "upload",
+        "documents": len(paths),
+        "pages": sum(job["pages_total"] for job in jobs.values()),
+        "chunks": sum(job["chunks_embedded"] for job in jobs.values()),
+        "upload": latency_summary([seconds for _, seconds in uploads]),
+        "ingest": latency_summary([job["finished_at"] - job["created_at"] for job in jobs.values()]),
+        "seconds": round(elapsed, 3),
+    }
+
+
+async def ask(client: httpx.AsyncClient, question: str, mode, samples: dict):
+    body = {"question": question, **({"mode": mode} if mode else {})}
+    response = await client.post("/ask", json=body)
+    response.raise_for_status()
+
+
+async def ask_stream(client: httpx.AsyncClient, question: str, mode, samples: dict):
+    body = {"question": question, **({"mode": mode} if mode else {})}
+    started = time.perf_counter()
+    async with client.stream("POST", "/ask/stream", json=body) as response:
+        response.raise_for_status()
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                if event == "error":
+                    raise RuntimeError(json.loads(line[len("data: "):])["detail"])
+                if "ttft" not in samples:
+                    samples["ttft"] = time.perf_counter() - started
+            elif not line:
+                event = None
+
+
+async def drive(client: httpx.AsyncClient, request, questions: list, total: int, concurrency: int, mode) -> dict:
+    """total requests from concurrency clients, each sending its next request as soon as the last one returns."""
+    latencies, ttfts, errors = [], [], []
+    sent = 0
+
+    async def worker():
+        nonlocal sent
+        while sent < total:
+            question = questions[sent % len(questions)]
+            sent += 1
+            samples = {}
+            started = time.perf_counter()
+            try:
+                await request(client, question, mode, samples)
+            except (httpx.HTTPError, RuntimeError) as e:
+                errors.append(f"{type(e).__name__}: {e}")
+                continue
+            latencies.append(time.perf_counter() - started)
+            if "ttft" in samples:
+                ttfts.append(samples["ttft"])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    result = {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": len(errors),
+        **latency_summary(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+    }
+    if ttfts:
+        result["ttft"] = latency_summary(ttfts)
+    if errors:
+        result["first_error"] = errors[0]
+    return result
+
+
+async def run(args, app_url: str, app_pid: int, paths: list, questions: list) -> list:
+    results = []
+
+    def report(result: dict):
+        result["server_peak_rss_mb"] = peak_rss_mb(app_pid)
+        results.append(result)
+        print(json.dumps(result), flush=True)
+
+    limits = httpx.Limits(max_connections=max(args.concurrency) + 10)
+    async with httpx.AsyncClient(base_url=app_url, timeout=args.timeout, limits=limits) as client:
+        report(await ingest(client, paths, args.timeout))
+        for endpoint, request in (("/ask", ask), ("/ask/stream", ask_stream)):
+            if endpoint not in args.endpoints:
+                continue
+            for concurrency in args.concurrency:
+                result = await drive(client, request, questions, args.requests, concurrency, args.mode)
+                report({"stage": endpoint, "mode": args.mode, **result})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=20, help="pages per document")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint and concurrency level")
+    parser.add_argument("--endpoints", nargs="+", default=["/ask", "/ask/stream"])
+    parser.add_argument("--mode", choices=["dense", "lexical", "hybrid"], help="retrieval mode sent with questions")
+    parser.add_argument("--answer-cache", action="store_true", help="keep the server's answer cache enabled")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--output", help="also write the results, with environment details, to this JSON file")
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+    settings = settings_from_args(args)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        questions = []
+        for i in range(args.documents):
+            path = os.path.join(tmp, f"synthetic-{i}.pdf")
+            text = synthetic_pdf(path, args.pages, seed=args.seed + i)
+            questions += synthetic_questions(text, max(1, args.requests // args.documents), seed=args.seed + i)
+            paths.append(path)
+
+        with running_fake_server(settings) as base_url:
+            port = free_port()
+            app = start_app(base_url, tmp, port, args.answer_cache)
+            app_url = f"http://127.0.0.1:{port}"
+            try:
+                wait_until_up(f"{app_url}/health", process=app)
+                results = asyncio.run(run(args, app_url, app.pid, paths, questions))
+            finally:
+                app.terminate()
+                app.wait(timeout=30)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"benchmark": "load_test", "environment": environment(fake_openai=vars(settings)),
+                       "documents": args.documents, "pages": args.pages, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Per-stage benchmark of RAGSystem against a local fake OpenAI server.
+
+Stages: PDF extraction (serial and in the worker pool), chunking (the fixed
+character splitter and the token chunker), embedding, full ingest via
+process_pdf, find_relevant_chunks in each retrieval mode, answer_question one
+question at a time, and aanswer_batch over all questions at once.
+Corpora are synthetic PDFs, so runs are reproducible and need no API key.
+Prints one JSON line per stage; --output also writes all of them to a file
+that benchmarks.compare can diff against another run.
+
+    python -m benchmarks.pipeline --pages 50 --questions 100 --output before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.fake_openai import FakeSettings, add_settings_arguments, running_fake_server, settings_from_args
+from benchmarks.stats import environment, measure, stage_result
+from benchmarks.synthetic import synthetic_pdf, synthetic_questions
+from chunker import TokenCounter, token_chunk_spans
+from pdf_extract import iter_pages_parallel
+from rag_system import RETRIEVAL_MODES, RAGSystem
+
+
+def run(args, settings: FakeSettings) -> list:
+    results = []
+
+    def report(result: dict):
+        results.append(result)
+        print(json.dumps(result), flush=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, "synthetic.pdf")
+        text = synthetic_pdf(pdf_path, args.pages, args.seed)
+        questions = synthetic_questions(text, args.questions, args.seed)
+        rag = RAGSystem(os.environ.get("OPENAI_API_KEY", "sk-local"), cpu_workers=args.cpu_workers)
+        try:
+            seconds = measure(lambda: rag.extract_text_from_pdf(pdf_path), args.repeat)
+            report(stage_result("extract", seconds, args.pages, unit="pages"))
+            seconds = measure(lambda: list(iter_pages_parallel(pdf_path, rag.cpu_pool)), args.repeat)
+            report(stage_result("extract_parallel", seconds, args.pages, unit="pages", workers=args.cpu_workers))
+
+            text = rag.extract_text_from_pdf(pdf_path)
+            chunks = rag.chunk_text(text)
+            seconds = measure(lambda: rag.chunk_text(text), args.repeat)
+            report(stage_result("chunk_text", seconds, len(chunks), unit="chunks", chunker="chars-1000/200"))
+            counter = TokenCounter()
+            spans = token_chunk_spans(text, rag.chunk_tokens, rag.chunk_overlap_tokens, counter)
+            seconds = measure(lambda: token_chunk_spans(text, rag.chunk_tokens, rag.chunk_overlap_tokens, counter),
+                              args.repeat)
+            report(stage_result("chunk_tokens", seconds, len(spans), unit="chunks",
+                                chunker=f"tokens-{rag.chunk_tokens}/{rag.chunk_overlap_tokens}",
+                                tokenizer=counter.name))
+
+            texts = [text[start:end] for start, end in spans]
+            seconds = measure(lambda: rag.embedder.embed(texts), args.repeat, warmup=0)
+            report(stage_result("embed", seconds, len(texts), unit="chunks",
+                                embedding=rag.embedder.last_stats.as_dict()))
+
+            def ingest():
+                rag.reset()
+                rag.process_pdf(pdf_path)
+
+            seconds = measure(ingest, args.repeat, warmup=0)
+            report(stage_result("process_pdf", seconds, args.pages, unit="pages", chunks=len(rag.corpus)))
+
+            for mode in RETRIEVAL_MODES:
+                calls = iter(questions * 2)
+                seconds = measure(lambda: rag.find_relevant_chunks(next(calls), mode=mode), len(questions))
+                report(stage_result(f"find_relevant_chunks.{mode}", seconds, unit="questions"))
+
+            calls = iter(questions * 2)
+            seconds = measure(lambda: rag.answer_question(next(calls)), len(questions))
+            report(stage_result("answer_question", seconds, unit="questions", retrieval_mode=rag.retrieval_mode))
+
+            async def answer_batches():
+                seconds = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    async for _ in rag.aanswer_batch(questions, concurrency=args.batch_concurrency):
+                        pass
+                    seconds.append(time.perf_counter() - started)
+                await rag.aclose()
+                return seconds
+
+            seconds = asyncio.run(answer_batches())
+            report(stage_result("aanswer_batch", seconds, len(questions), unit="questions",
+                                concurrency=args.batch_concurrency, retrieval_mode=rag.retrieval_mode))
+        except BaseException:
+            asyncio.run(rag.aclose())
+            raise
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=30)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs of each ingest stage")
+    parser.add_argument("--cpu-workers", type=int, default=2)
+    parser.add_argument("--batch-concurrency", type=int, default=8)
+    parser.add_argument("--base-url", help="use this OpenAI-compatible server instead of starting the fake one")
+    parser.add_argument("--output", help="also write the results, with environment details, to this JSON file")
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+    settings = settings_from_args(args)
+
+    if args.base_url:
+        os.environ["OPENAI_BASE_URL"] = args.base_url
+        results = run(args, settings)
+    else:
+        with running_fake_server(settings) as base_url:
+            os.environ["OPENAI_BASE_URL"] = base_url
+            results = run(args, settings)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"benchmark": "pipeline", "environment": environment(fake_openai=vars(settings)),
+                       "pages": args.pages, "questions": args.questions, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
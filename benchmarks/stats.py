@@ -0,0 +1,83 @@
+"""Latency summaries, memory and environment details shared by the benchmarks."""
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from typing import Callable, List, Optional
+
+import numpy as np
+
+
+def latency_summary(seconds: List[float]) -> dict:
+    """p50/p95/p99/mean/max in milliseconds of a list of durations in seconds."""
+    if not seconds:
+        return {"samples": 0, "p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None, "max_ms": None}
+    ms = np.asarray(seconds, dtype=np.float64) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "samples": len(seconds),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+
+def peak_rss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """Peak resident set size of this process, or of another one (Linux only)."""
+    if pid is None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment(**extra) -> dict:
+    """What a result was measured on, so result files can be compared across runs."""
+    return {"commit": git_commit(), "python": platform.python_version(), "machine": platform.machine(),
+            "cpus": os.cpu_count(), **extra}
+
+
+def measure(fn: Callable, repeat: int, warmup: int = 1) -> List[float]:
+    """Durations in seconds of repeat calls of fn, after warmup untimed calls."""
+    for _ in range(warmup):
+        fn()
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def stage_result(stage: str, seconds: List[float], items: Optional[int] = None, **fields) -> dict:
+    """One machine-readable line: latency percentiles, throughput and peak RSS of a stage.
+
+    items is the amount of work per call (pages, chunks, questions); throughput
+    is reported as items per second, or calls per second without it.
+    """
+    total = sum(seconds)
+    per_call = items if items is not None else 1
+    result = {"stage": stage, **latency_summary(seconds)}
+    result["throughput_per_s"] = round(per_call * len(seconds) / total, 2) if total > 0 else None
+    result["peak_rss_mb"] = peak_rss_mb()
+    result.update(fields)
+    return result
@@ -0,0 +1,83 @@
+"""Synthetic documents, PDFs and questions for benchmarks."""
+import random
+import re
+from typing import List
+
+LINES_PER_PAGE = 55
+_SENTENCE_RE = re.compile(r"[A-Z][^.!?]{40,400}[.!?]")
+
+
+def synthetic_document(sections: int = 60, seed: int = 0) -> str:
+    """Numbered sections of PDF-like text: paragraphs hard-wrapped at 80 characters.
+
+    Words are drawn from a Zipf-distributed vocabulary of pseudo-words.
+    """
+    rng = random.Random(seed)
+    vocabulary = ["".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(2, 9))) for _ in range(5000)]
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+    parts = []
+    for section in range(sections):
+        title = " ".join(word.title() for word in rng.choices(vocabulary, weights, k=2))
+        parts.append(f"{section + 1}. {title}\n\n")
+        for _ in range(rng.randint(1, 5)):
+            sentences = []
+            for _ in range(rng.randint(2, 8)):
+                words = rng.choices(vocabulary, weights, k=rng.randint(6, 25))
+                sentences.append(" ".join(words).capitalize() + ".")
+            paragraph = " ".join(sentences)
+            parts.append("\n".join(paragraph[i:i + 80] for i in range(0, len(paragraph), 80)) + "\n\n")
+    return "".join(parts)
+
+
+def synthetic_questions(text: str, n: int, seed: int = 0) -> List[str]:
+    """Questions built from a few consecutive words of random sentences of text."""
+    rng = random.Random(seed)
+    sentences = [m.group() for m in _SENTENCE_RE.finditer(text)]
+    questions = []
+    for _ in range(n):
+        words = rng.choice(sentences).split()
+        offset = rng.randint(0, max(0, len(words) - 6))
+        questions.append(f"What does the document say about {' '.join(words[offset:offset + 6])}?")
+    return questions
+
+
+def _pdf_string(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: List[List[str]]):
+    """Write a minimal PDF (Helvetica, one text object per page) without any PDF library."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        page_id = len(objects) + 1
+        kids.append(f"{page_id} 0 R")
+        stream = "BT /F1 10 Tf 40 760 Td 13 TL " + " ".join(f"({_pdf_string(line)}) '" for line in lines) + " ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> "
+                       f"/Contents {page_id + 1} 0 R >>".encode())
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode("latin-1"))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def synthetic_pdf(path: str, pages: int, seed: int = 0) -> str:
+    """Write a synthetic PDF of the given number of pages; returns its text as generated."""
+    sections = 4 * max(1, pages)
+    lines = synthetic_document(sections, seed).split("\n")
+    while len(lines) < pages * LINES_PER_PAGE:
+        sections += max(1, pages)
+        lines = synthetic_document(sections, seed).split("\n")
+    lines = lines[:pages * LINES_PER_PAGE]
+    write_pdf(path, [lines[i:i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE)])
+    return "\n".join(lines)
@@ -0,0 +1,124 @@
+"""Memory and recall of compact vector stores (int8, truncated dimensions) against exact float32 search.
+
+Each configuration is built, saved and reopened the way Corpus.save leaves
+it (full-precision rows read from the saved file), then searched with and
+without full-precision rescoring. Reports recall@k against the exact
+float32 top-k, latency, and memory per million chunks as JSON lines;
+--output also writes them to a file for benchmarks.compare.
+
+Synthetic rows put most of their variance in the leading dimensions
+(--decay), as Matryoshka-trained models such as text-embedding-3 do; with
+--decay 0 every dimension matters equally, the worst case for truncation.
+--embeddings benchmarks real vectors from an .npy file instead.
+
+    python -m benchmarks.vector_compression --rows 100000 --configs float32 float32:512 int8 int8:512 int8:256
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.ann_recall import synthetic_embeddings
+from benchmarks.stats import environment, latency_summary
+from vector_store import VectorStore
+
+MB = 1024 * 1024
+
+
+def parse_config(config: str):
+    """("int8", 256) for "int8:256", ("float32", None) for "float32"."""
+    precision, _, dims = config.partition(":")
+    return precision, int(dims) if dims else None
+
+
+def recall_at_k(ids: np.ndarray, exact_ids: np.ndarray) -> float:
+    return float(np.mean([len(set(a.tolist()) & set(e.tolist())) / len(e) for a, e in zip(ids, exact_ids)]))
+
+
+def timed_search(store: VectorStore, queries: np.ndarray, top_k: int, **kwargs):
+    ids = []
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        row_ids, _ = store.search(query, top_k, **kwargs)
+        latencies.append(time.perf_counter() - started)
+        ids.append(row_ids)
+    return np.array(ids), latencies
+
+
+def reopened(store: VectorStore, path: str) -> VectorStore:
+    """The store as it is after a save: full-precision rows memory-mapped from disk."""
+    with open(path, "wb") as f:
+        store.write(f)
+    return store.attached(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--decay", type=float, default=0.5,
+                        help="dimension i of synthetic rows is scaled by (1 + i) ** -decay")
+    parser.add_argument("--embeddings", help=".npy file of real embeddings to use instead of synthetic ones")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--configs", nargs="+", default=["float32", "int8", "int8:512", "int8:256"],
+                        help="precision[:search_dims]")
+    parser.add_argument("--rescore", type=int, nargs="+", default=[0, 4, 10],
+                        help="shortlist sizes per result to try; 0 ranks by the compact scores alone")
+    parser.add_argument("--ann", action="store_true", help="also build an IVF index on each store")
+    parser.add_argument("--output", help="also write the results, with environment details, to this JSON file")
+    args = parser.parse_args()
+
+    if args.embeddings:
+        vectors = np.load(args.embeddings).astype(np.float32)
+    else:
+        vectors = synthetic_embeddings(args.rows, args.dim, args.clusters)
+        vectors *= ((1 + np.arange(args.dim)) ** -args.decay).astype(np.float32)
+    rows, dim = vectors.shape
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(rows, args.queries, replace=False)]
+    queries = queries + 0.3 * queries.std() * rng.normal(size=queries.shape).astype(np.float32)
+
+    exact = VectorStore(dim)
+    exact.add(vectors)
+    exact_ids, _ = timed_search(exact, queries, args.top_k)
+    del exact
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for config in args.configs:
+            precision, search_dims = parse_config(config)
+            store = VectorStore(dim, precision=precision, search_dims=search_dims)
+            store.add(vectors)
+            if args.ann:
+                store.build_ann()
+            store = reopened(store, os.path.join(tmp, config.replace(":", "-") + ".f32"))
+            memory = store.memory()
+            for rescore in args.rescore if store.compact else [0]:
+                store.rescore = rescore
+                ids, latencies = timed_search(store, queries, args.top_k)
+                result = {
+                    "stage": f"search.{config}", "mode": f"rescore-{rescore}", "rows": rows, "dim": dim,
+                    "search_dims": store.scan_dim, "top_k": args.top_k, "ann": store.ann is not None,
+                    f"recall_at_{args.top_k}": round(recall_at_k(ids, exact_ids), 4),
+                    **latency_summary(latencies),
+                    "resident_mb_per_million": round((memory["resident_bytes"] + memory["ann_bytes"]) / rows * 1e6 / MB, 1),
+                    "mapped_mb_per_million": round(memory["mapped_bytes"] / rows * 1e6 / MB, 1),
+                }
+                results.append(result)
+                print(json.dumps(result), flush=True)
+            del store
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"benchmark": "vector_compression", "environment": environment(), "rows": rows, "dim": dim,
+                       "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
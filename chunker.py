@@ -0,0 +1,315 @@
+"""Token-budgeted chunking that prefers heading, paragraph and sentence boundaries.
+
+Token counts come from tiktoken (cl100k_base, the encoding of the OpenAI
+embedding models) when it is installed, else from a fast regex estimate,
+which can put chunks over their token budget; a warning says so once.
+"""
+import logging
+import re
+from collections import deque
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from index_store import Chunk
+from pdf_extract import PageText
+
+try:
+    import tiktoken
+except ImportError:  # in requirements.txt, but optional: falls back to estimate_tokens
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+_estimate_warned = False
+
+DEFAULT_MAX_TOKENS = 256
+DEFAULT_OVERLAP_TOKENS = 0
+# A chunk is not cut at a weaker boundary than necessary once it is this full
+MIN_FILL = 0.5
+HEADING_MAX_CHARS = 60
+
+# Boundary strengths, weakest first: a cut goes at the strongest boundary available
+WORD, LINE, SENTENCE, PARAGRAPH, HEADING = range(5)
+
+# Whitespace between two units: after sentence-ending punctuation (and closing
+# quotes), or containing a line break. The lookahead makes a match final as
+# soon as it is found, which keeps streaming and whole-text chunking identical.
+_GAP_RE = re.compile(r"(?P<sentence>(?:(?<=[.!?])|(?<=[.!?][\"')\]”’]))\s+)(?=\S)|[ \t\r\f\v]*\n\s*(?=\S)")
+# "3.", "2.1.", "IV." or an initial: its period does not end a sentence
+_LABEL_RE = re.compile(r"(?:\d+(?:\.\d+)*|[IVXLC]+|[A-Za-z])\.")
+_NUMBERED_RE = re.compile(r"^(?:\d+(?:\.\d+)*\.?|[IVXLC]+\.|chapter\b|section\b|appendix\b)", re.IGNORECASE)
+_ESTIMATE_RE = re.compile(r"\w{1,6}|[^\w\s]")
+_WORD_RE = re.compile(r"\S+\s*")
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly one token per short word, per six characters of a long one, and per symbol."""
+    return len(_ESTIMATE_RE.findall(text))
+
+
+class TokenCounter:
+    """Counts tokens for many texts at once, with tiktoken when it is available."""
+
+    def __init__(self, encoding_name: Optional[str] = "cl100k_base"):
+        global _estimate_warned
+        self.encoding = None
+        if tiktoken is not None and encoding_name:
+            try:
+                self.encoding = tiktoken.get_encoding(encoding_name)
+            except Exception:
+                logger.warning("tiktoken encoding %s unavailable; estimating token counts", encoding_name, exc_info=True)
+        elif encoding_name and not _estimate_warned:
+            _estimate_warned = True
+            logger.warning("tiktoken is not installed; token counts are estimated and chunks may exceed their "
+                           "token budget (pip install tiktoken)")
+
+    @property
+    def name(self) -> str:
+        return self.encoding.name if self.encoding is not None else "estimate"
+
+    def count(self, text: str) -> int:
+        return self.count_many([text])[0]
+
+    def count_many(self, texts: List[str]) -> List[int]:
+        if self.encoding is not None:
+            return [len(tokens) for tokens in self.encoding.encode_ordinary_batch(texts)]
+        return [estimate_tokens(text) for text in texts]
+
+
+_default_counter: Optional[TokenCounter] = None
+
+
+def default_counter() -> TokenCounter:
+    global _default_counter
+    if _default_counter is None:
+        _default_counter = TokenCounter()
+    return _default_counter
+
+
+@dataclass
+class _Unit:
+    start: int
+    end: int  # end of the unit's text, before the whitespace that follows it
+    tokens: int
+    strength: int  # of the boundary before the unit
+
+
+class _Packer:
+    """Greedily packs units into spans of at most max_tokens, cutting at the strongest boundary."""
+
+    def __init__(self, max_tokens: int, overlap_tokens: int):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.units: List[_Unit] = []
+        self.tokens = 0
+        self.carried = 0  # leading units repeated from the previous span as overlap
+
+    def add(self, unit: _Unit) -> List[Tuple[int, int, int]]:
+        spans = []
+        self.units.append(unit)
+        self.tokens += unit.tokens
+        while self.tokens > self.max_tokens and len(self.units) > 1:
+            if len(self.units) - 1 <= self.carried:
+                # The overlap leaves no room for the new unit: drop the overlap
+                self.units = self.units[self.carried:]
+                self.tokens = sum(u.tokens for u in self.units)
+                self.carried = 0
+                continue
+            spans.append(self._cut(self._best_cut()))
+        return spans
+
+    def _best_cut(self) -> int:
+        min_tokens = MIN_FILL * self.max_tokens
+        best = None
+        prefix = sum(u.tokens for u in self.units[:self.carried])
+        for cut in range(self.carried + 1, len(self.units)):
+            prefix += self.units[cut - 1].tokens
+            if prefix > self.max_tokens:
+                break
+            if prefix >= min_tokens and (best is None or self.units[cut].strength >= self.units[best].strength):
+                best = cut
+        if best is None:
+            # Nothing fills the chunk enough: take as much as fits
+            best = self.carried + 1
+            prefix = sum(u.tokens for u in self.units[:best])
+            while best + 1 < len(self.units) and prefix + self.units[best].tokens <= self.max_tokens:
+                prefix += self.units[best].tokens
+                best += 1
+        return best
+
+    def _cut(self, cut: int) -> Tuple[int, int, int]:
+        span = (self.units[0].start, self.units[cut - 1].end, sum(u.tokens for u in self.units[:cut]))
+        keep = cut
+        overlap = 0
+        while keep > self.carried and overlap + self.units[keep - 1].tokens <= self.overlap_tokens:
+            keep -= 1
+            overlap += self.units[keep].tokens
+        self.carried = cut - keep
+        self.units = self.units[keep:]
+        self.tokens = sum(u.tokens for u in self.units)
+        return span
+
+    def finish(self) -> List[Tuple[int, int, int]]:
+        spans = []
+        if len(self.units) > self.carried:
+            spans.append(self._cut(len(self.units)))
+        self.units = []
+        self.tokens = 0
+        self.carried = 0
+        return spans
+
+
+class TokenChunker:
+    """Streaming, token-budgeted chunker over a sequence of pages.
+
+    Text is split into units at sentence ends and line breaks; units are
+    packed into chunks of at most max_tokens, each cut placed at the
+    strongest boundary (heading, paragraph, sentence, line) that keeps the
+    chunk at least half full. Up to overlap_tokens of whole trailing units
+    are repeated at the start of the next chunk. Units longer than the
+    budget are split between words.
+
+    The output depends only on the text and the settings, not on how it is
+    split into pages, so chunk hashes are stable across re-ingests.
+    """
+
+    def __init__(self, name: str = "", max_tokens: int = DEFAULT_MAX_TOKENS, overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+                 counter: Optional[TokenCounter] = None):
+        if not 0 <= overlap_tokens < max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.name = name
+        self.max_tokens = max_tokens
+        self.counter = counter or default_counter()
+        self._packer = _Packer(max_tokens, overlap_tokens)
+        self._buffer = ""
+        self._buffer_start = 0  # document offset of _buffer[0]
+        self._tail = None  # document offset of the first unit not yet closed by a gap
+        self._prev_gap = ("\n\n", True)  # (whitespace, follows a sentence end) before the next unit
+        self._prev_heading = False
+        self._pages = deque()
+
+    def _page_at(self, offset: int) -> int:
+        while len(self._pages) > 1 and self._pages[1][0] <= offset:
+            self._pages.popleft()
+        return self._pages[0][1] if self._pages else 1
+
+    def _text(self, start: int, end: int) -> str:
+        return self._buffer[start - self._buffer_start:end - self._buffer_start]
+
+    @staticmethod
+    def _is_heading(text: str, gap_before: Tuple[str, bool], gap_after: Tuple[str, bool]) -> bool:
+        """A short line of its own, not ending like a sentence, after a paragraph or sentence end or numbered."""
+        (before, after_sentence), (after, _) = gap_before, gap_after
+        if "\n" not in before or "\n" not in after or len(text) > HEADING_MAX_CHARS:
+            return False
+        if text[-1] in ".,;!?" or not (text[0].isupper() or text[0].isdigit()):
+            return False
+        return before.count("\n") >= 2 or after_sentence or text.isupper() or _NUMBERED_RE.match(text) is not None
+
+    @staticmethod
+    def _strength(gap: Tuple[str, bool]) -> int:
+        whitespace, after_sentence = gap
+        if whitespace.count("\n") >= 2:
+            return PARAGRAPH
+        if after_sentence:
+            return SENTENCE
+        return LINE if "\n" in whitespace else WORD
+
+    def _split_oversized(self, unit: _Unit) -> List[_Unit]:
+        """Split a unit over the token budget between words (or, for a huge word, every max_tokens characters)."""
+        if unit.tokens <= self.max_tokens:
+            return [unit]
+        words = []
+        for match in _WORD_RE.finditer(self._text(unit.start, unit.end)):
+            word_start = unit.start + match.start()
+            word_end = word_start + len(match.group().rstrip())
+            words.extend((piece, min(piece + self.max_tokens, word_end))
+                         for piece in range(word_start, word_end, self.max_tokens))
+        counts = self.counter.count_many([self._text(start, end) for start, end in words])
+        pieces = []
+        for (start, end), count in zip(words, counts):
+            if pieces and pieces[-1].tokens + count <= self.max_tokens:
+                pieces[-1].end = end
+                pieces[-1].tokens += count
+            else:
+                pieces.append(_Unit(start, end, count, WORD))
+        pieces[0].strength = unit.strength
+        return pieces
+
+    def _close_units(self, final: bool) -> List[_Unit]:
+        """Turn every unit in the buffer that is followed by a gap (all of them if final) into packer units."""
+        if self._tail is None:
+            match = re.search(r"\S", self._buffer)
+            if match is None:
+                return []
+            self._tail = self._buffer_start + match.start()
+        bounds = []  # (start, end, gap after)
+        start = self._tail
+        for gap in _GAP_RE.finditer(self._buffer, self._tail - self._buffer_start):
+            if gap.group("sentence") is not None and "\n" not in gap.group() and \
+                    _LABEL_RE.fullmatch(self._buffer, start - self._buffer_start, gap.start()):
+                continue
+            bounds.append((start, self._buffer_start + gap.start(), (gap.group(), gap.group("sentence") is not None)))
+            start = self._buffer_start + gap.end()
+        self._tail = start
+        buffer_end = self._buffer_start + len(self._buffer)
+        if final and start < buffer_end:
+            bounds.append((start, self._buffer_start + len(self._buffer.rstrip()), ("\n\n", True)))
+            self._tail = buffer_end
+        if not bounds:
+            return []
+
+        texts = [self._text(unit_start, unit_end) for unit_start, unit_end, _ in bounds]
+        counts = self.counter.count_many(texts)
+        units = []
+        for (unit_start, unit_end, gap_after), text, count in zip(bounds, texts, counts):
+            heading = self._is_heading(text, self._prev_gap, gap_after)
+            strength = HEADING if heading else self._strength(self._prev_gap)
+            if self._prev_heading:
+                strength = WORD  # keep a heading with the text it introduces
+            units.extend(self._split_oversized(_Unit(unit_start, unit_end, count, strength)))
+            self._prev_gap = gap_after
+            self._prev_heading = heading
+        return units
+
+    def feed_text(self, text: str) -> List[Tuple[int, int, int]]:
+        """Add text; returns (start, end, tokens) document offsets of the chunks completed by it."""
+        self._buffer += text
+        spans = []
+        for unit in self._close_units(final=False):
+            spans.extend(self._packer.add(unit))
+        return spans
+
+    def finish_text(self) -> List[Tuple[int, int, int]]:
+        spans = []
+        for unit in self._close_units(final=True):
+            spans.extend(self._packer.add(unit))
+        spans.extend(self._packer.finish())
+        return spans
+
+    def _chunks(self, spans: List[Tuple[int, int, int]]) -> List[Chunk]:
+        chunks = [
+            Chunk(self._text(start, end), start, end, {"source": self.name, "page": self._page_at(start), "tokens": tokens})
+            for start, end, tokens in spans
+        ]
+        # Drop text no longer needed, keeping one character for the sentence-end lookbehind
+        keep_from = min(self._packer.units[0].start, self._tail) if self._packer.units else self._tail
+        drop = (keep_from or 0) - 1 - self._buffer_start
+        if drop > 0:
+            self._buffer = self._buffer[drop:]
+            self._buffer_start += drop
+        return chunks
+
+    def feed(self, page: PageText) -> List[Chunk]:
+        self._pages.append((self._buffer_start + len(self._buffer), page.page_number))
+        return self._chunks(self.feed_text(page.text))
+
+    def finish(self) -> List[Chunk]:
+        return self._chunks(self.finish_text())
+
+
+def token_chunk_spans(text: str, max_tokens: int = DEFAULT_MAX_TOKENS, overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+                      counter: Optional[TokenCounter] = None) -> List[Tuple[int, int]]:
+    """(start, end) character offsets of the token-budgeted chunks of text."""
+    chunker = TokenChunker(max_tokens=max_tokens, overlap_tokens=overlap_tokens, counter=counter)
+    spans = chunker.feed_text(text) + chunker.finish_text()
+    return [(start, end) for start, end, _ in spans]
@@ -0,0 +1,157 @@
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from chunker import TokenCounter, default_counter
+from embedding_cache import normalize_text
+from index_store import Chunk
+from lexical_index import tokenize
+
+DEFAULT_CONTEXT_TOKENS = 1024
+# Relevance vs. diversity trade-off of maximal marginal relevance (1.0 = relevance only)
+DEFAULT_MMR_LAMBDA = 0.7
+# Chunks of one document at most this many characters apart are merged into one passage
+MERGE_GAP_CHARS = 32
+PASSAGE_SEPARATOR = "\n\n"
+
+
+@dataclass
+class Passage:
+    """One or more retrieved chunks of a document merged by offset."""
+    doc_id: Optional[str]
+    start: int
+    end: int
+    text: str
+    score: float
+    chunks: int = 1
+    page: Optional[int] = None
+    tokens: int = 0
+    best_chunk: Optional[Chunk] = field(default=None, repr=False)
+
+
+@dataclass
+class Context:
+    text: str
+    passages: List[Passage] = field(default_factory=list)
+    tokens: int = 0
+    candidates: int = 0  # retrieved chunks considered
+
+    def usage(self) -> dict:
+        return {"context_tokens": self.tokens, "passages": len(self.passages), "chunks_retrieved": self.candidates}
+
+
+def merge_hits(hits: List[Tuple[Chunk, float]]) -> List[Passage]:
+    """Merge overlapping or adjacent chunks of the same document; each passage keeps its best score."""
+    by_doc = {}
+    for chunk, score in hits:
+        by_doc.setdefault(chunk.metadata.get("doc_id"), []).append((chunk, score))
+    passages = []
+    for doc_id, doc_hits in by_doc.items():
+        doc_hits.sort(key=lambda hit: (hit[0].start, hit[0].end))
+        current = None
+        for chunk, score in doc_hits:
+            if current is not None and doc_id is not None and chunk.start <= current.end + MERGE_GAP_CHARS:
+                if chunk.end > current.end:
+                    overlap = current.end - chunk.start
+                    tail = chunk.text[overlap:] if overlap >= 0 else " " + chunk.text
+                    current.text += tail
+                    current.end = chunk.end
+                if score > current.score:
+                    current.score = score
+                    current.best_chunk = chunk
+                current.chunks += 1
+                continue
+            current = Passage(doc_id, chunk.start, chunk.end, chunk.text, score, page=chunk.metadata.get("page"),
+                              best_chunk=chunk)
+            passages.append(current)
+    return passages
+
+
+def dedupe(passages: List[Passage]) -> List[Passage]:
+    """Drop passages whose text is contained in another one (e.g. the same PDF uploaded twice).
+
+    The passage kept takes the better score of the two.
+    """
+    kept = []
+    for passage in sorted(passages, key=lambda p: (-len(p.text), -p.score)):
+        normalized = normalize_text(passage.text)
+        container = next((k for k, text in kept if normalized in text), None)
+        if container is None:
+            kept.append((passage, normalized))
+        else:
+            container.score = max(container.score, passage.score)
+    return sorted((passage for passage, _ in kept), key=lambda p: -p.score)
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class ContextBuilder:
+    """Fills a token budget with retrieved material for the prompt.
+
+    Retrieved chunks are merged by offset (so overlapping windows are paid
+    for once), passages repeated inside others are dropped, and the rest are
+    picked by maximal marginal relevance: relevance to the question,
+    penalized by term overlap with passages already picked. Passages that no
+    longer fit the remaining budget are skipped.
+    """
+
+    def __init__(self, max_tokens: int = DEFAULT_CONTEXT_TOKENS, mmr_lambda: float = DEFAULT_MMR_LAMBDA,
+                 counter: Optional[TokenCounter] = None):
+        self.max_tokens = max_tokens
+        self.mmr_lambda = mmr_lambda
+        self.counter = counter or default_counter()
+
+    def _fit(self, passages: List[Passage]) -> List[Passage]:
+        """Count tokens; a merged passage larger than the whole budget is replaced by its best chunk."""
+        for passage, tokens in zip(passages, self.counter.count_many([p.text for p in passages])):
+            passage.tokens = tokens
+        fitted = []
+        for passage in passages:
+            if passage.tokens > self.max_tokens and passage.chunks > 1:
+                chunk = passage.best_chunk
+                passage = Passage(passage.doc_id, chunk.start, chunk.end, chunk.text, passage.score,
+                                  page=chunk.metadata.get("page"), tokens=self.counter.count(chunk.text))
+            fitted.append(passage)
+        return fitted
+
+    def build(self, hits: List[Tuple[Chunk, float]]) -> Context:
+        passages = self._fit(dedupe(merge_hits(hits)))
+        if not passages:
+            return Context("", candidates=len(hits))
+
+        scores = [p.score for p in passages]
+        low, high = min(scores), max(scores)
+        relevance = [(s - low) / (high - low) if high > low else 1.0 for s in scores]
+        terms = [set(tokenize(p.text)) for p in passages]
+        separator_tokens = self.counter.count(PASSAGE_SEPARATOR)
+
+        selected = []
+        used = 0
+        remaining = set(range(len(passages)))
+        while remaining:
+            best, best_value = None, None
+            for i in remaining:
+                cost = passages[i].tokens + (separator_tokens if selected else 0)
+                if used + cost > self.max_tokens:
+                    continue
+                redundancy = max((_jaccard(terms[i], terms[j]) for j in selected), default=0.0)
+                value = self.mmr_lambda * relevance[i] - (1 - self.mmr_lambda) * redundancy
+                if best is None or value > best_value or (value == best_value and i < best):
+                    best, best_value = i, value
+            if best is None:
+                break
+            used += passages[best].tokens + (separator_tokens if selected else 0)
+            selected.append(best)
+            remaining.discard(best)
+
+        chosen = [passages[i] for i in selected]
+        return Context(PASSAGE_SEPARATOR.join(p.text for p in chosen), chosen, used, len(hits))
+
+
+def count_prompt_tokens(messages: List[dict], counter: Optional[TokenCounter] = None) -> int:
+    """Estimated prompt tokens of chat messages (content plus a few tokens of framing per message)."""
+    counter = counter or default_counter()
+    return sum(counter.count_many([m["content"] for m in messages])) + 4 * len(messages) + 3
@@ -0,0 +1,486 @@
+import os
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field, replace
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from index_store import (EMBEDDINGS_FILE, ChainedChunks, Chunk, current_index, load_index, load_lexical, load_row_docs,
+                         load_version, save_index, segment_path, write_segment)
+from lexical_index import TOKENIZER_VERSION, BM25Index, reciprocal_rank_fusion, tokenize
+from vector_store import ANN_MIN_ROWS, RESCORE_CANDIDATES, VectorStore
+
+DEFAULT_COLLECTION = "default"
+
+# Deleted rows are compacted away once they make up this share of the index.
+COMPACT_RATIO = 0.5
+COMPACT_MIN_ROWS = 1024
+# Retrain ANN centroids once the index has grown this much since training.
+ANN_RETRAIN_GROWTH = 4
+# Each retriever contributes this many candidates per requested result to hybrid fusion.
+HYBRID_CANDIDATES_PER_RESULT = 4
+HYBRID_MIN_CANDIDATES = 20
+# Saves write the rows appended since the last save as a segment of their own. Once the segments after the first
+# hold this share of the rows, a save rewrites the index as one segment instead (dropping deleted rows), and past
+# MAX_SEGMENTS segments it merges the ones after the first.
+MERGE_RATIO = 0.1
+MAX_SEGMENTS = 16
+
+
+@dataclass
+class Document:
+    doc_id: str
+    collection: str
+    name: str
+    num_chunks: int
+    created_at: float
+
+
+@dataclass(frozen=True)
+class IndexSnapshot:
+    """One published version of the corpus; never modified once published.
+
+    Readers take the current snapshot with a single attribute read and use
+    only it, so they need no lock and cannot see a half-applied change.
+    Writers derive the next snapshot and swap it in. The row buffers (vectors,
+    chunks, BM25 vocabulary) are append-only and shared between versions: a
+    snapshot only reads rows below its own row count, so appends made for
+    later versions never change what it sees.
+    """
+    version: int = 0
+    store: VectorStore = field(default_factory=VectorStore)
+    lexical: BM25Index = field(default_factory=BM25Index)
+    chunks: Sequence[Chunk] = field(default_factory=list)  # rows of deleted documents are kept until compaction
+    row_doc: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int32))  # document code per row; -1 = deleted
+    documents: Dict[str, Document] = field(default_factory=dict)
+    doc_codes: Dict[str, int] = field(default_factory=dict)
+    next_code: int = 0
+    dead_rows: int = 0
+    # Collections remember the version of their last change
+    collection_versions: Dict[str, int] = field(default_factory=dict)
+    cleared_at: int = 0
+    # Changes whenever rows are renumbered (compaction, clear, load); saved segments number rows as one numbering
+    renumbered: int = 0
+
+    @property
+    def rows(self) -> int:
+        return self.row_doc.shape[0]
+
+    def filter_mask(self, collections: Optional[Iterable[str]], document_ids: Optional[Iterable[str]]) -> np.ndarray:
+        if collections is None and document_ids is None:
+            if not self.dead_rows:
+                return None
+            return self.row_doc >= 0
+        collections = set(collections) if collections is not None else None
+        document_ids = set(document_ids) if document_ids is not None else None
+        codes = [
+            self.doc_codes[doc.doc_id]
+            for doc in self.documents.values()
+            if (collections is None or doc.collection in collections)
+            and (document_ids is None or doc.doc_id in document_ids)
+        ]
+        return np.isin(self.row_doc, np.asarray(codes, dtype=np.int32))
+
+    def hits(self, ids, scores) -> List[Tuple[Chunk, float]]:
+        return [(self.chunks[i], float(score)) for i, score in zip(ids, scores)]
+
+
+@dataclass(frozen=True)
+class SavedIndex:
+    """The segments of the index version last saved or loaded, and the row numbering of the snapshot they hold."""
+    root: str
+    renumbered: int
+    segments: List[dict]
+
+    @property
+    def rows(self) -> int:
+        return sum(entry["rows"] for entry in self.segments)
+
+
+class Corpus:
+    """Many documents in named collections, searched through one shared VectorStore.
+
+    Every row of the store belongs to one document, and is also indexed in a
+    BM25 index for lexical and hybrid search. Deleting a document
+    tombstones its rows; they are compacted away in bulk once enough of the
+    index is dead, so neither adds nor deletes re-embed or rebuild anything.
+
+    State lives in an immutable IndexSnapshot. Searches read the current one
+    without locking; changes are serialized by a writer lock, build the next
+    snapshot off to the side (including any ANN training or compaction) and
+    publish it with one reference swap, so queries run at full speed during
+    ingest, deletes and resets.
+    """
+
+    def __init__(self, ann_min_rows: int = ANN_MIN_ROWS, nprobe: Optional[int] = None, precision: str = "float32",
+                 search_dims: Optional[int] = None, rescore: int = RESCORE_CANDIDATES):
+        self.ann_min_rows = ann_min_rows
+        self.nprobe = nprobe
+        # Vector storage; see VectorStore for compact (int8, truncated) stores
+        self.precision = precision
+        self.search_dims = search_dims
+        self.rescore = rescore
+        self._snapshot = IndexSnapshot(store=self._new_store())
+        self._write_lock = threading.Lock()
+        # Directory of the saved index version last written by save or read by load
+        self.index_path: Optional[str] = None
+        self._saved: Optional[SavedIndex] = None
+
+    @property
+    def snapshot(self) -> IndexSnapshot:
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        """Monotonic change counter."""
+        return self._snapshot.version
+
+    @property
+    def chunks(self) -> List[Chunk]:
+        snapshot = self._snapshot
+        return [snapshot.chunks[row] for row in np.flatnonzero(snapshot.row_doc >= 0)]
+
+    @property
+    def documents(self) -> Dict[str, Document]:
+        return self._snapshot.documents
+
+    def __len__(self) -> int:
+        snapshot = self._snapshot
+        return snapshot.rows - snapshot.dead_rows
+
+    def collections(self) -> List[str]:
+        return sorted({doc.collection for doc in self._snapshot.documents.values()})
+
+    def get_document(self, doc_id: str) -> Optional[Document]:
+        return self._snapshot.documents.get(doc_id)
+
+    def list_documents(self, collection: Optional[str] = None) -> List[Document]:
+        return [doc for doc in self._snapshot.documents.values() if collection is None or doc.collection == collection]
+
+    def _new_store(self) -> VectorStore:
+        return VectorStore(precision=self.precision, search_dims=self.search_dims, rescore=self.rescore)
+
+    def _publish(self, snapshot: IndexSnapshot, *touched: str):
+        """Swap in the next snapshot (caller holds the writer lock), bumping the version."""
+        version = self._snapshot.version + 1
+        versions = dict(snapshot.collection_versions)
+        versions.update((collection, version) for collection in touched)
+        self._snapshot = replace(snapshot, version=version, collection_versions=versions)
+
+    def create_document(self, name: str, collection: str = DEFAULT_COLLECTION, doc_id: Optional[str] = None) -> Document:
+        """Register an empty document; its chunks are added with append_chunks."""
+        doc = Document(doc_id or uuid.uuid4().hex, collection, name, 0, time.time())
+        with self._write_lock:
+            current = self._snapshot
+            if doc.doc_id in current.documents:
+                raise ValueError(f"Document {doc.doc_id} already exists")
+            # Not a content change: the version stays, so cached answers remain valid
+            self._snapshot = replace(
+                current,
+                documents={**current.documents, doc.doc_id: doc},
+                doc_codes={**current.doc_codes, doc.doc_id: current.next_code},
+                next_code=current.next_code + 1,
+            )
+        return doc
+
+    def append_chunks(self, doc_id: str, chunks: List[Chunk], vectors: np.ndarray):
+        """Add chunks to an existing document; they are searchable as soon as this returns."""
+        if len(chunks) != len(vectors):
+            raise ValueError(f"{len(chunks)} chunks but {len(vectors)} embeddings")
+        if not chunks:
+            return
+        token_lists = [tokenize(chunk.text) for chunk in chunks]
+        with self._write_lock:
+            current = self._snapshot
+            doc = current.documents.get(doc_id)
+            if doc is None:
+                raise KeyError(doc_id)
+            for chunk in chunks:
+                chunk.metadata.update(doc_id=doc.doc_id, collection=doc.collection)
+            # Rows past current.rows are invisible to current, so the shared buffers can grow in place
+            store = self._with_ann(current.store.appended(vectors))
+            all_chunks = current.chunks
+            if not isinstance(all_chunks, list):
+                # Chunks of a loaded index are read from disk on access; appending needs them in memory
+                all_chunks = list(all_chunks)
+            elif len(all_chunks) != current.rows:
+                # Another snapshot derived from current has appended its own chunks to the shared list
+                all_chunks = all_chunks[:current.rows]
+            all_chunks.extend(chunks)
+            code = current.doc_codes[doc_id]
+            self._publish(replace(
+                current,
+                store=store,
+                lexical=current.lexical.appended(token_lists),
+                chunks=all_chunks,
+                row_doc=np.concatenate([current.row_doc, np.full(len(chunks), code, dtype=np.int32)]),
+                documents={**current.documents, doc_id: replace(doc, num_chunks=doc.num_chunks + len(chunks))},
+            ), doc.collection)
+
+    def add_document(self, name: str, chunks: List[Chunk], vectors: np.ndarray,
+                     collection: str = DEFAULT_COLLECTION, doc_id: Optional[str] = None) -> Document:
+        if len(chunks) != len(vectors):
+            raise ValueError(f"{len(chunks)} chunks but {len(vectors)} embeddings")
+        doc = self.create_document(name, collection, doc_id)
+        self.append_chunks(doc.doc_id, chunks, vectors)
+        return self.get_document(doc.doc_id)
+
+    def _with_ann(self, store: VectorStore) -> VectorStore:
+        """Train (or retrain) the IVF index of a store that is not published yet, if it has grown enough."""
+        size = len(store)
+        ann = store.ann
+        if size >= self.ann_min_rows and (ann is None or size >= ANN_RETRAIN_GROWTH * max(ann.trained_rows, 1)):
+            store.build_ann(nprobe=self.nprobe)
+        return store
+
+    def delete_document(self, doc_id: str) -> bool:
+        with self._write_lock:
+            current = self._snapshot
+            doc = current.documents.get(doc_id)
+            if doc is None:
+                return False
+            row_doc = current.row_doc.copy()
+            rows = row_doc == current.doc_codes[doc_id]
+            dead_rows = current.dead_rows + int(np.count_nonzero(rows))
+            row_doc[rows] = -1
+            documents = dict(current.documents)
+            del documents[doc_id]
+            doc_codes = dict(current.doc_codes)
+            del doc_codes[doc_id]
+            snapshot = replace(current, row_doc=row_doc, documents=documents, doc_codes=doc_codes, dead_rows=dead_rows)
+            if dead_rows >= COMPACT_MIN_ROWS and dead_rows > COMPACT_RATIO * snapshot.rows:
+                snapshot = self._compacted(snapshot)
+            self._publish(snapshot, doc.collection)
+        return True
+
+    def delete_collection(self, collection: str) -> int:
+        doc_ids = [doc.doc_id for doc in self.list_documents(collection)]
+        for doc_id in doc_ids:
+            self.delete_document(doc_id)
+        return len(doc_ids)
+
+    def cache_scope(self, collections: Optional[Iterable[str]] = None, document_ids: Optional[Iterable[str]] = None) -> tuple:
+        """Hashable key for a search filter that changes whenever the documents it covers change."""
+        snapshot = self._snapshot
+        collections = tuple(sorted(set(collections))) if collections is not None else None
+        document_ids = tuple(sorted(set(document_ids))) if document_ids is not None else None
+        if collections is None and document_ids is None:
+            return (None, None, snapshot.version)
+        touched = set(collections or ())
+        touched.update(snapshot.documents[d].collection for d in document_ids or () if d in snapshot.documents)
+        versions = tuple(snapshot.collection_versions.get(c, snapshot.cleared_at) for c in sorted(touched))
+        return (collections, document_ids, versions)
+
+    @staticmethod
+    def _compacted(snapshot: IndexSnapshot) -> IndexSnapshot:
+        """The same documents with deleted rows dropped; new buffers, so readers of older snapshots are unaffected."""
+        keep = snapshot.row_doc >= 0
+        return replace(
+            snapshot,
+            store=snapshot.store.take(keep),
+            lexical=snapshot.lexical.take(keep),
+            chunks=[snapshot.chunks[row] for row in np.flatnonzero(keep)],
+            row_doc=snapshot.row_doc[keep],
+            dead_rows=0,
+            renumbered=snapshot.renumbered + 1,
+        )
+
+    def search(self, query_vectors, top_k: int = 3, collections: Optional[Iterable[str]] = None,
+               document_ids: Optional[Iterable[str]] = None, nprobe: Optional[int] = None,
+               exact: bool = False) -> List[List[Tuple[Chunk, float]]]:
+        """Return, per query vector, the best (chunk, score) pairs among matching documents."""
+        snapshot = self._snapshot
+        mask = snapshot.filter_mask(collections, document_ids)
+        ids, scores = snapshot.store.search_batch(query_vectors, top_k, mask, nprobe, exact)
+        return [snapshot.hits(row_ids, row_scores) for row_ids, row_scores in zip(ids, scores)]
+
+    def lexical_search(self, queries: List[str], top_k: int = 3, collections: Optional[Iterable[str]] = None,
+                       document_ids: Optional[Iterable[str]] = None) -> List[List[Tuple[Chunk, float]]]:
+        """BM25 search; needs no query embedding. Scores are BM25 scores."""
+        token_lists = [tokenize(query) for query in queries]
+        snapshot = self._snapshot
+        mask = snapshot.filter_mask(collections, document_ids)
+        return [snapshot.hits(ids, scores) for ids, scores in snapshot.lexical.search_batch(token_lists, top_k, mask)]
+
+    def hybrid_search(self, queries: List[str], query_vectors, top_k: int = 3, collections: Optional[Iterable[str]] = None,
+                      document_ids: Optional[Iterable[str]] = None, nprobe: Optional[int] = None,
+                      exact: bool = False) -> List[List[Tuple[Chunk, float]]]:
+        """Dense and BM25 candidates fused by reciprocal rank; scores are fused RRF scores."""
+        candidates = max(top_k * HYBRID_CANDIDATES_PER_RESULT, HYBRID_MIN_CANDIDATES)
+        token_lists = [tokenize(query) for query in queries]
+        snapshot = self._snapshot
+        mask = snapshot.filter_mask(collections, document_ids)
+        dense_ids, _ = snapshot.store.search_batch(query_vectors, candidates, mask, nprobe, exact)
+        lexical = snapshot.lexical.search_batch(token_lists, candidates, mask)
+        results = []
+        for dense_row, (lexical_row, _) in zip(dense_ids, lexical):
+            results.append(snapshot.hits(*reciprocal_rank_fusion([dense_row, lexical_row], top_k)))
+        return results
+
+    def clear(self):
+        with self._write_lock:
+            version = self._snapshot.version + 1
+            self._snapshot = IndexSnapshot(version=version, store=self._new_store(), next_code=self._snapshot.next_code,
+                                           cleared_at=version, renumbered=self._snapshot.renumbered + 1)
+
+    def save(self, directory: str, model: str):
+        """Save the corpus as the new current version of the index under directory.
+
+        Rows appended since the last save are written as a new segment, and
+        deletes only change the version's document list, so a save costs in
+        proportion to what changed. After a compaction or reset, or once the
+        later segments hold MERGE_RATIO of the rows, the whole index is
+        rewritten as one segment.
+        """
+        # The writer lock keeps ingest from growing the shared buffers while they are written out
+        with self._write_lock:
+            snapshot = self._snapshot
+            saved = self._saved
+            if saved is not None and (saved.root != directory or saved.renumbered != snapshot.renumbered
+                                      or snapshot.rows - saved.segments[0]["rows"] > MERGE_RATIO * snapshot.rows):
+                saved = None
+            if saved is None:
+                if snapshot.dead_rows:
+                    snapshot = self._compacted(snapshot)
+                    self._snapshot = snapshot
+                segments = [self._write_segment(directory, snapshot, model, 0)]
+            else:
+                segments = list(saved.segments)
+                start = saved.rows
+                if len(segments) >= MAX_SEGMENTS:
+                    segments = segments[:1]
+                    start = segments[0]["rows"]
+                if snapshot.rows > start:
+                    segments.append(self._write_segment(directory, snapshot, model, start))
+            store = snapshot.store
+            path = save_index(directory, segments, model, {
+                "documents": [asdict(doc) for doc in snapshot.documents.values()],
+                "precision": store.precision, "search_dims": store.search_dims, "int8_range": store.int8_range,
+            })
+            self._saved = SavedIndex(directory, snapshot.renumbered, segments)
+            self.index_path = path
+            if saved is None and store.compact:
+                # Rescoring now reads full-precision rows from the saved file instead of process memory
+                embeddings = os.path.join(segment_path(directory, segments[0]["name"]), EMBEDDINGS_FILE)
+                self._snapshot = replace(snapshot, store=store.attached(embeddings))
+
+    @staticmethod
+    def _write_segment(directory: str, snapshot: IndexSnapshot, model: str, start: int) -> dict:
+        """Write the rows of snapshot from start on as a new segment; the first segment also gets the BM25 index."""
+        codes = snapshot.row_doc[start:]
+        # Document codes are per process; rows are saved with their document's position in the segment's doc_ids
+        present = np.unique(codes[codes >= 0])
+        positions = np.where(codes >= 0, np.searchsorted(present, codes), -1).astype(np.int32)
+        doc_ids = {code: doc_id for doc_id, code in snapshot.doc_codes.items()}
+        return write_segment(directory, snapshot.chunks[start:snapshot.rows], snapshot.store, model, positions,
+                             [doc_ids[int(code)] for code in present], start, None if start else snapshot.lexical)
+
+    def load(self, directory: str, model: str) -> bool:
+        """Bring the corpus to the current version of the index under directory, if there is one.
+
+        Vectors, postings and chunk texts of the first segment are
+        memory-mapped, so processes loading the same version share one copy
+        of them; rows of later segments are indexed in process memory. If all
+        segments of the version loaded last are still listed, only the
+        segments added since are read.
+        """
+        path = current_index(directory)
+        if path is None:
+            return False
+        manifest = load_version(path, model)
+        segments = manifest.get("segments")
+        with self._write_lock:
+            current = self._snapshot
+            saved = self._saved
+            if (segments is not None and saved is not None and saved.root == directory
+                    and saved.renumbered == current.renumbered and segments[:len(saved.segments)] == saved.segments):
+                snapshot = self._with_documents(current, manifest["documents"])
+                new_segments = segments[len(saved.segments):]
+            else:
+                snapshot = IndexSnapshot(store=self._new_store(), renumbered=current.renumbered + 1)
+                snapshot = self._with_documents(snapshot, manifest.get("documents", []))
+                # Versions saved before segments hold their rows themselves
+                base = segment_path(directory, segments[0]["name"]) if segments else path
+                snapshot = self._with_base(snapshot, base, model, manifest)
+                new_segments = segments[1:] if segments else []
+            for entry in new_segments:
+                snapshot = self._with_segment(snapshot, segment_path(directory, entry["name"]), model)
+            if snapshot.store.ann is not None and self.nprobe:
+                snapshot.store.ann.nprobe = self.nprobe
+            # No ANN index is loaded if it was saved for other vector settings
+            version = current.version + 1
+            self._snapshot = replace(snapshot, store=self._with_ann(snapshot.store), version=version,
+                                     collection_versions={}, cleared_at=version)
+            self._saved = SavedIndex(directory, snapshot.renumbered, segments) if segments else None
+            self.index_path = path
+        return True
+
+    @staticmethod
+    def _with_documents(snapshot: IndexSnapshot, documents: List[dict]) -> IndexSnapshot:
+        """snapshot with the documents of a loaded version; rows of documents no longer listed become deleted."""
+        documents = {d["doc_id"]: Document(**d) for d in documents}
+        doc_codes = {doc_id: code for doc_id, code in snapshot.doc_codes.items() if doc_id in documents}
+        next_code = snapshot.next_code
+        for doc_id in documents:
+            if doc_id not in doc_codes:
+                doc_codes[doc_id] = next_code
+                next_code += 1
+        row_doc = snapshot.row_doc
+        removed = [code for doc_id, code in snapshot.doc_codes.items() if doc_id not in documents]
+        if removed:
+            row_doc = np.where(np.isin(row_doc, removed), -1, row_doc).astype(np.int32)
+        return replace(snapshot, documents=documents, doc_codes=doc_codes, next_code=next_code, row_doc=row_doc,
+                       dead_rows=int(np.count_nonzero(row_doc < 0)))
+
+    @staticmethod
+    def _row_codes(snapshot: IndexSnapshot, directory: str, manifest: dict, chunks: Sequence[Chunk]) -> np.ndarray:
+        """Document code per row of a saved data directory, -1 for rows of documents snapshot does not have."""
+        doc_ids = manifest.get("doc_ids")
+        if doc_ids is None:
+            doc_ids = [d["doc_id"] for d in manifest.get("documents", [])]
+        codes = np.array([snapshot.doc_codes.get(doc_id, -1) for doc_id in doc_ids] + [-1], dtype=np.int32)
+        positions = load_row_docs(directory, manifest)
+        if positions is None:
+            # Saved before row owners were: the chunks name their document
+            position_of = {doc_id: position for position, doc_id in enumerate(doc_ids)}
+            positions = np.fromiter((position_of.get(chunk.metadata.get("doc_id"), -1) for chunk in chunks),
+                                    dtype=np.int32, count=len(chunks))
+        return codes[positions]
+
+    def _with_base(self, snapshot: IndexSnapshot, directory: str, model: str, version: dict) -> IndexSnapshot:
+        """snapshot, which has no rows, with the rows of the first segment (memory-mapped)."""
+        chunks, store, manifest = load_index(directory, model, precision=self.precision, search_dims=self.search_dims,
+                                             rescore=self.rescore)
+        lexical = load_lexical(directory, manifest)
+        if lexical is None or len(lexical) != len(chunks) or lexical.tokenizer_version != TOKENIZER_VERSION:
+            # Saved before BM25 was added, or by another tokenizer: build it from the chunk texts
+            lexical = BM25Index()
+            lexical.add([tokenize(chunk.text) for chunk in chunks])
+        if store.int8_range is None and (version.get("precision"), version.get("search_dims")) == (
+                store.precision, store.search_dims):
+            # Encode rows of later segments as the saving process did
+            store.int8_range = version.get("int8_range")
+        row_doc = self._row_codes(snapshot, directory, manifest, chunks)
+        return replace(snapshot, store=store, lexical=lexical, chunks=chunks, row_doc=row_doc,
+                       dead_rows=int(np.count_nonzero(row_doc < 0)))
+
+    def _with_segment(self, snapshot: IndexSnapshot, directory: str, model: str) -> IndexSnapshot:
+        """snapshot with the rows of a later segment appended."""
+        chunks, rows, manifest = load_index(directory, model)
+        row_doc = self._row_codes(snapshot, directory, manifest, chunks)
+        previous = snapshot.chunks
+        if isinstance(previous, ChainedChunks):
+            parts = previous.parts
+        else:
+            # A list may be shared with later snapshots, which append to it
+            parts = [previous[:snapshot.rows] if isinstance(previous, list) else previous]
+        return replace(
+            snapshot,
+            store=snapshot.store.appended(rows.matrix),
+            lexical=snapshot.lexical.appended([tokenize(chunk.text) for chunk in chunks]),
+            chunks=ChainedChunks(parts + [chunks]),
+            row_doc=np.concatenate([snapshot.row_doc, row_doc]),
+            dead_rows=snapshot.dead_rows + int(np.count_nonzero(row_doc < 0)),
+        )
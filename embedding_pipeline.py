@@ -0,0 +1,252 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+import openai
+from openai import AsyncOpenAI, OpenAI
+
+from embedding_cache import EmbeddingCache
+from metrics import record_tokens, span
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Hard limits of the embeddings endpoint: 2048 inputs and ~300k tokens per request.
+MAX_INPUTS_PER_REQUEST = 2048
+MAX_TOKENS_PER_REQUEST = 300_000
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return max(1, len(text) // 4)
+
+
+@dataclass
+class EmbeddingStats:
+    chunks: int = 0
+    tokens: int = 0
+    batches: int = 0
+    retries: int = 0
+    cached: int = 0
+    seconds: float = 0.0
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+    @property
+    def tokens_per_sec(self) -> float:
+        return self.tokens / self.seconds if self.seconds else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "chunks": self.chunks,
+            "tokens": self.tokens,
+            "batches": self.batches,
+            "retries": self.retries,
+            "cached": self.cached,
+            "seconds": round(self.seconds, 4),
+            "chunks_per_sec": round(self.chunks_per_sec, 2),
+            "tokens_per_sec": round(self.tokens_per_sec, 2),
+        }
+
+
+class EmbeddingPipeline:
+    """Embeds many texts with token-budgeted batches sent concurrently.
+
+    Output order always matches input order, regardless of the order in which
+    batches complete. With a cache, only texts not seen before are sent.
+    """
+
+    def __init__(
+        self,
+        client: OpenAI,
+        model: str = EMBEDDING_MODEL,
+        max_batch_tokens: int = 60_000,
+        max_batch_size: int = 512,
+        concurrency: int = 4,
+        max_retries: int = 6,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        cache: Optional[EmbeddingCache] = None,
+        async_client: Optional[AsyncOpenAI] = None,
+    ):
+        # Retries are handled here so they can be counted and backed off
+        # per batch; disable the client's own retry loop to avoid stacking.
+        self.client = client.with_options(max_retries=0)
+        self.async_client = async_client.with_options(max_retries=0) if async_client else None
+        self.model = model
+        self.max_batch_tokens = min(max_batch_tokens, MAX_TOKENS_PER_REQUEST)
+        self.max_batch_size = min(max_batch_size, MAX_INPUTS_PER_REQUEST)
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.cache = cache
+        self.last_stats = EmbeddingStats()
+        self._stats_lock = threading.Lock()
+
+    def make_batches(self, texts: List[str]) -> List[range]:
+        """Split texts into contiguous index ranges that fit the token budget."""
+        batches = []
+        start = 0
+        tokens = 0
+        for i, text in enumerate(texts):
+            n = estimate_tokens(text)
+            if i > start and (tokens + n > self.max_batch_tokens or i - start >= self.max_batch_size):
+                batches.append(range(start, i))
+                start = i
+                tokens = 0
+            tokens += n
+        if start < len(texts):
+            batches.append(range(start, len(texts)))
+        return batches
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        response = getattr(error, "response", None)
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.backoff_max)
+                except ValueError:
+                    pass
+        delay = min(self.backoff_base * (2 ** attempt), self.backoff_max)
+        return delay * (0.5 + random.random() / 2)
+
+    def _record_batch(self, response, texts: List[str], stats: EmbeddingStats) -> np.ndarray:
+        usage = getattr(response, "usage", None)
+        record_tokens("embeddings", usage)
+        tokens = usage.prompt_tokens if usage else sum(estimate_tokens(t) for t in texts)
+        with self._stats_lock:
+            stats.tokens += tokens
+            stats.batches += 1
+        data = sorted(response.data, key=lambda d: d.index)
+        return np.asarray([d.embedding for d in data], dtype=np.float32)
+
+    def _should_retry(self, attempt: int, error: Exception, stats: EmbeddingStats) -> float:
+        """Return the delay before the next attempt, or re-raise once retries are exhausted."""
+        if attempt >= self.max_retries:
+            raise error
+        delay = self._retry_delay(attempt, error)
+        logger.warning("Embedding batch failed (%s), retrying in %.2fs", type(error).__name__, delay)
+        with self._stats_lock:
+            stats.retries += 1
+        return delay
+
+    def _embed_batch(self, texts: List[str], stats: EmbeddingStats) -> np.ndarray:
+        attempt = 0
+        while True:
+            try:
+                with span("embed_batch"):
+                    response = self.client.embeddings.create(model=self.model, input=texts)
+                return self._record_batch(response, texts, stats)
+            except RETRYABLE_ERRORS as e:
+                time.sleep(self._should_retry(attempt, e, stats))
+                attempt += 1
+
+    async def _aembed_batch(self, texts: List[str], stats: EmbeddingStats, semaphore: asyncio.Semaphore) -> np.ndarray:
+        attempt = 0
+        while True:
+            try:
+                async with semaphore:
+                    with span("embed_batch"):
+                        response = await self.async_client.embeddings.create(model=self.model, input=texts)
+                return self._record_batch(response, texts, stats)
+            except RETRYABLE_ERRORS as e:
+                await asyncio.sleep(self._should_retry(attempt, e, stats))
+                attempt += 1
+
+    def _embed_uncached(self, texts: List[str], stats: EmbeddingStats) -> np.ndarray:
+        batches = self.make_batches(texts)
+        if len(batches) <= 1 or self.concurrency == 1:
+            parts = [self._embed_batch(texts[batch.start:batch.stop], stats) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as pool:
+                futures = [pool.submit(self._embed_batch, texts[batch.start:batch.stop], stats) for batch in batches]
+                parts = [future.result() for future in futures]
+        return np.concatenate(parts)
+
+    async def _aembed_uncached(self, texts: List[str], stats: EmbeddingStats) -> np.ndarray:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        parts = await asyncio.gather(*(
+            self._aembed_batch(texts[batch.start:batch.stop], stats, semaphore)
+            for batch in self.make_batches(texts)
+        ))
+        return np.concatenate(parts)
+
+    def _lookup(self, texts: List[str], use_cache: bool):
+        """Split texts into cached vectors {position: vector} and unique texts still to embed."""
+        cached = self.cache.get_many(self.model, texts) if self.cache and use_cache and texts else {}
+        unique = list(dict.fromkeys(text for i, text in enumerate(texts) if i not in cached))
+        return cached, unique
+
+    def _assemble(self, texts: List[str], cached: dict, unique: List[str], fresh: Optional[np.ndarray],
+                  stats: EmbeddingStats, started: float) -> np.ndarray:
+        if texts:
+            dim = fresh.shape[1] if fresh is not None else next(iter(cached.values())).shape[0]
+            results = np.empty((len(texts), dim), dtype=np.float32)
+        else:
+            results = np.empty((0, 0), dtype=np.float32)
+        if fresh is not None:
+            position = {text: j for j, text in enumerate(unique)}
+            missing = [i for i in range(len(texts)) if i not in cached]
+            results[missing] = fresh[[position[texts[i]] for i in missing]]
+        for i, vector in cached.items():
+            results[i] = vector
+
+        stats.cached += len(cached)
+        stats.chunks += len(texts)
+        stats.seconds += time.perf_counter() - started
+        self.last_stats = stats
+        logger.info(
+            "Embedded %d chunks (%d cached, %d tokens) in %d batches: %.1f chunks/s, %.1f tokens/s",
+            stats.chunks, stats.cached, stats.tokens, stats.batches, stats.chunks_per_sec, stats.tokens_per_sec,
+        )
+        return results
+
+    def embed(self, texts: List[str], stats: Optional[EmbeddingStats] = None, use_cache: bool = True) -> np.ndarray:
+        """Embed texts and return a float32 matrix with one row per text, in order.
+
+        use_cache=False bypasses the cache both ways, for one-off texts such as
+        questions that would only evict chunk vectors and count as misses.
+        """
+        stats = stats or EmbeddingStats()
+        started = time.perf_counter()
+        texts = list(texts)
+        cached, unique = self._lookup(texts, use_cache)
+        fresh = None
+        if unique:
+            fresh = self._embed_uncached(unique, stats)
+            if self.cache and use_cache:
+                self.cache.put_many(self.model, unique, fresh)
+        return self._assemble(texts, cached, unique, fresh, stats, started)
+
+    async def aembed(self, texts: List[str], stats: Optional[EmbeddingStats] = None, use_cache: bool = True) -> np.ndarray:
+        """Async embed(): batches share the async client's connection pool and never block the event loop."""
+        if self.async_client is None:
+            raise RuntimeError("EmbeddingPipeline was created without an async client")
+        stats = stats or EmbeddingStats()
+        started = time.perf_counter()
+        texts = list(texts)
+        cached, unique = await asyncio.to_thread(self._lookup, texts, use_cache)
+        fresh = None
+        if unique:
+            fresh = await self._aembed_uncached(unique, stats)
+            if self.cache and use_cache:
+                await asyncio.to_thread(self.cache.put_many, self.model, unique, fresh)
+        return self._assemble(texts, cached, unique, fresh, stats, started)
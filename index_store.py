@@ -0,0 +1,310 @@
+import json
+import os
+import shutil
+from collections.abc import Sequence
+from dataclasses import asdict, dataclass, field
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from ann_index import IVFIndex
+from lexical_index import BM25Index
+from vector_store import RESCORE_CANDIDATES, VectorStore
+
+FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+CHUNKS_FILE = "chunks.jsonl"
+CHUNK_OFFSETS_FILE = "chunks.offsets.npy"
+ROW_DOCS_FILE = "row_docs.npy"
+EMBEDDINGS_FILE = "embeddings.f32"
+COMPACT_FILE = "embeddings.compact.npy"
+ANN_FILE = "ann.npz"
+LEXICAL_FILE = "bm25"
+# Rows are saved in append-only segments (data directories of FORMAT_VERSION) under segments/; each version of
+# the index is a manifest under versions/ listing its segments, and CURRENT names the latest version
+SEGMENTS_DIR = "segments"
+VERSIONS_DIR = "versions"
+CURRENT_FILE = "CURRENT"
+VERSION_FORMAT = 2
+# Older versions, and segments only they list, are removed after this many; processes still mapping them keep
+# their open files
+KEEP_VERSIONS = 3
+
+
+@dataclass
+class Chunk:
+    text: str
+    start: int
+    end: int
+    metadata: dict = field(default_factory=dict)
+
+
+class MappedChunks(Sequence):
+    """The chunks of a saved index, read from the memory-mapped chunks file as they are accessed.
+
+    Processes serving the same index share the file's pages instead of each
+    holding every chunk as Python objects.
+    """
+
+    def __init__(self, path: str, offsets: np.ndarray):
+        self._data = np.memmap(path, dtype=np.uint8, mode="r", shape=(int(offsets[-1]),))
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return self._offsets.shape[0] - 1
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        return Chunk(**json.loads(bytes(self._data[self._offsets[row]:self._offsets[row + 1]])))
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+
+class ChainedChunks(Sequence):
+    """The chunks of several segments as one sequence, without copying them."""
+
+    def __init__(self, parts: List[Sequence[Chunk]]):
+        self.parts = [part for part in parts if len(part)]
+        self._starts = np.cumsum([0] + [len(part) for part in self.parts])
+
+    def __len__(self) -> int:
+        return int(self._starts[-1])
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        part = int(np.searchsorted(self._starts, row, side="right")) - 1
+        return self.parts[part][row - int(self._starts[part])]
+
+    def __iter__(self):
+        for part in self.parts:
+            yield from part
+
+
+def _write_atomic(path: str, write):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_index(directory: str, chunks: List[Chunk], store: VectorStore, model: str, extra: Optional[dict] = None,
+                lexical: Optional[BM25Index] = None, row_docs: Optional[np.ndarray] = None, start: int = 0):
+    """Write chunks, embeddings, an optional BM25 index and row owners, and a manifest (plus any extra fields) to directory.
+
+    Only the rows of store from start on are written, chunks being their
+    chunks; compact rows and the ANN index are written only with all rows.
+    The manifest is written last, so a reader never sees a manifest that
+    points at embeddings which have not been fully written yet.
+    """
+    if len(chunks) != len(store) - start:
+        raise ValueError(f"{len(chunks)} chunks but {len(store) - start} embeddings")
+    os.makedirs(directory, exist_ok=True)
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+
+    def write_chunks(f):
+        position = 0
+        for row, chunk in enumerate(chunks):
+            line = json.dumps(asdict(chunk), ensure_ascii=False).encode("utf-8") + b"\n"
+            f.write(line)
+            position += len(line)
+            offsets[row + 1] = position
+
+    _write_atomic(os.path.join(directory, CHUNKS_FILE), write_chunks)
+    _write_atomic(os.path.join(directory, CHUNK_OFFSETS_FILE), lambda f: np.save(f, offsets))
+    if row_docs is not None:
+        _write_atomic(os.path.join(directory, ROW_DOCS_FILE), lambda f: np.save(f, row_docs))
+    _write_atomic(os.path.join(directory, EMBEDDINGS_FILE), lambda f: store.write(f, start))
+    compact = store.compact and not start
+    ann = store.ann is not None and not start
+    if compact:
+        _write_atomic(os.path.join(directory, COMPACT_FILE), lambda f: np.save(f, store.scan_matrix))
+    if ann:
+        _write_atomic(os.path.join(directory, ANN_FILE), lambda f: store.ann.save(f))
+    if lexical is not None:
+        lexical.save(os.path.join(directory, LEXICAL_FILE))
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "model": model,
+        "dim": store.dim,
+        "count": len(store) - start,
+        "dtype": "float32",
+        "compact": COMPACT_FILE if compact else None,
+        "precision": store.precision,
+        "search_dims": store.search_dims,
+        "int8_range": store.int8_range,
+        "ann": ANN_FILE if ann else None,
+        "lexical": LEXICAL_FILE if lexical is not None else None,
+        "chunk_offsets": CHUNK_OFFSETS_FILE,
+        "row_docs": ROW_DOCS_FILE if row_docs is not None else None,
+    }
+    manifest.update(extra or {})
+    _write_atomic(os.path.join(directory, MANIFEST_FILE), lambda f: f.write(json.dumps(manifest, indent=2).encode("utf-8")))
+
+
+def _numbered(directory: str) -> List[str]:
+    return sorted(name for name in os.listdir(directory) if name.isdigit()) if os.path.isdir(directory) else []
+
+
+def _next_name(directory: str) -> str:
+    names = _numbered(directory)
+    return f"{int(names[-1]) + 1 if names else 1:08d}"
+
+
+def segment_path(root: str, name: str) -> str:
+    return os.path.join(root, SEGMENTS_DIR, name)
+
+
+def write_segment(root: str, chunks: List[Chunk], store: VectorStore, model: str, row_docs: np.ndarray,
+                  doc_ids: List[str], start: int = 0, lexical: Optional[BM25Index] = None) -> dict:
+    """Write the rows of store from start on, with their chunks, as a new segment under root.
+
+    row_docs gives each row's position in doc_ids (-1 for none). Returns the
+    segment's entry for save_index. Segments are never modified once
+    written; only one starting at row 0 holds the BM25 index, compact rows
+    and ANN index, rows of later ones are indexed as they are loaded.
+    """
+    name = _next_name(os.path.join(root, SEGMENTS_DIR))
+    write_index(segment_path(root, name), chunks, store, model, {"doc_ids": doc_ids}, lexical, row_docs, start)
+    return {"name": name, "rows": len(store) - start}
+
+
+def save_index(root: str, segments: List[dict], model: str, extra: Optional[dict] = None) -> str:
+    """Publish a new version of the index under root, made of segments in row order; returns its directory.
+
+    Only the manifest listing the segments (written by write_segment) is
+    written, so saving appended rows costs a new segment for them, not a
+    copy of the index. A version is never modified once CURRENT names it,
+    and CURRENT is replaced atomically, so processes loading the index
+    concurrently always see one complete version.
+    """
+    name = _next_name(os.path.join(root, VERSIONS_DIR))
+    directory = os.path.join(root, VERSIONS_DIR, name)
+    os.makedirs(directory, exist_ok=True)
+    manifest = {"format_version": VERSION_FORMAT, "model": model, "segments": segments}
+    manifest.update(extra or {})
+    _write_atomic(os.path.join(directory, MANIFEST_FILE), lambda f: f.write(json.dumps(manifest, indent=2).encode("utf-8")))
+    _write_atomic(os.path.join(root, CURRENT_FILE), lambda f: f.write(name.encode("ascii")))
+    prune_versions(root)
+    return directory
+
+
+def prune_versions(root: str, keep: int = KEEP_VERSIONS):
+    """Remove all but the newest keep versions of the index under root, and the segments only they listed."""
+    names = _numbered(os.path.join(root, VERSIONS_DIR))
+    for name in names[:-keep]:
+        shutil.rmtree(os.path.join(root, VERSIONS_DIR, name), ignore_errors=True)
+    listed = set()
+    for name in names[-keep:]:
+        try:
+            manifest = read_manifest(os.path.join(root, VERSIONS_DIR, name))
+        except FileNotFoundError:
+            # Left by a save that did not finish
+            continue
+        listed.update(entry["name"] for entry in manifest.get("segments", []))
+    # Segments newer than every listed one may belong to a version still being saved
+    newest = max(listed, default="")
+    for name in _numbered(os.path.join(root, SEGMENTS_DIR)):
+        if name not in listed and name < newest:
+            shutil.rmtree(segment_path(root, name), ignore_errors=True)
+
+
+def current_index(root: str) -> Optional[str]:
+    """Directory of the current version of the index under root, or None if none was saved."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="ascii") as f:
+            return os.path.join(root, VERSIONS_DIR, f.read().strip())
+    except FileNotFoundError:
+        # Saved in place, before indexes were versioned
+        return root if os.path.exists(os.path.join(root, MANIFEST_FILE)) else None
+
+
+def read_manifest(directory: str) -> dict:
+    with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_version(directory: str, model: str) -> dict:
+    """The manifest of an index version (see current_index).
+
+    Its "segments" lists the segments holding its rows; versions saved
+    before indexes were segmented have none, their directory holds the rows.
+    """
+    manifest = read_manifest(directory)
+    if manifest.get("format_version") not in (FORMAT_VERSION, VERSION_FORMAT):
+        raise ValueError(f"Unsupported index format version: {manifest.get('format_version')}")
+    if manifest["model"] != model:
+        raise ValueError(f"Index was built with {manifest['model']}, expected {model}")
+    return manifest
+
+
+def load_lexical(directory: str, manifest: dict, mmap: bool = True) -> Optional[BM25Index]:
+    if not manifest.get("lexical"):
+        return None
+    return BM25Index.load(os.path.join(directory, manifest["lexical"]), mmap)
+
+
+def load_row_docs(directory: str, manifest: dict, mmap: bool = True) -> Optional[np.ndarray]:
+    """Per row, the position of its document in manifest["doc_ids"] (-1 for none).
+
+    Versions saved before segments list documents in manifest["documents"] instead.
+    """
+    if not manifest.get("row_docs"):
+        return None
+    return np.load(os.path.join(directory, manifest["row_docs"]), mmap_mode="r" if mmap else None)
+
+
+def load_index(directory: str, model: str, mmap: bool = True, precision: str = "float32",
+               search_dims: Optional[int] = None, rescore: int = RESCORE_CANDIDATES) -> Tuple[List[Chunk], VectorStore, dict]:
+    """Load a data directory written by write_index: a segment, or an index version saved before segments.
+
+    With mmap=True the embedding file is memory-mapped read-only, so every
+    process that loads the same index shares one page-cached copy; so are
+    the chunk texts, which are then parsed only when a search returns them.
+    precision, search_dims and rescore configure the store; saved compact
+    rows (and the ANN index) are reused only if they were built with the
+    same precision and search_dims.
+    """
+    manifest = read_manifest(directory)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported index format version: {manifest.get('format_version')}")
+    if manifest["model"] != model:
+        raise ValueError(f"Index was built with {manifest['model']}, expected {model}")
+
+    count = manifest["count"]
+    if mmap and count and manifest.get("chunk_offsets"):
+        offsets = np.load(os.path.join(directory, manifest["chunk_offsets"]), mmap_mode="r")
+        if offsets.shape[0] != count + 1:
+            raise ValueError(f"Index manifest lists {count} chunks but {offsets.shape[0] - 1} were found")
+        chunks = MappedChunks(os.path.join(directory, CHUNKS_FILE), offsets)
+    else:
+        chunks = []
+        with open(os.path.join(directory, CHUNKS_FILE), encoding="utf-8") as f:
+            for line in f:
+                if len(chunks) == count:
+                    break
+                chunks.append(Chunk(**json.loads(line)))
+        if len(chunks) != count:
+            raise ValueError(f"Index manifest lists {count} chunks but {len(chunks)} were found")
+
+    same_scan = (manifest.get("precision", "float32"), manifest.get("search_dims")) == (precision, search_dims)
+    codes_path = os.path.join(directory, manifest["compact"]) if same_scan and manifest.get("compact") else None
+    store = VectorStore.load(os.path.join(directory, EMBEDDINGS_FILE), manifest["dim"], count, mmap, precision,
+                             search_dims, rescore, codes_path, manifest.get("int8_range"))
+    if manifest.get("ann") and same_scan:
+        store.ann = IVFIndex.load(os.path.join(directory, manifest["ann"]))
+    return chunks, store, manifest
+
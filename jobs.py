@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from corpus import DEFAULT_COLLECTION
+from rag_system import RAGSystem
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (COMPLETED, FAILED, CANCELLED)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+@dataclass
+class IngestJob:
+    job_id: str
+    filename: str
+    collection: str
+    file_path: str
+    status: str = QUEUED
+    stage: str = QUEUED
+    pages_total: int = 0
+    pages_parsed: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    document_id: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def update(self, **fields):
+        for key, value in fields.items():
+            setattr(self, key, value)
+
+    def as_dict(self) -> dict:
+        data = asdict(self)
+        del data["file_path"]
+        return data
+
+
+class IngestJobManager:
+    """Bounded queue of PDF ingest jobs run by a fixed number of worker tasks.
+
+    Finished jobs are kept (up to max_history) so clients can poll their
+    final status. on_finish is awaited after every job that created a
+    document: a completed job's must be persisted, and a failed or cancelled
+    job's partial document, removed in memory, may have been written by a
+    save made while it was being ingested.
+    """
+
+    def __init__(self, rag_system: RAGSystem, workers: int = 2, max_queued: int = 32, max_history: int = 1000,
+                 on_finish: Optional[Callable[[IngestJob], Awaitable[None]]] = None):
+        self.rag_system = rag_system
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_history = max_history
+        self.on_finish = on_finish
+        self.jobs: Dict[str, IngestJob] = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancel_requested = set()
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, file_path: str, filename: str, collection: str = DEFAULT_COLLECTION) -> IngestJob:
+        job = IngestJob(uuid.uuid4().hex, filename, collection, file_path)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Ingest queue is full ({self.max_queued} jobs waiting)")
+        self.jobs[job.job_id] = job
+        self._trim_history()
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self.jobs.get(job_id)
+
+    def list(self) -> List[IngestJob]:
+        return list(self.jobs.values())
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.jobs.get(job_id)
+        if job is None or job.status in FINISHED:
+            return False
+        task = self._running.get(job_id)
+        if task is not None:
+            self._cancel_requested.add(job_id)
+            task.cancel()
+        else:
+            # Still queued: the worker skips it when dequeued
+            self._finish(job, CANCELLED)
+        return True
+
+    def _trim_history(self):
+        while len(self.jobs) > self.max_history:
+            oldest = next((job_id for job_id, job in self.jobs.items() if job.status in FINISHED), None)
+            if oldest is None:
+                return
+            del self.jobs[oldest]
+
+    def _finish(self, job: IngestJob, status: str, error: Optional[str] = None):
+        job.update(status=status, error=error, finished_at=time.time())
+        if os.path.exists(job.file_path):
+            os.remove(job.file_path)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.status == QUEUED:
+                    await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: IngestJob):
+        job.update(status=RUNNING, started_at=time.time())
+        task = asyncio.create_task(
+            self.rag_system.aprocess_pdf(job.file_path, collection=job.collection, name=job.filename, progress=job.update)
+        )
+        self._running[job.job_id] = task
+        try:
+            await task
+        except asyncio.CancelledError:
+            self._finish(job, CANCELLED)
+            if job.job_id not in self._cancel_requested:
+                # The worker itself is being stopped
+                raise
+        except Exception as e:
+            logger.exception("Ingest job %s failed", job.job_id)
+            self._finish(job, FAILED, str(e))
+        else:
+            self._finish(job, COMPLETED)
+        finally:
+            self._running.pop(job.job_id, None)
+            self._cancel_requested.discard(job.job_id)
+
+        if self.on_finish is not None and job.document_id is not None:
+            try:
+                await self.on_finish(job)
+            except Exception:
+                logger.exception("Ingest job %s finish hook failed", job.job_id)
@@ -0,0 +1,239 @@
+import copy
+import os
+import re
+import unicodedata
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from vector_store import top_k_indices
+
+# Scripts written without spaces between words: Thai, Lao, Myanmar, Khmer, kana and CJK ideographs
+_UNSEGMENTED = "\u0e00-\u0eff\u1000-\u109f\u1780-\u17ff\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_WORD = rf"[^\W_{_UNSEGMENTED}]+"
+# Runs of unsegmented script; words of other scripts, with codes such as "err-1042", "v2.3.1" or
+# "part_no:77" kept whole
+_TOKEN_RE = re.compile(rf"[{_UNSEGMENTED}]+|{_WORD}(?:[-_./:]{_WORD})*")
+_UNSEGMENTED_RE = re.compile(rf"[{_UNSEGMENTED}]")
+_SEPARATOR_RE = re.compile(r"[-_./:]")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from had has have how i if in into is it its of on or "
+    "so than that the their then there these they this to was were what when where which who why will with you".split()
+)
+# Bumped when tokenize changes; saved postings of another version are rebuilt from the chunk texts
+TOKENIZER_VERSION = 2
+# Constant of reciprocal rank fusion: damps the weight of the very top ranks
+RRF_K = 60
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms without stopwords; compound codes also yield their multi-character parts.
+
+    Text is NFKC-normalized first, so accented letters that PDF extraction
+    leaves as a base letter plus a combining mark match their composed form.
+    A run of a script without word spaces (Chinese, Japanese, Thai, ...)
+    becomes its overlapping character bigrams, so a word inside the run
+    matches without a dictionary to segment it.
+    """
+    tokens = []
+    for token in _TOKEN_RE.findall(unicodedata.normalize("NFKC", text).lower()):
+        # The code point comparison skips the regex for Latin, Greek, Cyrillic, ... tokens
+        if token[0] >= "\u0e00" and _UNSEGMENTED_RE.match(token):
+            tokens.extend([token[i:i + 2] for i in range(len(token) - 1)] or [token])
+            continue
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if _SEPARATOR_RE.search(token):
+            tokens.extend(part for part in _SEPARATOR_RE.split(token) if len(part) > 1 and part not in STOPWORDS)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Sequence[np.ndarray], top_k: int, k: int = RRF_K) -> Tuple[np.ndarray, np.ndarray]:
+    """Fuse ranked id lists (best first); returns (ids, fused scores) of the top_k ids."""
+    ids = np.concatenate([np.asarray(ranking, dtype=np.int64) for ranking in rankings])
+    weights = np.concatenate([1.0 / (k + 1 + np.arange(len(ranking))) for ranking in rankings])
+    unique, inverse = np.unique(ids, return_inverse=True)
+    fused = np.bincount(inverse, weights=weights, minlength=unique.shape[0])
+    best = top_k_indices(fused, top_k)
+    return unique[best], fused[best].astype(np.float32)
+
+
+class BM25Index:
+    """Okapi BM25 over the rows of a corpus, with compact postings lists.
+
+    Postings are kept in CSR layout: the rows containing term t are
+    _rows[_offsets[t]:_offsets[t + 1]] (int32, ascending) with their term
+    frequencies in _freqs (uint16). As in IVFIndex, rows added since the last
+    rebuild sit in a pending tail that is merged in bulk.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.tokenizer_version = TOKENIZER_VERSION
+        self.vocab: Dict[str, int] = {}
+        self._doc_len = np.empty(0, dtype=np.int32)
+        self._total_len = 0
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._rows = np.empty(0, dtype=np.int32)
+        self._freqs = np.empty(0, dtype=np.uint16)
+        self._pending_terms = np.empty(0, dtype=np.int32)
+        self._pending_rows = np.empty(0, dtype=np.int32)
+        self._pending_freqs = np.empty(0, dtype=np.uint16)
+
+    def __len__(self) -> int:
+        return self._doc_len.shape[0]
+
+    @property
+    def num_postings(self) -> int:
+        return self._rows.shape[0] + self._pending_rows.shape[0]
+
+    def add(self, token_lists: List[List[str]]):
+        """Index new rows (appended after the existing ones), one token list per row."""
+        start = len(self)
+        lengths = np.fromiter((len(tokens) for tokens in token_lists), dtype=np.int32, count=len(token_lists))
+        vocab = self.vocab
+        term_ids = np.fromiter((vocab.setdefault(token, len(vocab)) for tokens in token_lists for token in tokens),
+                               dtype=np.int64, count=int(lengths.sum()))
+        row_ids = np.repeat(np.arange(start, start + len(token_lists), dtype=np.int64), lengths)
+        # One posting per distinct (row, term) pair, counted in a single sort
+        pairs, counts = np.unique((row_ids << 32) | term_ids, return_counts=True)
+        rows = (pairs >> 32).astype(np.int32)
+        terms = (pairs & 0xFFFFFFFF).astype(np.int32)
+        freqs = np.minimum(counts, 65_535).astype(np.uint16)
+        self._doc_len = np.concatenate([self._doc_len, lengths])
+        self._total_len += int(lengths.sum())
+        self._pending_terms = np.concatenate([self._pending_terms, terms])
+        self._pending_rows = np.concatenate([self._pending_rows, rows])
+        self._pending_freqs = np.concatenate([self._pending_freqs, freqs])
+        if self._pending_rows.shape[0] > max(65_536, self._rows.shape[0] // 10):
+            self._rebuild()
+
+    def appended(self, token_lists: List[List[str]]) -> "BM25Index":
+        """A new index with rows added; this one is left as it was.
+
+        Postings arrays are replaced, never modified, so they are shared. The
+        vocabulary is shared too and only grows: terms this index has no
+        postings for score nothing here.
+        """
+        index = copy.copy(self)
+        index.add(token_lists)
+        return index
+
+    def _all_postings(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        indexed_terms = np.repeat(np.arange(len(self._offsets) - 1, dtype=np.int32), np.diff(self._offsets))
+        return (np.concatenate([indexed_terms, self._pending_terms]),
+                np.concatenate([self._rows, self._pending_rows]),
+                np.concatenate([self._freqs, self._pending_freqs]))
+
+    def _set_postings(self, terms: np.ndarray, rows: np.ndarray, freqs: np.ndarray):
+        # Stable sort: within a term, rows stay in insertion (ascending) order
+        order = np.argsort(terms, kind="stable")
+        self._rows = rows[order]
+        self._freqs = freqs[order]
+        counts = np.bincount(terms, minlength=len(self.vocab))
+        self._offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self._pending_terms = np.empty(0, dtype=np.int32)
+        self._pending_rows = np.empty(0, dtype=np.int32)
+        self._pending_freqs = np.empty(0, dtype=np.uint16)
+
+    def _rebuild(self):
+        self._set_postings(*self._all_postings())
+
+    def postings(self, term: int) -> Tuple[np.ndarray, np.ndarray]:
+        rows, freqs = self._rows[0:0], self._freqs[0:0]
+        if term < len(self._offsets) - 1:
+            rows = self._rows[self._offsets[term]:self._offsets[term + 1]]
+            freqs = self._freqs[self._offsets[term]:self._offsets[term + 1]]
+        if self._pending_terms.shape[0]:
+            pending = np.flatnonzero(self._pending_terms == term)
+            if pending.shape[0]:
+                rows = np.concatenate([rows, self._pending_rows[pending]])
+                freqs = np.concatenate([freqs, self._pending_freqs[pending]])
+        return rows, freqs
+
+    def search(self, tokens: List[str], top_k: int = 3, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (row ids, BM25 scores) of the best matching rows, best first.
+
+        Only rows sharing at least one term with the query are scored, so
+        fewer than top_k rows may come back.
+        """
+        n = len(self)
+        terms = {self.vocab[token] for token in tokens if token in self.vocab}
+        if not n or not terms or top_k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        avg_len = self._total_len / n
+        all_rows, contributions = [], []
+        for term in terms:
+            rows, freqs = self.postings(term)
+            idf = np.log1p((n - rows.shape[0] + 0.5) / (rows.shape[0] + 0.5))
+            if mask is not None:
+                keep = mask[rows]
+                rows, freqs = rows[keep], freqs[keep]
+            if not rows.shape[0]:
+                continue
+            tf = freqs.astype(np.float32)
+            norm = self.k1 * (1 - self.b + self.b * self._doc_len[rows] / avg_len)
+            all_rows.append(rows)
+            contributions.append(idf * tf * (self.k1 + 1) / (tf + norm))
+        if not all_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        unique, inverse = np.unique(np.concatenate(all_rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions), minlength=unique.shape[0])
+        best = top_k_indices(scores, top_k)
+        return unique[best].astype(np.int64), scores[best].astype(np.float32)
+
+    def search_batch(self, token_lists: List[List[str]], top_k: int = 3,
+                     mask: Optional[np.ndarray] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        return [self.search(tokens, top_k, mask) for tokens in token_lists]
+
+    def take(self, keep: np.ndarray) -> "BM25Index":
+        """Return a new index over only the rows where the boolean keep mask is True, renumbered."""
+        index = BM25Index(self.k1, self.b)
+        index.tokenizer_version = self.tokenizer_version
+        index.vocab = self.vocab.copy()
+        terms, rows, freqs = self._all_postings()
+        selected = keep[rows]
+        new_ids = (np.cumsum(keep) - 1).astype(np.int32)
+        index._doc_len = self._doc_len[keep]
+        index._total_len = int(index._doc_len.sum())
+        index._set_postings(terms[selected], new_ids[rows[selected]], freqs[selected])
+        return index
+
+    def save(self, directory: str):
+        """Write the index to directory as .npy files, which load() can memory-map."""
+        # Merge the pending tail into a copy: this index may be in use by concurrent searches
+        index = copy.copy(self)
+        index._rebuild()
+        terms = sorted(index.vocab, key=index.vocab.get)
+        os.makedirs(directory, exist_ok=True)
+        arrays = {
+            "vocab": np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8),
+            "offsets": index._offsets, "rows": index._rows, "freqs": index._freqs, "doc_len": index._doc_len,
+            "params": np.array([index.k1, index.b, index.tokenizer_version]),
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, f"{name}.npy"), array)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "BM25Index":
+        """Load a directory written by save(), postings memory-mapped if mmap; or an .npz of older indexes."""
+        if os.path.isdir(path):
+            data = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None)
+                    for name in ("vocab", "offsets", "rows", "freqs", "doc_len", "params")}
+        else:
+            with np.load(path) as npz:
+                data = {name: npz[name] for name in npz.files}
+        params = data["params"]
+        index = cls(float(params[0]), float(params[1]))
+        # Indexes saved before the version was recorded used the first tokenizer
+        index.tokenizer_version = int(params[2]) if len(params) > 2 else 1
+        terms = bytes(data["vocab"]).decode("utf-8")
+        index.vocab = {term: i for i, term in enumerate(terms.split("\n"))} if terms else {}
+        index._offsets = data["offsets"]
+        index._rows = data["rows"]
+        index._freqs = data["freqs"]
+        index._doc_len = data["doc_len"]
+        index._total_len = int(index._doc_len.sum())
+        return index
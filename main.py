@@ -1,10 +1,26 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
+from typing import List, Optional
+import json
 import os
 import shutil
-from rag_system import RAGSystem
+import time
+import uuid
+import httpx
+from rag_system import RAGSystem, RETRIEVAL_MODES, HYBRID, ANSWER_TOP_K, BATCH_CONCURRENCY
+from corpus import Corpus, DEFAULT_COLLECTION
+from jobs import FINISHED, QUEUED, RUNNING, IngestJobManager, QueueFullError
+from vector_store import ANN_MIN_ROWS, RESCORE_CANDIDATES
+from index_store import prune_versions
+from embedding_cache import EmbeddingCache
+from answer_cache import AnswerCache
+from chunker import DEFAULT_MAX_TOKENS, DEFAULT_OVERLAP_TOKENS
+from context_builder import ContextBuilder, DEFAULT_CONTEXT_TOKENS
+from metrics import CONTENT_TYPE, REGISTRY, CallbackMetric, MetricsMiddleware
+from serving import READER, ROLES, WRITER, IndexFollower, WriteForwarder, WriterLock
 
 app = FastAPI(title="RAG PDF Q&A System")
 
@@ -19,14 +35,134 @@ app.add_middleware(
 
 # Initialize RAG system with your API key
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', 'your-api-key-here')
-rag_system = RAGSystem(OPENAI_API_KEY)
+
+# Embeddings of previously seen chunks are reused across uploads
+EMBEDDING_CACHE_PATH = os.environ.get('RAG_EMBEDDING_CACHE', 'embedding_cache.sqlite3')
+EMBEDDING_CACHE_MB = int(os.environ.get('RAG_EMBEDDING_CACHE_MB', '512'))
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MB * 1024 * 1024) if EMBEDDING_CACHE_PATH else None
+
+# Switch from exact to IVF search once the corpus reaches this many chunks
+ANN_MIN_ROWS = int(os.environ.get('RAG_ANN_MIN_ROWS', ANN_MIN_ROWS))
+ANN_NPROBE = int(os.environ['RAG_ANN_NPROBE']) if os.environ.get('RAG_ANN_NPROBE') else None
+
+# Compact vectors: search "int8" rows (a quarter of the memory of "float32", at about the same scan latency),
+# optionally only their first RAG_SEARCH_DIMS dimensions, then rescore RAG_RESCORE_CANDIDATES rows per result at
+# full precision from disk
+VECTOR_PRECISION = os.environ.get('RAG_VECTOR_PRECISION', 'float32')
+SEARCH_DIMS = int(os.environ['RAG_SEARCH_DIMS']) if os.environ.get('RAG_SEARCH_DIMS') else None
+RESCORE_CANDIDATES = int(os.environ.get('RAG_RESCORE_CANDIDATES', RESCORE_CANDIDATES))
+
+# Answers to repeated or near-duplicate questions (0 entries disables the cache)
+ANSWER_CACHE_SIZE = int(os.environ.get('RAG_ANSWER_CACHE_SIZE', '1000'))
+ANSWER_CACHE_TTL = float(os.environ.get('RAG_ANSWER_CACHE_TTL', '3600'))
+ANSWER_CACHE_THRESHOLD = float(os.environ.get('RAG_ANSWER_CACHE_THRESHOLD', '0.95'))
+answer_cache = AnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_THRESHOLD) if ANSWER_CACHE_SIZE > 0 else None
+
+# Default retrieval: "hybrid" (embeddings + BM25), "dense" or "lexical" (no embedding call)
+RETRIEVAL_MODE = os.environ.get('RAG_RETRIEVAL_MODE', HYBRID)
+
+# Chunk size as a token budget (0 keeps the old fixed 1000-character windows)
+CHUNK_TOKENS = int(os.environ.get('RAG_CHUNK_TOKENS', DEFAULT_MAX_TOKENS))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get('RAG_CHUNK_OVERLAP_TOKENS', DEFAULT_OVERLAP_TOKENS))
+
+# Chunks retrieved per question, and the prompt token budget for the context built from them
+ANSWER_TOP_K = int(os.environ.get('RAG_ANSWER_TOP_K', ANSWER_TOP_K))
+CONTEXT_TOKENS = int(os.environ.get('RAG_CONTEXT_TOKENS', DEFAULT_CONTEXT_TOKENS))
+
+rag_system = RAGSystem(OPENAI_API_KEY, embedding_cache=embedding_cache,
+                       corpus=Corpus(ann_min_rows=ANN_MIN_ROWS, nprobe=ANN_NPROBE, precision=VECTOR_PRECISION,
+                                     search_dims=SEARCH_DIMS, rescore=RESCORE_CANDIDATES),
+                       answer_cache=answer_cache, retrieval_mode=RETRIEVAL_MODE,
+                       chunk_tokens=CHUNK_TOKENS, chunk_overlap_tokens=CHUNK_OVERLAP_TOKENS,
+                       context_builder=ContextBuilder(CONTEXT_TOKENS), answer_top_k=ANSWER_TOP_K)
+
+# /ask/batch: questions per request, and chat completions in flight per batch
+BATCH_MAX_QUESTIONS = int(os.environ.get('RAG_BATCH_MAX_QUESTIONS', '256'))
+BATCH_CONCURRENCY = int(os.environ.get('RAG_BATCH_CONCURRENCY', BATCH_CONCURRENCY))
+
+# Persisted index, memory-mapped at startup so restarts skip re-embedding
+INDEX_DIR = os.environ.get('RAG_INDEX_DIR', 'index')
+
+# One writer process per index ingests and saves new index versions. Processes started with
+# RAG_ROLE=reader (e.g. uvicorn --workers N) answer questions from the latest version, all sharing
+# one memory-mapped copy, and forward uploads, deletes and resets to the writer at RAG_WRITER_URL
+ROLE = os.environ.get('RAG_ROLE', WRITER)
+if ROLE not in ROLES:
+    raise ValueError(f"RAG_ROLE must be one of: {', '.join(ROLES)}")
+WRITER_URL = os.environ.get('RAG_WRITER_URL')
+INDEX_POLL_SECONDS = float(os.environ.get('RAG_INDEX_POLL_SECONDS', '1'))
+WRITE_ROUTES = [("POST", "/upload"), (None, "/jobs"), (None, "/jobs/"), ("DELETE", "/documents/"), ("POST", "/reset")]
+
+writer_lock = None
+if ROLE == WRITER:
+    writer_lock = WriterLock(INDEX_DIR)
+    writer_lock.acquire()
+rag_system.load_index(INDEX_DIR)
+index_follower = IndexFollower(rag_system, INDEX_DIR, INDEX_POLL_SECONDS)
+writer_client = None
+if ROLE == READER:
+    if WRITER_URL:
+        writer_client = httpx.AsyncClient(base_url=WRITER_URL, timeout=httpx.Timeout(300.0, connect=5.0))
+    app.add_middleware(WriteForwarder, routes=WRITE_ROUTES, client=writer_client, on_forwarded=index_follower.refresh)
+
+# Request latency histograms for /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Background ingestion: bounded queue, fixed number of concurrent ingests
+INGEST_WORKERS = int(os.environ.get('RAG_INGEST_WORKERS', '2'))
+INGEST_QUEUE_SIZE = int(os.environ.get('RAG_INGEST_QUEUE_SIZE', '32'))
+
+async def save_index_after_ingest(job):
+    await run_in_threadpool(rag_system.save_index, INDEX_DIR)
+
+ingest_jobs = IngestJobManager(rag_system, workers=INGEST_WORKERS, max_queued=INGEST_QUEUE_SIZE,
+                               on_finish=save_index_after_ingest)
+
+# Values kept elsewhere, read when /metrics is scraped
+CallbackMetric("rag_corpus_chunks", "Live chunks in the index.", "gauge", [], lambda: {(): len(rag_system.corpus)})
+CallbackMetric("rag_corpus_documents", "Indexed documents.", "gauge", [],
+               lambda: {(): len(rag_system.corpus.list_documents())})
+CallbackMetric("rag_ingest_jobs", "Ingest jobs by status.", "gauge", ["status"],
+               lambda: {(status,): sum(job.status == status for job in ingest_jobs.list())
+                        for status in (QUEUED, RUNNING) + FINISHED})
+if embedding_cache:
+    CallbackMetric("rag_embedding_cache_lookups_total", "Embedding cache lookups by result.", "counter", ["result"],
+                   lambda: {("hit",): embedding_cache.hits, ("miss",): embedding_cache.misses})
+if answer_cache is not None:
+    CallbackMetric("rag_answer_cache_lookups_total", "Answer cache lookups by result.", "counter", ["result"],
+                   lambda: {("exact_hit",): answer_cache.exact_hits, ("semantic_hit",): answer_cache.semantic_hits,
+                            ("miss",): answer_cache.misses})
 
 # Temporary upload directory
 UPLOAD_DIR = "temp_uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-class QuestionRequest(BaseModel):
+def save_upload(file: UploadFile, file_path: str):
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+
+class RetrievalRequest(BaseModel):
+    collection: Optional[str] = None
+    document_ids: Optional[List[str]] = None
+    mode: Optional[str] = None
+
+    def filters(self) -> dict:
+        return {
+            "collections": [self.collection] if self.collection else None,
+            "document_ids": self.document_ids or None,
+        }
+
+    def retrieval_mode(self) -> Optional[str]:
+        if self.mode is not None and self.mode not in RETRIEVAL_MODES:
+            raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(RETRIEVAL_MODES)}")
+        return self.mode
+
+class QuestionRequest(RetrievalRequest):
     question: str
+    timings: bool = False  # include per-stage milliseconds in the response
+
+class BatchQuestionRequest(RetrievalRequest):
+    questions: List[str]
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root():
@@ -129,8 +265,9 @@ async def read_root():
                         <div class="flex-1">
                             <h3 class="font-bold text-gray-800 text-lg mb-2">Answer</h3>
                             <div class="bg-white rounded-xl p-4 shadow-sm">
-                                <p class="text-gray-700 leading-relaxed text-base" id="answerText"></p>
+                                <p class="text-gray-700 leading-relaxed text-base whitespace-pre-wrap" id="answerText"></p>
                             </div>
+                            <p class="text-gray-400 text-xs mt-2" id="answerTiming"></p>
                         </div>
                     </div>
                 </div>
@@ -234,11 +371,13 @@ async def read_root():
         const errorText = document.getElementById('errorText');
         const answerDiv = document.getElementById('answerDiv');
         const answerText = document.getElementById('answerText');
+        const answerTiming = document.getElementById('answerTiming');
         const resetButton = document.getElementById('resetButton');
         const loadingSpinner = document.getElementById('loadingSpinner');
         const loadingText = document.getElementById('loadingText');
 
-        let documentUploaded = false;
+        // The document this page uploaded: questions and reset only touch it
+        let documentId = null;
 
         function showError(message) {
             errorText.textContent = message;
@@ -263,6 +402,31 @@ async def read_root():
             askButtonText.innerHTML = '<span class="mr-2">⚡</span>Get Answer';
         }
 
+        function describeJob(job) {
+            if (job.stage === 'parsing') {
+                return `Reading pages... ${job.pages_parsed}/${job.pages_total}`;
+            }
+            if (job.stage === 'embedding') {
+                return `Indexing text... ${job.chunks_embedded}/${job.chunks_total} chunks`;
+            }
+            return 'Waiting to be processed...';
+        }
+
+        async function waitForJob(jobId) {
+            while (true) {
+                const response = await fetch(`/jobs/${jobId}`);
+                const job = await response.json();
+                if (!response.ok) {
+                    throw new Error(job.detail || 'Failed to get upload status');
+                }
+                if (['completed', 'failed', 'cancelled'].includes(job.status)) {
+                    return job;
+                }
+                loadingText.textContent = describeJob(job);
+                await new Promise(resolve => setTimeout(resolve, 1000));
+            }
+        }
+
         fileInput.addEventListener('change', async (e) => {
             const file = e.target.files[0];
             if (!file) return;
@@ -283,12 +447,17 @@ async def read_root():
                 const data = await response.json();
 
                 if (response.ok) {
-                    uploadIcon.innerHTML = '<span class="text-5xl">✅</span>';
-                    uploadText.innerHTML = `<span class="text-green-600">✓ ${file.name}</span>`;
-                    uploadStatus.innerHTML = `<span class="text-green-600">✓ PDF processed successfully! Created ${data.num_chunks} text chunks for analysis.</span>`;
-                    questionSection.classList.remove('hidden');
-                    resetButton.classList.remove('hidden');
-                    documentUploaded = true;
+                    const job = await waitForJob(data.job_id);
+                    if (job.status === 'completed') {
+                        uploadIcon.innerHTML = '<span class="text-5xl">✅</span>';
+                        uploadText.innerHTML = `<span class="text-green-600">✓ ${file.name}</span>`;
+                        uploadStatus.innerHTML = `<span class="text-green-600">✓ PDF processed successfully! Created ${job.chunks_total} text chunks for analysis.</span>`;
+                        questionSection.classList.remove('hidden');
+                        resetButton.classList.remove('hidden');
+                        documentId = job.document_id;
+                    } else {
+                        showError(job.error || `Processing ${job.status}`);
+                    }
                 } else {
                     showError(data.detail || 'Failed to upload file');
                 }
@@ -311,22 +480,53 @@ async def read_root():
             showLoading('Finding relevant information and generating answer...');
 
             try {
-                const response = await fetch('/ask', {
+                const response = await fetch('/ask/stream', {
                     method: 'POST',
                     headers: {
                         'Content-Type': 'application/json'
                     },
-                    body: JSON.stringify({ question: question })
+                    body: JSON.stringify({ question: question, document_ids: [documentId] })
                 });
 
-                const data = await response.json();
-
-                if (response.ok) {
-                    answerText.textContent = data.answer;
-                    answerDiv.classList.remove('hidden');
-                    answerDiv.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
-                } else {
+                if (!response.ok) {
+                    const data = await response.json();
                     showError(data.detail || 'Failed to get answer');
+                    return;
+                }
+
+                answerText.textContent = '';
+                answerTiming.textContent = '';
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                while (true) {
+                    const { value, done } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    const events = buffer.split('\\n\\n');
+                    buffer = events.pop();
+                    for (const raw of events) {
+                        let event = 'message';
+                        let data = '';
+                        for (const line of raw.split('\\n')) {
+                            if (line.startsWith('event: ')) event = line.slice(7);
+                            else if (line.startsWith('data: ')) data += line.slice(6);
+                        }
+                        if (!data) continue;
+                        const payload = JSON.parse(data);
+                        if (event === 'error') {
+                            showError(payload.detail);
+                        } else if (event === 'done') {
+                            answerTiming.textContent = `First token ${payload.time_to_first_token_ms} ms · total ${payload.total_ms} ms`;
+                        } else {
+                            if (answerDiv.classList.contains('hidden')) {
+                                hideLoading();
+                                answerDiv.classList.remove('hidden');
+                                answerDiv.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
+                            }
+                            answerText.textContent += payload.token;
+                        }
+                    }
                 }
             } catch (error) {
                 showError('Error getting answer: ' + error.message);
@@ -345,7 +545,14 @@ async def read_root():
 
         resetButton.addEventListener('click', async () => {
             try {
-                await fetch('/reset', { method: 'POST' });
+                if (documentId) {
+                    const response = await fetch(`/documents/${documentId}`, { method: 'DELETE' });
+                    if (!response.ok && response.status !== 404) {
+                        const data = await response.json();
+                        showError(data.detail || 'Failed to remove document');
+                        return;
+                    }
+                }
                 
                 fileInput.value = '';
                 questionInput.value = '';
@@ -356,7 +563,7 @@ async def read_root():
                 resetButton.classList.add('hidden');
                 answerDiv.classList.add('hidden');
                 hideError();
-                documentUploaded = false;
+                documentId = null;
             } catch (error) {
                 showError('Error resetting: ' + error.message);
             }
@@ -367,28 +574,53 @@ async def read_root():
     """
     return HTMLResponse(content=html_content)
 
-@app.post("/upload")
-async def upload_pdf(file: UploadFile = File(...)):
-    """Handle PDF upload and processing"""
+@app.post("/upload", status_code=202)
+async def upload_pdf(file: UploadFile = File(...), collection: str = Form(DEFAULT_COLLECTION)):
+    """Accept a PDF and queue it for background ingestion"""
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
     
+    # Unique temp name so concurrent uploads of the same filename don't collide
+    file_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}.pdf")
+    try:
+        await run_in_threadpool(save_upload, file, file_path)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error saving PDF: {str(e)}")
+    
     try:
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        num_chunks = rag_system.process_pdf(file_path)
+        job = ingest_jobs.submit(file_path, file.filename, collection)
+    except QueueFullError as e:
         os.remove(file_path)
-        
-        return {
-            "success": True,
-            "message": f"PDF processed successfully. Created {num_chunks} chunks.",
-            "num_chunks": num_chunks
-        }
+        raise HTTPException(status_code=503, detail=str(e))
     
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
+    return {
+        "success": True,
+        "message": "PDF queued for processing.",
+        "job_id": job.job_id,
+        "status_url": f"/jobs/{job.job_id}"
+    }
+
+@app.get("/jobs")
+async def list_jobs():
+    """List recent ingest jobs"""
+    return {"jobs": [job.as_dict() for job in ingest_jobs.list()]}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Progress of one ingest job"""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.as_dict()
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running ingest job"""
+    if ingest_jobs.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not ingest_jobs.cancel(job_id):
+        raise HTTPException(status_code=409, detail="Job already finished")
+    return {"success": True, "message": f"Job {job_id} cancelled"}
 
 @app.post("/ask")
 async def ask_question(request: QuestionRequest):
@@ -396,26 +628,160 @@ async def ask_question(request: QuestionRequest):
     if not request.question.strip():
         raise HTTPException(status_code=400, detail="No question provided")
     
-    if not rag_system.has_document():
+    mode = request.retrieval_mode()
+    filters = request.filters()
+    if not rag_system.has_document(**filters):
         raise HTTPException(status_code=400, detail="Please upload a PDF first")
     
     try:
-        answer = rag_system.answer_question(request.question)
-        return {
+        usage = {}
+        timings = {} if request.timings else None
+        started = time.perf_counter()
+        answer = await rag_system.aanswer_question(request.question, mode=mode, usage=usage, timings=timings, **filters)
+        response = {
             "success": True,
-            "answer": answer
+            "answer": answer,
+            "usage": usage
         }
+        if timings is not None:
+            response["timings_ms"] = dict(timings, total=round((time.perf_counter() - started) * 1000, 3))
+        return response
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating answer: {str(e)}")
 
+@app.get("/documents")
+async def list_documents(collection: Optional[str] = None):
+    """List indexed documents, optionally within one collection"""
+    return {
+        "collections": rag_system.corpus.collections(),
+        "documents": [vars(doc) for doc in rag_system.corpus.list_documents(collection)]
+    }
+
+@app.delete("/documents/{document_id}")
+async def delete_document(document_id: str):
+    """Remove one document from the index"""
+    if not await run_in_threadpool(rag_system.delete_document, document_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    await run_in_threadpool(rag_system.save_index, INDEX_DIR)
+    return {"success": True, "message": f"Document {document_id} deleted"}
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.post("/ask/stream")
+async def ask_question_stream(request: QuestionRequest):
+    """Stream the answer as Server-Sent Events, one event per token"""
+    if not request.question.strip():
+        raise HTTPException(status_code=400, detail="No question provided")
+    
+    mode = request.retrieval_mode()
+    filters = request.filters()
+    if not rag_system.has_document(**filters):
+        raise HTTPException(status_code=400, detail="Please upload a PDF first")
+    
+    async def events():
+        started = time.perf_counter()
+        first_token = None
+        usage = {}
+        timings = {} if request.timings else None
+        try:
+            async for token in rag_system.astream_answer(request.question, mode=mode, usage=usage, timings=timings,
+                                                         **filters):
+                if first_token is None:
+                    first_token = time.perf_counter()
+                yield sse_event({"token": token})
+        except Exception as e:
+            yield sse_event({"detail": f"Error generating answer: {str(e)}"}, event="error")
+            return
+        finished = time.perf_counter()
+        done = {
+            "time_to_first_token_ms": round(((first_token or finished) - started) * 1000, 1),
+            "total_ms": round((finished - started) * 1000, 1),
+            "usage": usage
+        }
+        if timings is not None:
+            done["timings_ms"] = timings
+        yield sse_event(done, event="done")
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/ask/batch")
+async def ask_batch(request: BatchQuestionRequest):
+    """Answer many questions at once, streaming each result as Server-Sent Events as soon as it is ready"""
+    if not request.questions or any(not question.strip() for question in request.questions):
+        raise HTTPException(status_code=400, detail="Provide a non-empty list of non-empty questions")
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+    
+    mode = request.retrieval_mode()
+    filters = request.filters()
+    if not rag_system.has_document(**filters):
+        raise HTTPException(status_code=400, detail="Please upload a PDF first")
+    
+    async def events():
+        started = time.perf_counter()
+        failed = 0
+        try:
+            async for index, result in rag_system.aanswer_batch(request.questions, mode=mode,
+                                                                concurrency=BATCH_CONCURRENCY, **filters):
+                failed += "error" in result
+                yield sse_event({"index": index, "question": request.questions[index], **result})
+        except Exception as e:
+            yield sse_event({"detail": f"Error generating answers: {str(e)}"}, event="error")
+            return
+        yield sse_event({
+            "questions": len(request.questions),
+            "failed": failed,
+            "total_ms": round((time.perf_counter() - started) * 1000, 1)
+        }, event="done")
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.post("/reset")
-async def reset():
-    """Reset the system"""
-    rag_system.reset()
+async def reset(collection: Optional[str] = None):
+    """Reset the system, or only one collection"""
+    await run_in_threadpool(rag_system.reset, collection)
+    await run_in_threadpool(rag_system.save_index, INDEX_DIR)
+    if collection is None:
+        # Readers move on to the new, empty version; the old data leaves the disk
+        await run_in_threadpool(prune_versions, INDEX_DIR, 1)
     return {"success": True, "message": "System reset successfully"}
 
+@app.on_event("startup")
+async def startup():
+    """Start background ingest workers, or follow new index versions in a reader"""
+    if ROLE == WRITER:
+        await ingest_jobs.start()
+    else:
+        await index_follower.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Stop ingest workers, close pooled HTTP connections and PDF worker processes"""
+    await ingest_jobs.stop()
+    await index_follower.stop()
+    if writer_client is not None:
+        await writer_client.aclose()
+    await rag_system.aclose()
+    if writer_lock is not None:
+        writer_lock.release()
+
+@app.get("/metrics")
+async def metrics():
+    """Counters and latency histograms in the Prometheus text format"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "has_document": rag_system.has_document()}
\ No newline at end of file
+    health = {"status": "healthy", "has_document": rag_system.has_document(), "role": ROLE,
+              "index_version": index_follower.version}
+    if embedding_cache:
+        health["embedding_cache"] = embedding_cache.stats()
+    if answer_cache is not None:
+        health["answer_cache"] = answer_cache.stats()
+    return health
\ No newline at end of file
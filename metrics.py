@@ -0,0 +1,247 @@
+"""Counters, latency histograms and timing spans, exposed in the Prometheus text format.
+
+Kept dependency-free and cheap (a lock and a bisect per observation) so it
+can stay on in production. Metrics are registered on REGISTRY when created;
+values computed elsewhere (cache statistics, corpus size) are read at scrape
+time through callbacks.
+"""
+import bisect
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; from in-memory lookups up to slow chat completions
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if any(m.name == metric.name for m in self._metrics):
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), registry: Optional[Registry] = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS,
+                 registry: Optional[Registry] = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: non-cumulative bucket counts (last one is +Inf), sum
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def observe(self, value: float, labels: Tuple[str, ...] = ()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+class CallbackMetric:
+    """A counter or gauge whose values are read from callback() at scrape time.
+
+    callback returns {label values tuple: value}; an empty tuple for a metric without labels.
+    """
+
+    def __init__(self, name: str, help: str, kind: str, labelnames: Sequence[str],
+                 callback: Callable[[], Dict[Tuple[str, ...], float]], registry: Optional[Registry] = REGISTRY):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        if registry is not None:
+            registry.register(self)
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in sorted(self.callback().items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+STAGE_SECONDS = Histogram("rag_stage_duration_seconds", "Duration of RAGSystem stages.", ["stage"])
+STAGE_ERRORS = Counter("rag_stage_errors_total", "Stages that raised, by exception type.", ["stage", "error"])
+API_REQUESTS = Counter("rag_openai_requests_total", "HTTP responses from the OpenAI API, retries included.",
+                       ["endpoint", "status"])
+API_TOKENS = Counter("rag_openai_tokens_total", "Tokens billed by the OpenAI API.", ["endpoint", "kind"])
+HTTP_SECONDS = Histogram("rag_http_request_duration_seconds", "Time to serve HTTP requests, streams included.",
+                         ["handler", "method", "status"])
+
+
+class span:
+    """Time a block into STAGE_SECONDS; if timings is a dict, also add the milliseconds to timings[stage].
+
+    An exception leaving the block is counted in STAGE_ERRORS and re-raised.
+    A class rather than a generator-based context manager: it is entered a
+    dozen times per question and this keeps each span to a couple of microseconds.
+    """
+    __slots__ = ("stage", "timings", "started")
+
+    def __init__(self, stage: str, timings: Optional[dict] = None):
+        self.stage = stage
+        self.timings = timings
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        STAGE_SECONDS.observe(elapsed, (self.stage,))
+        if self.timings is not None:
+            self.timings[self.stage] = round(self.timings.get(self.stage, 0.0) + elapsed * 1000, 3)
+        if exc_type is not None and issubclass(exc_type, Exception):
+            STAGE_ERRORS.inc((self.stage, exc_type.__name__))
+        return False
+
+
+def timed_iter(items: Iterable, stage: str) -> Iterator:
+    """Yield from items, timing each step (e.g. waiting for the next parsed page) as a span."""
+    iterator = iter(items)
+    while True:
+        with span(stage):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def record_tokens(endpoint: str, usage) -> None:
+    """Count the prompt/completion tokens of an API response's usage, if it has one."""
+    if usage is None:
+        return
+    API_TOKENS.inc((endpoint, "prompt"), usage.prompt_tokens)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if completion_tokens:
+        API_TOKENS.inc((endpoint, "completion"), completion_tokens)
+
+
+def _api_endpoint(response) -> str:
+    path = response.request.url.path
+    return path.rsplit("/v1/", 1)[-1].lstrip("/") or path
+
+
+def count_api_response(response) -> None:
+    """httpx response hook for the OpenAI clients."""
+    API_REQUESTS.inc((_api_endpoint(response), str(response.status_code)))
+
+
+async def acount_api_response(response) -> None:
+    count_api_response(response)
+
+
+API_EVENT_HOOKS = {"response": [count_api_response]}
+ASYNC_API_EVENT_HOOKS = {"response": [acount_api_response]}
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request until its last body chunk is sent.
+
+    Requests are labelled by handler function name, which keeps path
+    parameters (job and document ids) out of the label values.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = ["500"]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            endpoint = scope.get("endpoint")
+            handler = getattr(endpoint, "__name__", "unmatched")
+            HTTP_SECONDS.observe(time.perf_counter() - started, (handler, scope["method"], status[0]))
+
@@ -0,0 +1,155 @@
+import asyncio
+from collections import deque
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from itertools import islice
+from typing import AsyncIterator, Iterable, Iterator, List
+
+from PyPDF2 import PdfReader
+
+from index_store import Chunk
+
+# Page ranges handed to one worker process (each task re-opens the PDF, so not
+# too small), and how many ranges may be in flight
+PAGES_PER_TASK = 64
+MAX_PENDING_TASKS = 4
+
+
+@dataclass
+class PageText:
+    page_number: int  # 1-based
+    text: str
+
+
+def count_pages(pdf_path: str) -> int:
+    return len(PdfReader(pdf_path).pages)
+
+
+def extract_page_range(pdf_path: str, start: int, stop: int) -> List[str]:
+    reader = PdfReader(pdf_path)
+    return [reader.pages[i].extract_text() + "\n" for i in range(start, stop)]
+
+
+def iter_pages(pdf_path: str) -> Iterator[PageText]:
+    """Yield pages one at a time; only the current page's text is held in memory."""
+    reader = PdfReader(pdf_path)
+    for i, page in enumerate(reader.pages):
+        yield PageText(i + 1, page.extract_text() + "\n")
+
+
+def page_ranges(total_pages: int, pages_per_task: int = PAGES_PER_TASK):
+    return [(start, min(start + pages_per_task, total_pages)) for start in range(0, total_pages, pages_per_task)]
+
+
+def iter_pages_parallel(pdf_path: str, executor: Executor, pages_per_task: int = PAGES_PER_TASK,
+                        max_pending: int = MAX_PENDING_TASKS) -> Iterator[PageText]:
+    """Like iter_pages, but page ranges are extracted by executor workers.
+
+    At most max_pending ranges are in flight, so memory stays bounded no
+    matter how far the workers get ahead of the consumer. Pages are yielded
+    in document order.
+    """
+    ranges = iter(page_ranges(count_pages(pdf_path), pages_per_task))
+    pending = deque()
+
+    def submit(page_range):
+        pending.append((page_range[0], executor.submit(extract_page_range, pdf_path, *page_range)))
+
+    try:
+        for page_range in islice(ranges, max_pending):
+            submit(page_range)
+        while pending:
+            start, future = pending.popleft()
+            texts = future.result()
+            for page_range in islice(ranges, 1):
+                submit(page_range)
+            for i, text in enumerate(texts):
+                yield PageText(start + i + 1, text)
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+async def aiter_page_ranges(pdf_path: str, executor: Executor, total_pages: int, pages_per_task: int = PAGES_PER_TASK,
+                            max_pending: int = MAX_PENDING_TASKS) -> AsyncIterator[List[PageText]]:
+    """Async iter_pages_parallel yielding the pages of each range together.
+
+    The event loop stays free while workers parse; ranges come whole so the
+    caller can process each one off the loop in a single hop.
+    """
+    loop = asyncio.get_running_loop()
+    ranges = iter(page_ranges(total_pages, pages_per_task))
+    pending = deque()
+
+    def submit(page_range):
+        pending.append((page_range[0], loop.run_in_executor(executor, extract_page_range, pdf_path, *page_range)))
+
+    try:
+        for page_range in islice(ranges, max_pending):
+            submit(page_range)
+        while pending:
+            start, future = pending.popleft()
+            texts = await future
+            for page_range in islice(ranges, 1):
+                submit(page_range)
+            yield [PageText(start + i + 1, text) for i, text in enumerate(texts)]
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+def feed_pages(chunker, pages: Iterable[PageText]) -> List[Chunk]:
+    """Chunks completed by feeding pages to a chunker with feed/finish (StreamingChunker or chunker.TokenChunker)."""
+    chunks = []
+    for page in pages:
+        chunks.extend(chunker.feed(page))
+    return chunks
+
+
+class StreamingChunker:
+    """Fixed-size, overlapping character chunks over a stream of pages.
+
+    Produces exactly the spans chunk_spans would give for the concatenated
+    text, but only keeps the text of the chunk currently being filled.
+    Each chunk records the page it starts on.
+    """
+
+    def __init__(self, name: str, chunk_size: int = 1000, overlap: int = 200):
+        if not 0 <= overlap < chunk_size:
+            raise ValueError("overlap must be smaller than chunk_size")
+        self.name = name
+        self.chunk_size = chunk_size
+        self.step = chunk_size - overlap
+        self._buffer = ""
+        self._buffer_start = 0  # document offset of _buffer[0]
+        self._next_start = 0
+        self._pages = deque()  # (document offset, page number) of pages overlapping the buffer
+
+    def _page_at(self, offset: int) -> int:
+        while len(self._pages) > 1 and self._pages[1][0] <= offset:
+            self._pages.popleft()
+        return self._pages[0][1]
+
+    def _emit(self, end_limit: int) -> List[Chunk]:
+        chunks = []
+        buffer_end = self._buffer_start + len(self._buffer)
+        while self._next_start < buffer_end and self._next_start + self.chunk_size <= end_limit:
+            start = self._next_start
+            end = min(start + self.chunk_size, buffer_end)
+            text = self._buffer[start - self._buffer_start:end - self._buffer_start]
+            chunks.append(Chunk(text, start, end, {"source": self.name, "page": self._page_at(start)}))
+            self._next_start += self.step
+        drop = min(self._next_start, buffer_end) - self._buffer_start
+        if drop > 0:
+            self._buffer = self._buffer[drop:]
+            self._buffer_start += drop
+        return chunks
+
+    def feed(self, page: PageText) -> List[Chunk]:
+        self._pages.append((self._buffer_start + len(self._buffer), page.page_number))
+        self._buffer += page.text
+        return self._emit(self._buffer_start + len(self._buffer))
+
+    def finish(self) -> List[Chunk]:
+        return self._emit(float("inf"))
+
@@ -1,94 +1,564 @@
-from openai import OpenAI
-from PyPDF2 import PdfReader
-import numpy as np
-from typing import List
+from openai import APIConnectionError, APITimeoutError, AsyncOpenAI, InternalServerError, OpenAI, RateLimitError
+import asyncio
+import httpx
+import logging
+import os
+from contextlib import aclosing
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+from corpus import Corpus, Document, DEFAULT_COLLECTION
+from answer_cache import AnswerCache, normalize_question
+from chunker import DEFAULT_MAX_TOKENS, DEFAULT_OVERLAP_TOKENS, TokenChunker
+from context_builder import ContextBuilder, count_prompt_tokens
+from embedding_cache import EmbeddingCache
+from embedding_pipeline import EmbeddingPipeline, EMBEDDING_MODEL
+from index_store import Chunk
+from metrics import API_EVENT_HOOKS, API_TOKENS, ASYNC_API_EVENT_HOOKS, record_tokens, span, timed_iter
+from pdf_extract import StreamingChunker, aiter_page_ranges, count_pages, feed_pages, iter_pages, iter_pages_parallel
+
+logger = logging.getLogger(__name__)
+
+CHAT_MODEL = "gpt-4o-mini"
+SYSTEM_PROMPT = "You are a helpful assistant that answers questions based on the provided context. If the answer cannot be found in the context, say so clearly."
+
+# One pooled HTTP connection set per client, shared by every request
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+# Retrieval modes: embeddings only, BM25 only (no embedding call), or both fused
+DENSE = "dense"
+LEXICAL = "lexical"
+HYBRID = "hybrid"
+RETRIEVAL_MODES = (DENSE, LEXICAL, HYBRID)
+# Query embedding failures after which hybrid retrieval continues lexical-only
+QUERY_EMBEDDING_ERRORS = (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)
+
+# Chunks retrieved per question; the context builder keeps what fits its token budget
+ANSWER_TOP_K = 8
+
+# Chat completions in flight at once for a batch of questions
+BATCH_CONCURRENCY = 8
+
+# Chunks embedded and published to the corpus per ingest step: small enough that a typical PDF
+# (a few hundred chunks) becomes searchable and reports progress several times before ingest ends
+CHUNKS_PER_STEP = 128
+
+def chunk_spans(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[Tuple[int, int]]:
+    spans = []
+    start = 0
+    text_length = len(text)
+    
+    while start < text_length:
+        end = min(start + chunk_size, text_length)
+        spans.append((start, end))
+        start += chunk_size - overlap
+    
+    return spans
+
+def build_messages(question: str, context: str) -> List[dict]:
+    return [
+        {
+            "role": "system",
+            "content": SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": f"Context:\n{context}\n\nQuestion: {question}\n\nAnswer based on the context above:"
+        }
+    ]
 
 class RAGSystem:
-    def __init__(self, api_key: str):
-        self.client = OpenAI(api_key=api_key)
-        self.chunks = []
-        self.embeddings = []
+    def __init__(self, api_key: str, embedding_cache: Optional[EmbeddingCache] = None, corpus: Optional[Corpus] = None,
+                 cpu_workers: Optional[int] = None, answer_cache: Optional[AnswerCache] = None,
+                 retrieval_mode: str = HYBRID, chunk_tokens: int = DEFAULT_MAX_TOKENS,
+                 chunk_overlap_tokens: int = DEFAULT_OVERLAP_TOKENS, context_builder: Optional[ContextBuilder] = None,
+                 answer_top_k: int = ANSWER_TOP_K):
+        self.client = OpenAI(api_key=api_key, http_client=httpx.Client(
+            limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT, event_hooks=API_EVENT_HOOKS))
+        self.async_client = AsyncOpenAI(api_key=api_key, http_client=httpx.AsyncClient(
+            limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT, event_hooks=ASYNC_API_EVENT_HOOKS))
+        self.embedding_cache = embedding_cache
+        self.embedder = EmbeddingPipeline(self.client, cache=embedding_cache, async_client=self.async_client)
+        self.corpus = corpus if corpus is not None else Corpus()
+        self.answer_cache = answer_cache
+        self.retrieval_mode = retrieval_mode
+        self._check_mode(retrieval_mode)
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap_tokens = chunk_overlap_tokens
+        self.context_builder = context_builder or ContextBuilder()
+        self.answer_top_k = answer_top_k
+        self.cpu_workers = cpu_workers
+        self._cpu_pool: Optional[Executor] = None
+    
+    @property
+    def cpu_pool(self) -> Executor:
+        """Worker processes for PDF parsing and chunking, created on first use."""
+        if self._cpu_pool is None:
+            self._cpu_pool = ProcessPoolExecutor(max_workers=self.cpu_workers)
+        return self._cpu_pool
     
     def extract_text_from_pdf(self, pdf_path: str) -> str:
-        reader = PdfReader(pdf_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        with span("extract"):
+            return "".join(page.text for page in iter_pages(pdf_path))
+    
+    def chunk_spans(self, text: str, chunk_size: int = 1000, overlap: int = 200) -> List[Tuple[int, int]]:
+        return chunk_spans(text, chunk_size, overlap)
     
     def chunk_text(self, text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
-        chunks = []
-        start = 0
-        text_length = len(text)
-        
-        while start < text_length:
-            end = min(start + chunk_size, text_length)
-            chunks.append(text[start:end])
-            start += chunk_size - overlap
-        
-        return chunks
+        with span("chunk"):
+            return [text[start:end] for start, end in chunk_spans(text, chunk_size, overlap)]
+    
+    def new_chunker(self, name: str):
+        """Token-budgeted chunker for ingest; chunk_tokens=0 selects the fixed 1000-character windows."""
+        if not self.chunk_tokens:
+            return StreamingChunker(name)
+        return TokenChunker(name, self.chunk_tokens, self.chunk_overlap_tokens)
     
     def get_embedding(self, text: str) -> List[float]:
         response = self.client.embeddings.create(
-            model="text-embedding-3-small",
+            model=EMBEDDING_MODEL,
             input=text
         )
+        record_tokens("embeddings", response.usage)
         return response.data[0].embedding
     
-    def cosine_similarity(self, a: List[float], b: List[float]) -> float:
-        a = np.array(a)
-        b = np.array(b)
-        return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
-    
-    def process_pdf(self, pdf_path: str) -> int:
-        text = self.extract_text_from_pdf(pdf_path)
-        self.chunks = self.chunk_text(text)
-        
-        self.embeddings = []
-        for chunk in self.chunks:
-            embedding = self.get_embedding(chunk)
-            self.embeddings.append(embedding)
-        
-        return len(self.chunks)
-    
-    def find_relevant_chunks(self, question: str, top_k: int = 3) -> List[str]:
-        question_embedding = self.get_embedding(question)
-        
-        similarities = []
-        for i, emb in enumerate(self.embeddings):
-            sim = self.cosine_similarity(question_embedding, emb)
-            similarities.append((sim, i))
-        
-        similarities.sort(reverse=True)
-        top_indices = [idx for _, idx in similarities[:top_k]]
-        
-        return [self.chunks[i] for i in top_indices]
-    
-    def answer_question(self, question: str) -> str:
-        relevant_chunks = self.find_relevant_chunks(question)
-        context = "\n\n".join(relevant_chunks)
-        
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a helpful assistant that answers questions based on the provided context. If the answer cannot be found in the context, say so clearly."
-                },
-                {
-                    "role": "user",
-                    "content": f"Context:\n{context}\n\nQuestion: {question}\n\nAnswer based on the context above:"
-                }
-            ],
-            temperature=0.7,
-            max_tokens=500
+    async def aget_embedding(self, text: str) -> List[float]:
+        response = await self.async_client.embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=text
         )
+        record_tokens("embeddings", response.usage)
+        return response.data[0].embedding
+    
+    def process_pdf(self, pdf_path: str, collection: str = DEFAULT_COLLECTION, name: Optional[str] = None,
+                    parallel: bool = False) -> Document:
+        """Extract, chunk and embed a PDF as a pipeline, publishing chunks step by step.
+        
+        With parallel=True page ranges are extracted in the worker process pool.
+        """
+        name = name or os.path.basename(pdf_path)
+        pages = iter_pages_parallel(pdf_path, self.cpu_pool) if parallel else iter_pages(pdf_path)
+        document = self.corpus.create_document(name, collection)
+        step = []
+        try:
+            with span("ingest"):
+                chunker = self.new_chunker(name)
+                for page in timed_iter(pages, "extract_page"):
+                    with span("chunk"):
+                        step.extend(chunker.feed(page))
+                    if len(step) >= CHUNKS_PER_STEP:
+                        self._publish(document.doc_id, step)
+                        step = []
+                with span("chunk"):
+                    step.extend(chunker.finish())
+                if step:
+                    self._publish(document.doc_id, step)
+        except BaseException:
+            self.corpus.delete_document(document.doc_id)
+            raise
+        return self.corpus.get_document(document.doc_id) or document
+    
+    def _publish(self, doc_id: str, chunks: List[Chunk]):
+        with span("ingest_embed"):
+            vectors = self.embedder.embed([chunk.text for chunk in chunks])
+        with span("ingest_index"):
+            self.corpus.append_chunks(doc_id, chunks, vectors)
+    
+    async def aprocess_pdf(self, pdf_path: str, collection: str = DEFAULT_COLLECTION, name: Optional[str] = None,
+                           progress: Optional[Callable[..., None]] = None) -> Document:
+        """Ingest a PDF without blocking the event loop.
+        
+        Pages are parsed in worker processes and each page range is chunked
+        in a thread, so neither runs on the event loop; every CHUNKS_PER_STEP
+        chunks are embedded and published to the corpus while later pages
+        are still being parsed, so the document is searchable before ingest
+        ends. progress, if given, is called with
+        keyword updates (stage, pages_total, pages_parsed, chunks_total,
+        chunks_embedded, document_id). If the task is cancelled or fails, the
+        partially added document is removed.
+        """
+        report = progress or (lambda **fields: None)
+        name = name or os.path.basename(pdf_path)
+        
+        total_pages = await asyncio.to_thread(count_pages, pdf_path)
+        # Corpus writes wait for the writer lock, which a save of the whole index may hold
+        document = await asyncio.to_thread(self.corpus.create_document, name, collection)
+        report(stage="parsing", pages_total=total_pages, pages_parsed=0, document_id=document.doc_id)
+        chunker = self.new_chunker(name)
+        step = []
+        chunks_embedded = 0
+        
+        async def publish(chunks):
+            nonlocal chunks_embedded
+            with span("ingest_embed"):
+                vectors = await self.embedder.aembed([chunk.text for chunk in chunks])
+            with span("ingest_index"):
+                await asyncio.to_thread(self.corpus.append_chunks, document.doc_id, chunks, vectors)
+            chunks_embedded += len(chunks)
+            report(chunks_embedded=chunks_embedded)
+        
+        try:
+            with span("ingest"):
+                async with aclosing(aiter_page_ranges(pdf_path, self.cpu_pool, total_pages)) as ranges:
+                    async for pages in ranges:
+                        # Chunking a whole range is CPU-bound, so it runs off the event loop
+                        with span("chunk"):
+                            step.extend(await asyncio.to_thread(feed_pages, chunker, pages))
+                        report(pages_parsed=pages[-1].page_number, chunks_total=chunks_embedded + len(step))
+                        while len(step) >= CHUNKS_PER_STEP:
+                            await publish(step[:CHUNKS_PER_STEP])
+                            step = step[CHUNKS_PER_STEP:]
+                with span("chunk"):
+                    step.extend(await asyncio.to_thread(chunker.finish))
+                report(stage="embedding", chunks_total=chunks_embedded + len(step))
+                if step:
+                    await publish(step)
+        except BaseException:
+            await asyncio.to_thread(self.corpus.delete_document, document.doc_id)
+            raise
+        report(stage="done")
+        return self.corpus.get_document(document.doc_id) or document
+    
+    def _check_mode(self, mode: Optional[str]) -> str:
+        mode = mode or self.retrieval_mode
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}; expected one of {', '.join(RETRIEVAL_MODES)}")
+        return mode
+    
+    def _embed_question(self, question: str, mode: str,
+                        timings: Optional[dict] = None) -> Tuple[Optional[List[float]], str]:
+        """Query embedding for the mode (None in lexical mode) and the mode actually used.
+        
+        Hybrid retrieval degrades to lexical-only when the embeddings API is unavailable.
+        """
+        if mode == LEXICAL:
+            return None, mode
+        try:
+            with span("embed_question", timings):
+                return self.get_embedding(question), mode
+        except QUERY_EMBEDDING_ERRORS:
+            if mode != HYBRID:
+                raise
+            logger.warning("Query embedding failed; falling back to lexical retrieval", exc_info=True)
+            return None, LEXICAL
+    
+    async def _aembed_question(self, question: str, mode: str,
+                               timings: Optional[dict] = None) -> Tuple[Optional[List[float]], str]:
+        if mode == LEXICAL:
+            return None, mode
+        try:
+            with span("embed_question", timings):
+                return await self.aget_embedding(question), mode
+        except QUERY_EMBEDDING_ERRORS:
+            if mode != HYBRID:
+                raise
+            logger.warning("Query embedding failed; falling back to lexical retrieval", exc_info=True)
+            return None, LEXICAL
+    
+    def _search(self, questions: List[str], question_embeddings, top_k: int, collections: Optional[Iterable[str]],
+                document_ids: Optional[Iterable[str]], mode: str,
+                timings: Optional[dict] = None) -> List[List[Tuple[Chunk, float]]]:
+        with span(f"search_{mode}", timings):
+            if mode == LEXICAL:
+                return self.corpus.lexical_search(questions, top_k, collections, document_ids)
+            if mode == HYBRID:
+                return self.corpus.hybrid_search(questions, question_embeddings, top_k, collections, document_ids)
+            return self.corpus.search(question_embeddings, top_k, collections, document_ids)
+    
+    def retrieve(self, question: str, top_k: int = 3, collections: Optional[Iterable[str]] = None,
+                 document_ids: Optional[Iterable[str]] = None, mode: Optional[str] = None) -> List[Tuple[Chunk, float]]:
+        question_embedding, mode = self._embed_question(question, self._check_mode(mode))
+        return self._search([question], [question_embedding], top_k, collections, document_ids, mode)[0]
+    
+    def find_relevant_chunks(self, question: str, top_k: int = 3, collections: Optional[Iterable[str]] = None,
+                             document_ids: Optional[Iterable[str]] = None, mode: Optional[str] = None) -> List[str]:
+        return [chunk.text for chunk, _ in self.retrieve(question, top_k, collections, document_ids, mode)]
+    
+    async def aretrieve(self, question: str, top_k: int = 3, collections: Optional[Iterable[str]] = None,
+                        document_ids: Optional[Iterable[str]] = None, mode: Optional[str] = None) -> List[Tuple[Chunk, float]]:
+        question_embedding, mode = await self._aembed_question(question, self._check_mode(mode))
+        results = await asyncio.to_thread(self._search, [question], [question_embedding], top_k, collections, document_ids, mode)
+        return results[0]
+    
+    def _prompt(self, question: str, question_embedding, collections: Optional[Iterable[str]],
+                document_ids: Optional[Iterable[str]], mode: str, usage: Optional[dict],
+                timings: Optional[dict] = None) -> List[dict]:
+        """Retrieve answer_top_k chunks and build the chat messages from a token-budgeted context."""
+        hits = self._search([question], [question_embedding], self.answer_top_k, collections, document_ids, mode,
+                            timings)[0]
+        return self._messages(question, hits, usage, timings)
+    
+    def _messages(self, question: str, hits: List[Tuple[Chunk, float]], usage: Optional[dict],
+                  timings: Optional[dict] = None) -> List[dict]:
+        with span("build_context", timings):
+            context = self.context_builder.build(hits)
+            messages = build_messages(question, context.text)
+            if usage is not None:
+                usage.update(context.usage(), cached=False,
+                             prompt_tokens=count_prompt_tokens(messages, self.context_builder.counter))
+        return messages
+    
+    @staticmethod
+    def _record_usage(usage: Optional[dict], response_usage):
+        if usage is not None and response_usage is not None:
+            usage.update(prompt_tokens=response_usage.prompt_tokens, completion_tokens=response_usage.completion_tokens)
+    
+    def answer_question(self, question: str, collections: Optional[Iterable[str]] = None,
+                        document_ids: Optional[Iterable[str]] = None, mode: Optional[str] = None,
+                        usage: Optional[dict] = None, timings: Optional[dict] = None) -> str:
+        """Answer from the documents; if usage is a dict, prompt size and context statistics are added to it.
+        
+        If timings is a dict, the milliseconds spent in each stage are added to it.
+        """
+        mode = self._check_mode(mode)
+        scope = self.corpus.cache_scope(collections, document_ids)
+        if self.answer_cache is not None:
+            with span("answer_cache", timings):
+                cached = self.answer_cache.get(scope, question, count_miss=False)
+            if cached is not None:
+                return self._cached(cached, usage)
+        
+        question_embedding, mode = self._embed_question(question, mode, timings)
+        if self.answer_cache is not None:
+            cached = self._similar_answer(scope, question_embedding, timings)
+            if cached is not None:
+                return self._cached(cached, usage)
         
+        messages = self._prompt(question, question_embedding, collections, document_ids, mode, usage, timings)
+        with span("chat_completion", timings):
+            response = self.client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=500
+            )
+        
+        answer = response.choices[0].message.content
+        record_tokens("chat/completions", response.usage)
+        self._record_usage(usage, response.usage)
+        if self.answer_cache is not None:
+            self.answer_cache.put(scope, question, answer, question_embedding)
+        return answer
+    
+    def _similar_answer(self, scope: tuple, question_embedding, timings: Optional[dict] = None) -> Optional[str]:
+        """Semantic answer-cache lookup after an exact miss; without an embedding (lexical mode) only counts the miss."""
+        if question_embedding is None:
+            self.answer_cache.record_miss()
+            return None
+        with span("answer_cache", timings):
+            return self.answer_cache.get_similar(scope, question_embedding)
+    
+    @staticmethod
+    def _cached(answer: str, usage: Optional[dict]) -> str:
+        if usage is not None:
+            usage.update(cached=True, prompt_tokens=0)
+        return answer
+    
+    async def _acached_answer(self, scope: tuple, question: str, mode: str,
+                              timings: Optional[dict] = None) -> Tuple[Optional[str], Optional[List[float]], str]:
+        """Answer-cache lookup for the async paths; returns (cached answer, question embedding, mode)."""
+        if self.answer_cache is not None:
+            with span("answer_cache", timings):
+                cached = self.answer_cache.get(scope, question, count_miss=False)
+            if cached is not None:
+                return cached, None, mode
+        question_embedding, mode = await self._aembed_question(question, mode, timings)
+        if self.answer_cache is not None:
+            return self._similar_answer(scope, question_embedding, timings), question_embedding, mode
+        return None, question_embedding, mode
+    
+    async def aanswer_question(self, question: str, collections: Optional[Iterable[str]] = None,
+                               document_ids: Optional[Iterable[str]] = None, mode: Optional[str] = None,
+                               usage: Optional[dict] = None, timings: Optional[dict] = None) -> str:
+        scope = self.corpus.cache_scope(collections, document_ids)
+        cached, question_embedding, mode = await self._acached_answer(scope, question, self._check_mode(mode), timings)
+        if cached is not None:
+            return self._cached(cached, usage)
+        
+        messages = await asyncio.to_thread(self._prompt, question, question_embedding, collections, document_ids, mode,
+                                           usage, timings)
+        answer = await self._acomplete(messages, usage, timings)
+        if self.answer_cache is not None:
+            self.answer_cache.put(scope, question, answer, question_embedding)
+        return answer
+    
+    async def _acomplete(self, messages: List[dict], usage: Optional[dict], timings: Optional[dict] = None) -> str:
+        with span("chat_completion", timings):
+            response = await self.async_client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=500
+            )
+        record_tokens("chat/completions", response.usage)
+        self._record_usage(usage, response.usage)
         return response.choices[0].message.content
     
-    def has_document(self) -> bool:
-        return len(self.chunks) > 0
+    async def aanswer_batch(self, questions: List[str], collections: Optional[Iterable[str]] = None,
+                            document_ids: Optional[Iterable[str]] = None, mode: Optional[str] = None,
+                            concurrency: int = BATCH_CONCURRENCY) -> AsyncIterator[Tuple[int, dict]]:
+        """Answer many questions, yielding (index, result) in the order answers finish.
+        
+        Retrieval is shared: questions not in the answer cache are embedded
+        together (one request for up to the embedding batch budget) and scored
+        against the corpus in one search call, a single matrix multiply for
+        exact dense search. Repeated questions are answered once. At most
+        concurrency chat completions run at a time. A result is
+        {"answer", "usage"}, or {"error"} if that question's completion failed.
+        """
+        mode = self._check_mode(mode)
+        scope = self.corpus.cache_scope(collections, document_ids)
+        groups: Dict[str, List[int]] = {}
+        for i, question in enumerate(questions):
+            groups.setdefault(normalize_question(question), []).append(i)
+        
+        def answered(indices: List[int], answer: str, usage: dict):
+            return [(i, {"answer": answer, "usage": usage}) for i in indices]
+        
+        pending = []
+        for indices in groups.values():
+            cached = None
+            if self.answer_cache is not None:
+                cached = self.answer_cache.get(scope, questions[indices[0]], count_miss=False)
+            if cached is None:
+                pending.append(indices)
+                continue
+            usage = {}
+            for item in answered(indices, self._cached(cached, usage), usage):
+                yield item
+        if not pending:
+            return
+        
+        embeddings = [None] * len(pending)
+        if mode != LEXICAL:
+            try:
+                with span("embed_question"):
+                    # Questions bypass the embedding cache, which holds chunk vectors
+                    texts = [questions[indices[0]] for indices in pending]
+                    embeddings = list(await self.embedder.aembed(texts, use_cache=False))
+            except QUERY_EMBEDDING_ERRORS:
+                if mode != HYBRID:
+                    raise
+                logger.warning("Batch query embedding failed; falling back to lexical retrieval", exc_info=True)
+                mode = LEXICAL
+        if self.answer_cache is not None and mode == LEXICAL:
+            self.answer_cache.record_miss(len(pending))
+        elif self.answer_cache is not None:
+            remaining = []
+            for indices, embedding in zip(pending, embeddings):
+                cached = self.answer_cache.get_similar(scope, embedding)
+                if cached is None:
+                    remaining.append((indices, embedding))
+                    continue
+                usage = {}
+                for item in answered(indices, self._cached(cached, usage), usage):
+                    yield item
+            if not remaining:
+                return
+            pending, embeddings = [indices for indices, _ in remaining], [embedding for _, embedding in remaining]
+        
+        texts = [questions[indices[0]] for indices in pending]
+        hits = await asyncio.to_thread(self._search, texts, embeddings if mode != LEXICAL else None,
+                                       self.answer_top_k, collections, document_ids, mode)
+        usages = [{} for _ in pending]
+        messages = await asyncio.to_thread(
+            lambda: [self._messages(text, doc_hits, usage) for text, doc_hits, usage in zip(texts, hits, usages)])
+        
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        
+        async def complete(position: int):
+            async with semaphore:
+                try:
+                    answer = await self._acomplete(messages[position], usages[position])
+                except Exception as e:
+                    logger.warning("Batch completion failed", exc_info=True)
+                    return position, None, f"{type(e).__name__}: {e}"
+            if self.answer_cache is not None:
+                self.answer_cache.put(scope, texts[position], answer, embeddings[position])
+            return position, answer, None
+        
+        tasks = [asyncio.ensure_future(complete(position)) for position in range(len(pending))]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                position, answer, error = await finished
+                if error is not None:
+                    for i in pending[position]:
+                        yield i, {"error": error}
+                    continue
+                for item in answered(pending[position], answer, usages[position]):
+                    yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def astream_answer(self, question: str, collections: Optional[Iterable[str]] = None,
+                             document_ids: Optional[Iterable[str]] = None, mode: Optional[str] = None,
+                             usage: Optional[dict] = None, timings: Optional[dict] = None) -> AsyncIterator[str]:
+        """Yield answer text fragments as the model produces them (a cached answer comes as one fragment).
+        
+        usage, if given, gets the estimated prompt tokens and context statistics; timings, the
+        milliseconds per stage, with chat_completion running until the last fragment.
+        """
+        scope = self.corpus.cache_scope(collections, document_ids)
+        cached, question_embedding, mode = await self._acached_answer(scope, question, self._check_mode(mode), timings)
+        if cached is not None:
+            yield self._cached(cached, usage)
+            return
+        
+        # Streamed completions report no usage: prompt tokens are estimated, one completion token per fragment
+        usage = {} if usage is None else usage
+        messages = await asyncio.to_thread(self._prompt, question, question_embedding, collections, document_ids, mode,
+                                           usage, timings)
+        API_TOKENS.inc(("chat/completions", "prompt"), usage["prompt_tokens"])
+        parts = []
+        with span("chat_completion", timings):
+            stream = await self.async_client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=500,
+                stream=True
+            )
+            try:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+            finally:
+                API_TOKENS.inc(("chat/completions", "completion"), len(parts))
+        if self.answer_cache is not None:
+            self.answer_cache.put(scope, question, "".join(parts), question_embedding)
+    
+    def delete_document(self, doc_id: str) -> bool:
+        return self.corpus.delete_document(doc_id)
+    
+    def save_index(self, directory: str):
+        self.corpus.save(directory, EMBEDDING_MODEL)
+    
+    def load_index(self, directory: str) -> bool:
+        return self.corpus.load(directory, EMBEDDING_MODEL)
+    
+    def has_document(self, collections: Optional[Iterable[str]] = None, document_ids: Optional[Iterable[str]] = None) -> bool:
+        if collections is None and document_ids is None:
+            return len(self.corpus) > 0
+        collections = set(collections) if collections is not None else None
+        document_ids = set(document_ids) if document_ids is not None else None
+        return any(
+            (collections is None or doc.collection in collections) and (document_ids is None or doc.doc_id in document_ids)
+            for doc in self.corpus.list_documents()
+        )
+    
+    async def aclose(self):
+        await self.async_client.close()
+        self.client.close()
+        if self._cpu_pool is not None:
+            self._cpu_pool.shutdown(wait=False, cancel_futures=True)
+            self._cpu_pool = None
     
-    def reset(self):
-        self.chunks = []
-        self.embeddings = []
\ No newline at end of file
+    def reset(self, collection: Optional[str] = None):
+        if collection is None:
+            self.corpus.clear()
+            if self.answer_cache is not None:
+                self.answer_cache.clear()
+        else:
+            self.corpus.delete_collection(collection)
\ No newline at end of file
@@ -0,0 +1,189 @@
+"""Serving one index from several processes.
+
+A single writer process ingests, deletes and resets, and saves every change
+as a new version of the index directory (see index_store.save_index).
+Reader processes only answer questions: they memory-map the current
+version, so all of them share one copy of the vectors, postings and chunk
+texts in the page cache, switch to newer versions as the writer publishes
+them (reading only the segments added since), and forward write requests
+to the writer.
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Awaitable, Callable, Iterable, Optional, Tuple
+
+import httpx
+
+from index_store import current_index
+from rag_system import RAGSystem
+
+try:
+    import fcntl
+except ImportError:  # optional: not available on Windows, where the writer lock is not enforced
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+WRITER = "writer"
+READER = "reader"
+ROLES = (WRITER, READER)
+LOCK_FILE = "writer.lock"
+# Response headers that describe the writer's connection or encoding, not the content relayed
+_HOP_HEADERS = {"connection", "content-encoding", "content-length", "keep-alive", "transfer-encoding"}
+
+
+class WriterLockedError(Exception):
+    pass
+
+
+class WriterLock:
+    """Exclusive lock on an index directory, held for its lifetime by the one process allowed to write it."""
+
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, LOCK_FILE)
+        self._file = None
+
+    def acquire(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "a")
+        if fcntl is None:
+            return
+        try:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._file.close()
+            self._file = None
+            raise WriterLockedError(
+                f"Another process is already writing the index in {os.path.dirname(self.path)}; "
+                f"start query workers with RAG_ROLE={READER}"
+            ) from None
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class IndexFollower:
+    """Keeps a reader's RAGSystem on the current index version, polling for new ones every interval seconds.
+
+    Searches keep running on the previous version while the next one is
+    loaded; rows of the previous version are kept, so loading reads only
+    the segments added since.
+    """
+
+    def __init__(self, rag_system: RAGSystem, directory: str, interval: float = 1.0):
+        self.rag_system = rag_system
+        self.directory = directory
+        self.interval = interval
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def version(self) -> Optional[str]:
+        path = self.rag_system.corpus.index_path
+        return os.path.basename(path) if path else None
+
+    async def refresh(self) -> bool:
+        """Load the current version if it is not the loaded one; True if the index changed."""
+        async with self._lock:
+            path = current_index(self.directory)
+            if path == self.rag_system.corpus.index_path:
+                return False
+            if path is None:
+                # The writer removed the index
+                await asyncio.to_thread(self.rag_system.reset)
+                self.rag_system.corpus.index_path = None
+            else:
+                await asyncio.to_thread(self.rag_system.load_index, self.directory)
+            logger.info("Serving index version %s", self.version)
+            return True
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                # Keep serving the loaded version; a version removed while it was loading is retried
+                logger.warning("Could not load the index from %s", self.directory, exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class WriteForwarder:
+    """ASGI middleware of reader processes sending write requests on to the writer process.
+
+    routes are (method, path) pairs; method None matches any method and a
+    path ending in "/" matches everything below it. The writer's response is
+    relayed as it is. Without a writer client, writes are refused with 503.
+    After a successful write, on_forwarded (e.g. IndexFollower.refresh) is
+    awaited before responding, so this process already serves the writer's
+    new version when the client gets the response.
+    """
+
+    def __init__(self, app, routes: Iterable[Tuple[Optional[str], str]], client: Optional[httpx.AsyncClient],
+                 on_forwarded: Optional[Callable[[], Awaitable]] = None):
+        self.app = app
+        self.routes = list(routes)
+        self.client = client
+        self.on_forwarded = on_forwarded
+
+    def _is_write(self, method: str, path: str) -> bool:
+        for route_method, route_path in self.routes:
+            if route_method is not None and route_method != method:
+                continue
+            if path == route_path or (route_path.endswith("/") and path.startswith(route_path)):
+                return True
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._is_write(scope["method"], scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        if self.client is None:
+            await self._respond(send, 503, [(b"content-type", b"application/json")], json.dumps(
+                {"detail": "This process only answers questions; send writes to the ingest process"}).encode())
+            return
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                break
+        headers = [(k, v) for k, v in scope["headers"] if k.lower() not in (b"host", b"content-length")]
+        url = scope["path"] + ("?" + scope["query_string"].decode("latin-1") if scope["query_string"] else "")
+        try:
+            response = await self.client.request(scope["method"], url, headers=headers, content=bytes(body))
+        except httpx.HTTPError as e:
+            await self._respond(send, 502, [(b"content-type", b"application/json")], json.dumps(
+                {"detail": f"Ingest process unreachable: {e}"}).encode())
+            return
+        if response.is_success and self.on_forwarded is not None:
+            try:
+                await self.on_forwarded()
+            except Exception:
+                logger.warning("Refreshing the index after a forwarded write failed", exc_info=True)
+        relayed = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in response.headers.multi_items()
+                   if k.lower() not in _HOP_HEADERS]
+        await self._respond(send, response.status_code, relayed, response.content)
+
+    @staticmethod
+    async def _respond(send, status: int, headers: list, body: bytes):
+        headers = headers + [(b"content-length", str(len(body)).encode("ascii"))]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,107 @@
+"""In-process stand-ins for the OpenAI clients, so tests need no server."""
+import asyncio
+import hashlib
+import time
+from types import SimpleNamespace
+from typing import Callable, List, Optional
+
+import httpx
+import numpy as np
+import openai
+
+from embedding_cache import EmbeddingCache
+from embedding_pipeline import EmbeddingPipeline
+from rag_system import RAGSystem
+
+DIM = 8
+
+
+def fake_embedding(text: str) -> List[float]:
+    """A deterministic unit vector per text."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).normal(size=DIM)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def rate_limit_error(retry_after: Optional[str] = None) -> openai.RateLimitError:
+    headers = {"retry-after": retry_after} if retry_after is not None else {}
+    response = httpx.Response(429, headers=headers, request=httpx.Request("POST", "https://stub/v1/embeddings"))
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+class StubEmbeddings:
+    """embeddings.create: records every input and raises the queued errors first.
+
+    Response data is returned in reverse order, as the API does not promise
+    to keep it sorted. delay(texts), if given, is how long a call takes.
+    """
+
+    def __init__(self, errors: Optional[List[Exception]] = None, delay: Optional[Callable[[List[str]], float]] = None,
+                 asynchronous: bool = False):
+        self.errors = list(errors or [])
+        self.delay = delay
+        self.asynchronous = asynchronous
+        self.calls: List[List[str]] = []
+        self.completed: List[List[str]] = []
+
+    def _respond(self, texts: List[str]):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.completed.append(texts)
+        data = [SimpleNamespace(index=i, embedding=fake_embedding(text)) for i, text in enumerate(texts)]
+        return SimpleNamespace(data=data[::-1], usage=SimpleNamespace(prompt_tokens=len(texts)))
+
+    def create(self, model: str, input):
+        texts = [input] if isinstance(input, str) else list(input)
+        self.calls.append(texts)
+        if not self.asynchronous:
+            if self.delay is not None:
+                time.sleep(self.delay(texts))
+            return self._respond(texts)
+
+        async def respond():
+            if self.delay is not None:
+                await asyncio.sleep(self.delay(texts))
+            return self._respond(texts)
+        return respond()
+
+
+class StubCompletions:
+    """chat.completions.create answering with the prompt's last message, so tests can see the context."""
+
+    def __init__(self, asynchronous: bool = False):
+        self.asynchronous = asynchronous
+        self.calls: List[List[dict]] = []
+
+    def create(self, model: str, messages: List[dict], **options):
+        self.calls.append(messages)
+        response = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=messages[-1]["content"]))],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=2, total_tokens=12),
+        )
+        if not self.asynchronous:
+            return response
+
+        async def respond():
+            return response
+        return respond()
+
+
+class StubClient:
+    """The parts of OpenAI / AsyncOpenAI the pipeline and RAGSystem call."""
+
+    def __init__(self, embeddings: Optional[StubEmbeddings] = None, asynchronous: bool = False):
+        self.embeddings = embeddings or StubEmbeddings(asynchronous=asynchronous)
+        self.chat = SimpleNamespace(completions=StubCompletions(asynchronous))
+
+    def with_options(self, **options) -> "StubClient":
+        return self
+
+
+def stub_rag_system(embedding_cache: Optional[EmbeddingCache] = None, **options) -> RAGSystem:
+    """A RAGSystem whose clients are stubs; options are passed to RAGSystem."""
+    rag = RAGSystem("test-key", embedding_cache=embedding_cache, **options)
+    rag.client = StubClient()
+    rag.async_client = StubClient(asynchronous=True)
+    rag.embedder = EmbeddingPipeline(rag.client, cache=embedding_cache, async_client=rag.async_client)
+    return rag
@@ -0,0 +1,55 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from answer_cache import AnswerCache
+from index_store import Chunk
+from rag_system import DENSE, LEXICAL
+from stubs import stub_rag_system
+
+
+def counts(cache: AnswerCache) -> tuple:
+    stats = cache.stats()
+    return stats["exact_hits"], stats["semantic_hits"], stats["misses"], stats["hit_rate"]
+
+
+def test_each_lookup_path_counts_once():
+    cache = AnswerCache(similarity_threshold=0.9)
+    vector = np.array([1.0, 0.0, 0.0])
+    cache.put("scope", "What is the limit?", "ten", vector)
+    assert cache.get("scope", "what is the limit") == "ten"
+    # A lookup with no semantic step counts its own miss
+    assert cache.get("scope", "unrelated") is None
+    assert counts(cache) == (1, 0, 1, 0.5)
+    # Exact miss then semantic lookup: one miss, counted by get_similar
+    assert cache.get("scope", "other question", count_miss=False) is None
+    assert cache.get_similar("scope", [0.0, 1.0, 0.0]) is None
+    assert counts(cache) == (1, 0, 2, 0.3333)
+    assert cache.get("scope", "how high is the limit", count_miss=False) is None
+    assert cache.get_similar("scope", [0.99, 0.1, 0.0]) == "ten"
+    assert counts(cache) == (1, 1, 2, 0.5)
+
+
+def rag_with_document(mode: str):
+    rag = stub_rag_system(answer_cache=AnswerCache(), retrieval_mode=mode)
+    texts = ["the limit is ten requests", "retries back off exponentially"]
+    rag.corpus.add_document("doc.pdf", [Chunk(text, 0, len(text)) for text in texts], rag.embedder.embed(texts))
+    return rag
+
+
+@pytest.mark.parametrize("mode", [LEXICAL, DENSE])
+def test_rag_system_counts_one_miss_per_unanswered_question(mode):
+    rag = rag_with_document(mode)
+    for question in ["What is the limit?", "what is the limit", "How do retries work?", "Who wrote it?"]:
+        rag.answer_question(question)
+    assert counts(rag.answer_cache) == (1, 0, 3, 0.25)
+    asyncio.run(rag.aanswer_question("Is there a quota?"))
+    assert counts(rag.answer_cache) == (1, 0, 4, 0.2)
+
+    async def batch():
+        return [item async for item in rag.aanswer_batch(["who wrote it", "New one?", "new one"])]
+
+    assert len(asyncio.run(batch())) == 3
+    # One hit for the cached question; the repeated new question is one lookup
+    assert counts(rag.answer_cache) == (2, 0, 5, 0.2857)
@@ -0,0 +1,190 @@
+import os
+
+import numpy as np
+import pytest
+
+from corpus import COMPACT_MIN_ROWS, MAX_SEGMENTS, Corpus
+from index_store import SEGMENTS_DIR, Chunk, current_index, load_version, prune_versions
+
+DIM = 8
+MODEL = "test-model"
+
+
+def chunks_and_vectors(texts, seed: int):
+    vectors = np.random.default_rng(seed).normal(size=(len(texts), DIM)).astype(np.float32)
+    return [Chunk(text, 0, len(text)) for text in texts], vectors
+
+
+def add(corpus: Corpus, name: str, texts, seed: int, collection: str = "default"):
+    chunks, vectors = chunks_and_vectors(texts, seed)
+    return corpus.add_document(name, chunks, vectors, collection), vectors
+
+
+def test_search_and_filters():
+    corpus = Corpus()
+    doc_a, vectors_a = add(corpus, "a.pdf", ["alpha one", "alpha two"], 0, "x")
+    doc_b, vectors_b = add(corpus, "b.pdf", ["beta one"], 1, "y")
+    assert len(corpus) == 3 and corpus.collections() == ["x", "y"]
+    hits = corpus.search([vectors_b[0]], top_k=1)[0]
+    assert hits[0][0].text == "beta one"
+    hits = corpus.search([vectors_b[0]], top_k=3, collections=["x"])[0]
+    assert {chunk.metadata["doc_id"] for chunk, _ in hits} == {doc_a.doc_id}
+    hits = corpus.lexical_search(["beta"], top_k=3)[0]
+    assert [chunk.text for chunk, _ in hits] == ["beta one"]
+
+
+def test_published_snapshot_is_not_changed_by_later_writes():
+    corpus = Corpus()
+    doc, vectors = add(corpus, "a.pdf", ["first chunk", "second chunk"], 2)
+    snapshot = corpus.snapshot
+    add(corpus, "b.pdf", ["third chunk"], 3)
+    corpus.delete_document(doc.doc_id)
+    assert snapshot.rows == 2 and len(snapshot.store) == 2 and len(snapshot.documents) == 1
+    hits = snapshot.hits(*snapshot.store.search(vectors[1], top_k=2))
+    assert [chunk.text for chunk, _ in hits][0] == "second chunk"
+    assert corpus.version > snapshot.version
+
+
+def test_appends_from_the_same_snapshot_stay_separate():
+    corpus = Corpus()
+    add(corpus, "a.pdf", ["shared chunk"], 4)
+    base = corpus.snapshot
+    corpus.create_document("b.pdf", doc_id="b")
+    corpus.create_document("c.pdf", doc_id="c")
+    with_docs = corpus.snapshot
+    corpus.append_chunks("b", *chunks_and_vectors(["chunk of b"], 5))
+    first = corpus.snapshot
+    # Derive a second snapshot from the same parent, as a writer racing the first would
+    corpus._snapshot = with_docs
+    corpus.append_chunks("c", *chunks_and_vectors(["chunk of c"], 6))
+    second = corpus.snapshot
+    assert base.rows == 1
+    assert [first.chunks[row].text for row in range(first.rows)] == ["shared chunk", "chunk of b"]
+    assert [second.chunks[row].text for row in range(second.rows)] == ["shared chunk", "chunk of c"]
+    assert not np.allclose(first.store.matrix[1], second.store.matrix[1])
+
+
+def test_delete_tombstones_then_compacts():
+    corpus = Corpus()
+    doc, _ = add(corpus, "small.pdf", ["to delete"], 7)
+    _, vectors = add(corpus, "kept.pdf", ["kept chunk"], 8)
+    assert corpus.delete_document(doc.doc_id)
+    assert not corpus.delete_document(doc.doc_id)
+    assert corpus.snapshot.dead_rows == 1 and len(corpus) == 1
+    assert [chunk.text for chunk, _ in corpus.search([vectors[0]], top_k=5)[0]] == ["kept chunk"]
+
+    big, _ = add(corpus, "big.pdf", [f"row {i}" for i in range(COMPACT_MIN_ROWS)], 9)
+    corpus.delete_document(big.doc_id)
+    snapshot = corpus.snapshot
+    assert snapshot.dead_rows == 0 and snapshot.rows == 1
+    assert [chunk.text for chunk, _ in corpus.search([vectors[0]], top_k=5)[0]] == ["kept chunk"]
+
+
+@pytest.mark.parametrize("precision", ["float32", "int8"])
+def test_save_and_load_round_trip(tmp_path, precision):
+    corpus = Corpus(precision=precision)
+    doc_a, vectors_a = add(corpus, "a.pdf", ["apple pie recipe", "apple varieties"], 10, "food")
+    doc_b, vectors_b = add(corpus, "b.pdf", ["bicycle repair"], 11, "bikes")
+    add(corpus, "c.pdf", ["deleted later"], 12)
+    corpus.delete_document(corpus.list_documents("default")[0].doc_id)
+    corpus.save(str(tmp_path), MODEL)
+
+    loaded = Corpus(precision=precision)
+    assert loaded.load(str(tmp_path), MODEL)
+    assert {doc.doc_id for doc in loaded.list_documents()} == {doc_a.doc_id, doc_b.doc_id}
+    assert len(loaded) == 3
+    hits = loaded.search([vectors_b[0]], top_k=1, collections=["bikes"])[0]
+    assert hits[0][0].text == "bicycle repair"
+    assert [chunk.text for chunk, _ in loaded.lexical_search(["apple"], top_k=5)[0]] == \
+        [chunk.text for chunk, _ in corpus.lexical_search(["apple"], top_k=5)[0]]
+    assert loaded.search([vectors_a[1]], top_k=1)[0][0][0].text == "apple varieties"
+
+    # A loaded corpus keeps accepting writes
+    add(loaded, "d.pdf", ["dynamo lights"], 13, "bikes")
+    assert len(loaded.list_documents("bikes")) == 2
+
+
+def test_load_without_saved_index(tmp_path):
+    assert not Corpus().load(str(tmp_path), MODEL)
+
+
+def segment_names(root) -> list:
+    return [entry["name"] for entry in load_version(current_index(str(root)), MODEL)["segments"]]
+
+
+def test_saves_write_only_appended_rows(tmp_path):
+    corpus = Corpus()
+    add(corpus, "a.pdf", [f"base row {i}" for i in range(100)], 14)
+    corpus.save(str(tmp_path), MODEL)
+    assert segment_names(tmp_path) == ["00000001"]
+
+    doc, vectors = add(corpus, "b.pdf", ["one more row"], 15)
+    corpus.save(str(tmp_path), MODEL)
+    assert segment_names(tmp_path) == ["00000001", "00000002"]
+    corpus.delete_document(doc.doc_id)
+    corpus.save(str(tmp_path), MODEL)
+    # A delete publishes a new document list only
+    assert segment_names(tmp_path) == ["00000001", "00000002"]
+
+    loaded = Corpus()
+    loaded.load(str(tmp_path), MODEL)
+    assert len(loaded) == 100 and doc.doc_id not in loaded.documents
+    assert loaded.search([vectors[0]], top_k=1)[0][0][0].text != "one more row"
+
+
+def test_load_reads_only_new_segments(tmp_path):
+    writer = Corpus()
+    add(writer, "a.pdf", [f"base row {i}" for i in range(100)], 16)
+    writer.save(str(tmp_path), MODEL)
+    reader = Corpus()
+    reader.load(str(tmp_path), MODEL)
+    base = reader.snapshot
+
+    doc, vectors = add(writer, "b.pdf", ["appended zebra row"], 17)
+    writer.save(str(tmp_path), MODEL)
+    reader.load(str(tmp_path), MODEL)
+    # The rows already loaded are kept, not read again
+    assert reader.snapshot.lexical._offsets is base.lexical._offsets
+    assert reader.search([vectors[0]], top_k=1)[0][0][0].text == "appended zebra row"
+    assert [chunk.text for chunk, _ in reader.lexical_search(["zebra"])[0]] == ["appended zebra row"]
+
+    writer.delete_document(doc.doc_id)
+    writer.save(str(tmp_path), MODEL)
+    reader.load(str(tmp_path), MODEL)
+    assert len(reader) == 100 and reader.lexical_search(["zebra"])[0] == []
+
+
+def test_segments_are_merged(tmp_path):
+    corpus = Corpus()
+    add(corpus, "a.pdf", [f"base row {i}" for i in range(1000)], 18)
+    corpus.save(str(tmp_path), MODEL)
+    for i in range(MAX_SEGMENTS):
+        add(corpus, f"small{i}.pdf", [f"small row {i}"], 19 + i)
+        corpus.save(str(tmp_path), MODEL)
+    # Past MAX_SEGMENTS, the segments after the first are merged into one
+    assert len(segment_names(tmp_path)) == 2 and segment_names(tmp_path)[0] == "00000001"
+
+    add(corpus, "big.pdf", [f"big row {i}" for i in range(200)], 40)
+    corpus.save(str(tmp_path), MODEL)
+    # Past MERGE_RATIO of the rows in later segments, everything is rewritten as one
+    assert len(segment_names(tmp_path)) == 1
+    assert sorted(os.listdir(tmp_path / SEGMENTS_DIR))[-1] == segment_names(tmp_path)[0]
+
+    loaded = Corpus()
+    loaded.load(str(tmp_path), MODEL)
+    assert len(loaded) == 1000 + MAX_SEGMENTS + 200
+    assert [chunk.text for chunk, _ in loaded.lexical_search(["small 7"], top_k=1)[0]] == ["small row 7"]
+
+
+def test_reset_prunes_old_segments(tmp_path):
+    corpus = Corpus()
+    add(corpus, "a.pdf", ["first"], 41)
+    corpus.save(str(tmp_path), MODEL)
+    add(corpus, "b.pdf", ["second"], 42)
+    corpus.save(str(tmp_path), MODEL)
+    corpus.clear()
+    corpus.save(str(tmp_path), MODEL)
+    prune_versions(str(tmp_path), 1)
+    assert os.listdir(tmp_path / SEGMENTS_DIR) == segment_names(tmp_path)
+    loaded = Corpus()
+    assert loaded.load(str(tmp_path), MODEL) and len(loaded) == 0
@@ -0,0 +1,95 @@
+import asyncio
+import random
+
+import numpy as np
+import openai
+import pytest
+
+import embedding_pipeline
+from embedding_pipeline import EmbeddingPipeline, EmbeddingStats, estimate_tokens
+from stubs import StubClient, StubEmbeddings, fake_embedding, rate_limit_error
+
+TEXTS = [f"text number {i} " + "word " * (i % 5) for i in range(9)]
+
+
+def expected(texts):
+    return np.array([fake_embedding(text) for text in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(embedding_pipeline.time, "sleep", delays.append)
+    return delays
+
+
+def test_rate_limited_batch_is_retried(sleeps):
+    embeddings = StubEmbeddings(errors=[rate_limit_error(), rate_limit_error()])
+    pipeline = EmbeddingPipeline(StubClient(embeddings), backoff_base=0.5, backoff_max=30)
+    stats = EmbeddingStats()
+    np.testing.assert_allclose(pipeline.embed(TEXTS, stats), expected(TEXTS))
+    assert stats.retries == 2 and len(embeddings.calls) == 3
+    # Exponential backoff with jitter between half and all of base * 2**attempt
+    assert 0.25 <= sleeps[0] <= 0.5 and 0.5 <= sleeps[1] <= 1.0
+
+
+def test_retries_give_up_after_max_retries(sleeps):
+    embeddings = StubEmbeddings(errors=[rate_limit_error() for _ in range(3)])
+    pipeline = EmbeddingPipeline(StubClient(embeddings), max_retries=2)
+    with pytest.raises(openai.RateLimitError):
+        pipeline.embed(TEXTS)
+    assert len(embeddings.calls) == 3 and len(sleeps) == 2
+
+
+def test_retry_after_header_is_respected(sleeps):
+    embeddings = StubEmbeddings(errors=[rate_limit_error("1.5"), rate_limit_error("120"), rate_limit_error("soon")])
+    pipeline = EmbeddingPipeline(StubClient(embeddings), backoff_base=0.01, backoff_max=30)
+    pipeline.embed(TEXTS)
+    # Capped at backoff_max; a value that is not a number falls back to backoff
+    assert sleeps[:2] == [1.5, 30]
+    assert 0.02 <= sleeps[2] <= 0.04
+
+
+def test_async_rate_limited_batch_is_retried(monkeypatch):
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(embedding_pipeline.asyncio, "sleep", sleep)
+    embeddings = StubEmbeddings(errors=[rate_limit_error("2")], asynchronous=True)
+    pipeline = EmbeddingPipeline(StubClient(), async_client=StubClient(embeddings, asynchronous=True))
+    np.testing.assert_allclose(asyncio.run(pipeline.aembed(TEXTS)), expected(TEXTS))
+    assert delays == [2.0]
+
+
+@pytest.mark.parametrize("max_batch_tokens, max_batch_size", [(40, 512), (10_000, 7), (25, 3)])
+def test_batches_respect_token_and_size_limits(max_batch_tokens, max_batch_size):
+    rng = random.Random(0)
+    texts = ["x" * rng.randint(1, 120) for _ in range(200)]
+    pipeline = EmbeddingPipeline(StubClient(), max_batch_tokens=max_batch_tokens, max_batch_size=max_batch_size)
+    batches = pipeline.make_batches(texts)
+    assert [i for batch in batches for i in batch] == list(range(len(texts)))
+    for batch in batches:
+        tokens = sum(estimate_tokens(texts[i]) for i in batch)
+        assert len(batch) <= max_batch_size
+        assert tokens <= max_batch_tokens or len(batch) == 1
+
+
+def test_batches_completing_out_of_order_keep_input_order():
+    texts = [f"passage {i}" for i in range(10)] + ["passage 3"]
+
+    def delay(batch):
+        # Earlier batches answer last
+        return 0.05 - 0.01 * texts.index(batch[0]) / 2
+
+    embeddings = StubEmbeddings(delay=delay)
+    pipeline = EmbeddingPipeline(StubClient(embeddings), max_batch_size=2, concurrency=4)
+    np.testing.assert_allclose(pipeline.embed(texts), expected(texts))
+    assert embeddings.completed != embeddings.calls
+
+    async_embeddings = StubEmbeddings(delay=delay, asynchronous=True)
+    pipeline = EmbeddingPipeline(StubClient(), max_batch_size=2, concurrency=4,
+                                 async_client=StubClient(async_embeddings, asynchronous=True))
+    np.testing.assert_allclose(asyncio.run(pipeline.aembed(texts)), expected(texts))
+    assert async_embeddings.completed != async_embeddings.calls
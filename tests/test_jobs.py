@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+import rag_system
+from corpus import Corpus
+from embedding_pipeline import EMBEDDING_MODEL
+from jobs import CANCELLED, FAILED, IngestJobManager
+from pdf_extract import PageText
+from stubs import stub_rag_system
+
+PAGE_TEXT = "lorem ipsum dolor sit amet " * 100
+
+
+@pytest.mark.parametrize("outcome", [FAILED, CANCELLED])
+def test_unfinished_job_leaves_no_chunks_in_saved_index(tmp_path, monkeypatch, outcome):
+    index_dir = str(tmp_path / "index")
+    rag = stub_rag_system(chunk_tokens=0)
+    rag.corpus.add_document("kept.pdf", *_chunks_and_vectors(rag, ["kept chunk"]))
+    monkeypatch.setattr(rag_system, "CHUNKS_PER_STEP", 1)
+    monkeypatch.setattr(rag_system, "count_pages", lambda path: 3)
+    mid_ingest = asyncio.Event()
+
+    async def page_ranges(pdf_path, executor, total_pages):
+        yield [PageText(1, PAGE_TEXT)]
+        # Chunks of page 1 are published; another job finishing now saves them
+        await asyncio.to_thread(rag.save_index, index_dir)
+        mid_ingest.set()
+        if outcome == FAILED:
+            raise RuntimeError("unreadable page")
+        await asyncio.Event().wait()
+        yield [PageText(2, PAGE_TEXT)]
+
+    monkeypatch.setattr(rag_system, "aiter_page_ranges", page_ranges)
+    finished = asyncio.Event()
+
+    async def on_finish(job):
+        await asyncio.to_thread(rag.save_index, index_dir)
+        finished.set()
+
+    async def run():
+        manager = IngestJobManager(rag, workers=1, on_finish=on_finish)
+        await manager.start()
+        pdf = tmp_path / "partial.pdf"
+        pdf.write_bytes(b"%PDF")
+        job = manager.submit(str(pdf), "partial.pdf")
+        await mid_ingest.wait()
+        assert _saved_chunks(index_dir) > 1
+        if outcome == CANCELLED:
+            assert manager.cancel(job.job_id)
+        await asyncio.wait_for(finished.wait(), 10)
+        await manager.stop()
+        return job
+
+    job = asyncio.run(run())
+    assert job.status == outcome and job.document_id is not None
+    reloaded = Corpus()
+    assert reloaded.load(index_dir, EMBEDDING_MODEL)
+    assert len(reloaded) == 1
+    assert [doc.name for doc in reloaded.list_documents()] == ["kept.pdf"]
+
+
+def _chunks_and_vectors(rag, texts):
+    chunks = [rag_system.Chunk(text, 0, len(text)) for text in texts]
+    return chunks, rag.embedder.embed(texts)
+
+
+def _saved_chunks(index_dir: str) -> int:
+    corpus = Corpus()
+    corpus.load(index_dir, EMBEDDING_MODEL)
+    return len(corpus)
@@ -0,0 +1,59 @@
+import glob
+import os
+
+import numpy as np
+
+from corpus import Corpus
+from index_store import Chunk
+from lexical_index import TOKENIZER_VERSION, BM25Index, tokenize
+
+
+def search_texts(texts, query, top_k=3):
+    index = BM25Index()
+    index.add([tokenize(text) for text in texts])
+    rows, _ = index.search(tokenize(query), top_k)
+    return [texts[row] for row in rows]
+
+
+def test_words_of_spaced_scripts_and_codes():
+    assert tokenize("Fehler err-1042 im Café, naïve Größe") == ["fehler", "err-1042", "err", "1042", "im", "café",
+                                                              "naïve", "größe"]
+    # A decomposed accent (base letter plus combining mark) matches the composed letter
+    assert tokenize("cafe\u0301") == ["caf\u00e9"]
+    assert tokenize("Ошибка сети") == ["ошибка", "сети"]
+    assert tokenize("한국어 문장") == ["한국어", "문장"]
+
+
+def test_unsegmented_scripts_become_bigrams():
+    assert tokenize("東京タワー") == ["東京", "京タ", "タワ", "ワー"]
+    assert tokenize("abc東京 日") == ["abc", "東京", "日"]
+    # Halfwidth katakana is normalized to fullwidth
+    assert tokenize("ｶﾀｶﾅ") == tokenize("カタカナ")
+    texts = ["东京塔的高度是三百三十三米", "大阪城在大阪市中央区", "ภาษาไทยเป็นภาษาที่สวยงาม", "the tower is tall"]
+    assert search_texts(texts, "高度")[0] == texts[0]
+    assert search_texts(texts, "大阪")[0] == texts[1]
+    assert search_texts(texts, "ภาษาไทย")[0] == texts[2]
+
+
+def test_tokenizer_version_is_saved(tmp_path):
+    index = BM25Index()
+    index.add([tokenize("東京タワー")])
+    index.save(str(tmp_path / "bm25"))
+    loaded = BM25Index.load(str(tmp_path / "bm25"))
+    assert loaded.tokenizer_version == TOKENIZER_VERSION
+    np.save(tmp_path / "bm25" / "params.npy", np.array([1.2, 0.75]))
+    assert BM25Index.load(str(tmp_path / "bm25")).tokenizer_version == 1
+
+
+def test_postings_of_another_tokenizer_are_rebuilt_on_load(tmp_path):
+    corpus = Corpus()
+    texts = ["東京タワーの高さ", "大阪城"]
+    vectors = np.random.default_rng(0).normal(size=(2, 8)).astype(np.float32)
+    corpus.add_document("a.pdf", [Chunk(text, 0, len(text)) for text in texts], vectors)
+    corpus.save(str(tmp_path), "model")
+    [params] = glob.glob(os.path.join(tmp_path, "**", "bm25", "params.npy"), recursive=True)
+    np.save(params, np.array([1.2, 0.75]))
+    loaded = Corpus()
+    loaded.load(str(tmp_path), "model")
+    assert loaded.snapshot.lexical.tokenizer_version == TOKENIZER_VERSION
+    assert [chunk.text for chunk, _ in loaded.lexical_search(["タワー"])[0]] == [texts[0]]
@@ -0,0 +1,35 @@
+import asyncio
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+from embedding_pipeline import EMBEDDING_MODEL
+from index_store import Chunk
+from rag_system import DENSE
+from stubs import fake_embedding, stub_rag_system
+
+
+def test_batch_questions_bypass_the_embedding_cache(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.db"))
+    rag = stub_rag_system(embedding_cache=cache, retrieval_mode=DENSE, answer_top_k=1)
+    # Each chunk's text is one of the questions, so a question's own vector retrieves its chunk first
+    texts = ["where is the manual", "how are retries timed", "what is the rate limit"]
+    vectors = np.array([fake_embedding(text) for text in texts], dtype=np.float32)
+    rag.corpus.add_document("doc.pdf", [Chunk(text, 0, len(text)) for text in texts], vectors)
+    # A stale cached vector for a question would retrieve the wrong chunk
+    cache.put_many(EMBEDDING_MODEL, [texts[0]], np.array([fake_embedding(texts[2])], dtype=np.float32))
+    before = cache.stats()
+    questions = [texts[0], texts[1], texts[0], texts[2], texts[1]]
+
+    async def batch():
+        return [item async for item in rag.aanswer_batch(questions)]
+
+    results = dict(asyncio.run(batch()))
+    assert sorted(results) == list(range(len(questions)))
+    for i, question in enumerate(questions):
+        context = results[i]["answer"].split("Question:")[0]
+        assert question in context and not any(text in context for text in texts if text != question)
+    assert rag.async_client.embeddings.calls[-1] == [texts[0], texts[1], texts[2]]
+    after = cache.stats()
+    assert (after["entries"], after["hits"], after["misses"]) == (before["entries"], before["hits"], before["misses"])
+    assert list(cache.get_many(EMBEDDING_MODEL, texts)) == [0]
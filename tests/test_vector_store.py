@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from vector_store import VectorStore, normalize_rows
+
+DIM = 16
+
+
+def random_rows(count: int, seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(count, DIM)).astype(np.float32)
+
+
+@pytest.mark.parametrize("precision", ["float32", "int8"])
+def test_search_finds_each_row(precision):
+    rows = random_rows(50, 0)
+    store = VectorStore(DIM, precision=precision)
+    assert list(store.add(rows)) == list(range(50))
+    ids, scores = store.search_batch(rows, top_k=1)
+    assert ids[:, 0].tolist() == list(range(50))
+    assert np.allclose(scores[:, 0], 1.0, atol=1e-3)
+
+
+def test_search_respects_mask():
+    rows = random_rows(20, 1)
+    store = VectorStore(DIM)
+    store.add(rows)
+    mask = np.zeros(20, dtype=bool)
+    mask[[3, 7]] = True
+    ids, _ = store.search(rows[0], top_k=5, mask=mask)
+    assert sorted(ids.tolist()) == [3, 7]
+
+
+@pytest.mark.parametrize("precision", ["float32", "int8"])
+def test_appended_leaves_base_unchanged(precision):
+    base = VectorStore(DIM, precision=precision)
+    base.add(random_rows(10, 2))
+    before = base.matrix.copy()
+    grown = base.appended(random_rows(5, 3))
+    assert len(base) == 10 and len(grown) == 15
+    assert np.array_equal(base.matrix, before)
+    assert np.array_equal(grown.matrix[:10], before)
+
+
+@pytest.mark.parametrize("precision", ["float32", "int8"])
+def test_sibling_appends_do_not_overwrite_each_other(precision):
+    base = VectorStore(DIM, precision=precision)
+    base.add(random_rows(10, 4))
+    first_rows, second_rows = random_rows(3, 5), random_rows(3, 6)
+    first = base.appended(first_rows)
+    second = base.appended(second_rows)
+    assert np.allclose(first.matrix[10:], normalize_rows(first_rows), atol=1e-6)
+    assert np.allclose(second.matrix[10:], normalize_rows(second_rows), atol=1e-6)
+    assert first.search(first_rows[0], 1)[0].tolist() == [10]
+    assert second.search(second_rows[0], 1)[0].tolist() == [10]
+
+
+def test_take_keeps_selected_rows_in_order():
+    rows = random_rows(10, 7)
+    store = VectorStore(DIM)
+    store.add(rows)
+    kept = store.take(np.array([1, 4, 8]))
+    assert np.allclose(kept.matrix, normalize_rows(rows[[1, 4, 8]]), atol=1e-6)
+    assert kept.search(rows[4], 1)[0].tolist() == [1]
+
+
+@pytest.mark.parametrize("precision", ["float32", "int8"])
+def test_write_and_load_round_trip(tmp_path, precision):
+    rows = random_rows(30, 8)
+    store = VectorStore(DIM, precision=precision)
+    store.add(rows)
+    path = str(tmp_path / "embeddings.f32")
+    with open(path, "wb") as f:
+        store.write(f)
+    loaded = VectorStore.load(path, DIM, 30, precision=precision, int8_range=store.int8_range)
+    assert np.allclose(loaded.matrix, store.matrix)
+    assert np.array_equal(loaded.search_batch(rows, 3)[0], store.search_batch(rows, 3)[0])
+    # Rows added to a loaded store are held in memory; the saved ones stay mapped
+    added = random_rows(2, 9)
+    loaded.add(added)
+    assert len(loaded) == 32
+    assert loaded.memory()["mapped_bytes"] == 30 * DIM * 4
+    assert loaded.search_batch(added, 1)[0][:, 0].tolist() == [30, 31]
+    saved_rows = np.arange(32) < 30
+    assert np.array_equal(loaded.search_batch(rows, 3, saved_rows)[0], store.search_batch(rows, 3)[0])
+
+
+def test_attached_store_reads_full_rows_from_file(tmp_path):
+    rows = random_rows(30, 10)
+    store = VectorStore(DIM, precision="int8")
+    store.add(rows)
+    path = str(tmp_path / "embeddings.f32")
+    with open(path, "wb") as f:
+        store.write(f)
+    attached = store.attached(path)
+    assert attached.memory()["mapped_bytes"] == 30 * DIM * 4
+    assert np.array_equal(attached.search_batch(rows, 3)[0], store.search_batch(rows, 3)[0])
+    grown = attached.appended(random_rows(2, 11))
+    assert len(grown) == 32 and len(attached) == 30
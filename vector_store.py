@@ -0,0 +1,432 @@
+import copy
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from ann_index import IVFIndex
+
+# Below this many rows a brute-force scan is as fast as probing an ANN index.
+ANN_MIN_ROWS = 50_000
+# Filters selecting at most this share of rows are answered by an exact scan.
+ANN_MAX_MASK_FRACTION = 0.1
+# No float16: NumPy widens it to float32 without SIMD, making scans about 7x slower than float32, while int8 takes
+# half its memory and scans about as fast as float32.
+PRECISIONS = ("float32", "int8")
+# Compact stores shortlist this many rows per requested result and rescore them at full precision.
+RESCORE_CANDIDATES = 4
+# Compact rows are encoded and written this many at a time
+_BLOCK_ROWS = 16_384
+# and widened to float32 for scoring in blocks of about this many values, which stay in cache.
+_SCAN_BLOCK_VALUES = 1 << 18
+# Lower bound of the int8 range, in standard deviations of a unit vector's components.
+INT8_MIN_RANGE = 4.0
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _reserved(buffer: Optional[np.ndarray], used: int, needed: int, columns: int, dtype, initial: int) -> np.ndarray:
+    """buffer if it has room for needed rows, else a larger copy of its first used rows."""
+    if buffer is None:
+        return np.empty((max(initial, needed), columns), dtype=dtype)
+    capacity = buffer.shape[0]
+    if needed <= capacity:
+        return buffer
+    capacity = max(capacity, 1)
+    while capacity < needed:
+        capacity *= 2
+    grown = np.empty((capacity, columns), dtype=dtype)
+    grown[:used] = buffer[:used]
+    return grown
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores along the last axis, best first."""
+    n = scores.shape[-1]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    if k < n:
+        part = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        part = np.broadcast_to(np.arange(n), scores.shape)
+    order = np.argsort(-np.take_along_axis(scores, part, axis=-1), axis=-1, kind="stable")
+    return np.take_along_axis(part, order, axis=-1)
+
+
+class _SplitRows:
+    """The full-precision rows of a store split between a mapped file and memory, indexed by row ids like a matrix."""
+
+    def __init__(self, store: "VectorStore"):
+        self._store = store
+
+    def __getitem__(self, ids) -> np.ndarray:
+        return self._store._full_rows(ids)
+
+
+class VectorStore:
+    """Growable, contiguous float32 matrix of unit-normalized embeddings.
+
+    Rows are normalized on insert, so cosine similarity against a normalized
+    query is a single matrix-vector product. Once an IVF index is built
+    (build_ann), searches probe it instead and fall back to the exact scan
+    when asked to, or when a filter leaves too few candidates.
+
+    A compact store (precision "int8", and/or search_dims below
+    the embedding size) scans a smaller copy of each row instead: its first
+    search_dims components (Matryoshka truncation), renormalized and
+    quantized. The best rescore * top_k rows are then rescored against the
+    full float32 rows, which after attached() are read from the saved
+    embeddings file, so only the compact rows and rows added since the last
+    save take process memory.
+
+    A store opened with load() likewise reads its rows from the mapped file
+    and keeps only rows added later in memory.
+    """
+
+    def __init__(self, dim: Optional[int] = None, capacity: int = 1024, precision: str = "float32",
+                 search_dims: Optional[int] = None, rescore: int = RESCORE_CANDIDATES):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision {precision!r}; expected one of {', '.join(PRECISIONS)}")
+        self.dim = dim
+        self.precision = precision
+        self.search_dims = search_dims
+        # Shortlist size per requested result of compact searches; 0 returns compact scores unrescored
+        self.rescore = rescore
+        self._initial_capacity = capacity
+        # Full-precision rows; only those past _base_rows if the first rows are read from a file (_base)
+        self._data = np.empty((capacity, dim), dtype=np.float32) if dim else None
+        self._base: Optional[np.ndarray] = None
+        self._base_rows = 0
+        self._codes: Optional[np.ndarray] = None
+        # int8 codes step over [-int8_range, int8_range]; calibrated by the first add
+        self.int8_range: Optional[float] = None
+        self._size = 0
+        # Rows written to the row buffers, shared by the stores sharing them (see appended)
+        self._filled = [0]
+        self.ann: Optional[IVFIndex] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def scan_dim(self) -> Optional[int]:
+        if self.dim is None or not self.search_dims:
+            return self.dim
+        return min(self.search_dims, self.dim)
+
+    @property
+    def compact(self) -> bool:
+        return self.precision != "float32" or self.scan_dim != self.dim
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """The full-precision rows; a copy for compact stores with rows on both sides of the last save."""
+        if self._data is None and self._base is None:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return self._full_slice(0, self._size)
+
+    @property
+    def scan_matrix(self) -> np.ndarray:
+        """The rows searches score: matrix itself, or the compact rows."""
+        if not self.compact:
+            return self.matrix
+        if self._codes is None:
+            return np.empty((0, self.scan_dim or 0), dtype=self._code_dtype)
+        return self._codes[:self._size]
+
+    @property
+    def _code_dtype(self):
+        return np.dtype(self.precision)
+
+    def _like(self) -> "VectorStore":
+        return VectorStore(self.dim, self._initial_capacity, self.precision, self.search_dims, self.rescore)
+
+    def _full_slice(self, start: int, stop: int) -> np.ndarray:
+        parts = []
+        if start < self._base_rows:
+            parts.append(self._base[start:min(stop, self._base_rows)])
+        if stop > self._base_rows:
+            parts.append(self._data[max(start, self._base_rows) - self._base_rows:stop - self._base_rows])
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def _full_rows(self, ids: np.ndarray) -> np.ndarray:
+        """Full-precision rows by id, in any shape of ids."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not self._base_rows:
+            return self._data[ids]
+        if self._size == self._base_rows:
+            return self._base[ids]
+        rows = np.empty(ids.shape + (self.dim,), dtype=np.float32)
+        in_base = ids < self._base_rows
+        rows[in_base] = self._base[ids[in_base]]
+        if not in_base.all():
+            rows[~in_base] = self._data[ids[~in_base] - self._base_rows]
+        return rows
+
+    def _encode(self, rows: np.ndarray) -> np.ndarray:
+        """Compact form of normalized full-precision rows."""
+        scan = rows[:, :self.scan_dim]
+        if self.scan_dim != self.dim:
+            scan = normalize_rows(scan)
+        if self.precision != "int8":
+            return scan.astype(self._code_dtype)
+        if self.int8_range is None:
+            self.int8_range = max(float(np.abs(scan).max()), INT8_MIN_RANGE / np.sqrt(self.scan_dim))
+        return np.clip(np.rint(scan * (127 / self.int8_range)), -127, 127).astype(np.int8)
+
+    def _scan_queries(self, queries: np.ndarray) -> np.ndarray:
+        """Normalized queries in the space of scan_matrix, scaled so scores approximate cosine similarity."""
+        if not self.compact:
+            return queries
+        queries = queries[:, :self.scan_dim]
+        if self.scan_dim != self.dim:
+            queries = normalize_rows(queries)
+        if self.precision == "int8":
+            queries = queries * np.float32(self.int8_range / 127)
+        return queries
+
+    def add(self, vectors) -> range:
+        """Append vectors (one per row) and return the row ids they were assigned."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        if vectors.shape[0] == 0:
+            return range(self._size, self._size)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dimension {self.dim}, got {vectors.shape[1]}")
+
+        start = self._size
+        count = vectors.shape[0]
+        if self._filled[0] != start:
+            # Another store sharing the buffers has written its own rows past ours
+            self._own_buffers()
+        data, codes = self._data, self._codes
+        vectors = normalize_rows(vectors)
+        scan = vectors
+        if self.compact:
+            scan = self._encode(vectors)
+            self._codes = _reserved(self._codes, start, start + count, self.scan_dim, self._code_dtype,
+                                    self._initial_capacity)
+            self._codes[start:start + count] = scan
+        tail = start - self._base_rows
+        self._data = _reserved(self._data, tail, tail + count, self.dim, np.float32, self._initial_capacity)
+        self._data[tail:tail + count] = vectors
+        self._size += count
+        if (data is None or self._data is not data) and (codes is None or self._codes is not codes):
+            # Grown into new buffers, shared with no other store
+            self._filled = [self._size]
+        else:
+            self._filled[0] = self._size
+        if self.ann is not None:
+            self.ann.add(scan)
+        return range(start, self._size)
+
+    def _own_buffers(self):
+        """Replace the row buffers by copies of this store's own rows."""
+        if self._data is not None:
+            self._data = self._data[:self._size - self._base_rows].copy()
+        if self._codes is not None:
+            self._codes = self._codes[:self._size].copy()
+        self._filled = [self._size]
+
+    def appended(self, vectors) -> "VectorStore":
+        """A new store with vectors added after the existing rows; this one is left as it was.
+
+        The row buffers are shared while they have spare capacity. The new
+        rows land past this store's size, where its searches never look, so
+        concurrent readers of this store are unaffected. Only the first store
+        appended to a given one writes into the shared buffers; later ones
+        find them filled past their rows and copy.
+        """
+        store = copy.copy(self)
+        if self.ann is not None:
+            store.ann = copy.copy(self.ann)
+        store.add(vectors)
+        return store
+
+    def build_ann(self, nlist: Optional[int] = None, nprobe: Optional[int] = None) -> IVFIndex:
+        """Train an IVF index over the current (scanned) rows; later adds are inserted incrementally."""
+        self.ann = IVFIndex.train(self.scan_matrix, nlist, nprobe)
+        return self.ann
+
+    def _prepare_queries(self, queries) -> np.ndarray:
+        queries = np.asarray(queries, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        return normalize_rows(queries)
+
+    def search(self, query: Sequence[float], top_k: int = 3, mask: Optional[np.ndarray] = None,
+               nprobe: Optional[int] = None, exact: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (row ids, cosine scores) of the top_k rows, best first."""
+        ids, scores = self.search_batch([query], top_k, mask, nprobe, exact)
+        return ids[0], scores[0]
+
+    def search_batch(self, queries, top_k: int = 3, mask: Optional[np.ndarray] = None,
+                     nprobe: Optional[int] = None, exact: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """Score many queries; returns (ids, scores) of shape (q, k).
+
+        mask, if given, is a boolean array over rows; only True rows can be returned.
+        Without an ANN index (or with exact=True) all queries share one matmul.
+        exact does not turn off the compact scan of a compact store.
+        """
+        queries = self._prepare_queries(queries)
+        selected = self._size
+        if mask is not None:
+            selected = int(np.count_nonzero(mask[:self._size]))
+            top_k = min(top_k, selected)
+        if self._size == 0 or top_k <= 0:
+            empty = np.empty((queries.shape[0], 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+
+        rescore = self.compact and self.rescore > 0
+        shortlist = min(top_k * self.rescore, selected) if rescore else top_k
+        scan_queries = self._scan_queries(queries)
+        if not exact and self.ann is not None and len(self.ann) == self._size and (
+                mask is None or selected > ANN_MAX_MASK_FRACTION * self._size):
+            ids, scores = self._search_ann(scan_queries, shortlist, mask, nprobe)
+        else:
+            ids, scores = self._search_exact(scan_queries, shortlist, mask)
+        if rescore:
+            return self._rescored(queries, ids, top_k)
+        return ids, scores
+
+    def _scan_scores(self, queries: np.ndarray) -> np.ndarray:
+        if not self.compact and self._base_rows:
+            if self._size == self._base_rows:
+                return queries @ self._base.T
+            scores = np.empty((queries.shape[0], self._size), dtype=np.float32)
+            scores[:, :self._base_rows] = queries @ self._base.T
+            scores[:, self._base_rows:] = queries @ self._data[:self._size - self._base_rows].T
+            return scores
+        matrix = self.scan_matrix
+        if matrix.dtype == np.float32:
+            return queries @ matrix.T
+        scores = np.empty((queries.shape[0], self._size), dtype=np.float32)
+        block_rows = max(1, _SCAN_BLOCK_VALUES // matrix.shape[1])
+        for start in range(0, self._size, block_rows):
+            block = matrix[start:start + block_rows].astype(np.float32)
+            scores[:, start:start + block.shape[0]] = queries @ block.T
+        return scores
+
+    def _search_exact(self, queries: np.ndarray, top_k: int, mask: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        scores = self._scan_scores(queries)
+        if mask is not None:
+            scores[:, ~mask[:self._size]] = -np.inf
+        ids = top_k_indices(scores, top_k)
+        return ids, np.take_along_axis(scores, ids, axis=-1)
+
+    def _search_ann(self, queries: np.ndarray, top_k: int, mask: Optional[np.ndarray],
+                    nprobe: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+        ids = np.empty((queries.shape[0], top_k), dtype=np.int64)
+        scores = np.empty((queries.shape[0], top_k), dtype=np.float32)
+        rows = self.scan_matrix if self.compact or not self._base_rows else _SplitRows(self)
+        approximate = self.ann.search(rows, queries, top_k, nprobe, mask)
+        fallback = [i for i, result in enumerate(approximate) if result is None]
+        for i, result in enumerate(approximate):
+            if result is not None:
+                ids[i], scores[i] = result
+        if fallback:
+            ids[fallback], scores[fallback] = self._search_exact(queries[fallback], top_k, mask)
+        return ids, scores
+
+    def _rescored(self, queries: np.ndarray, ids: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """The top_k of each query's shortlist ids by full-precision cosine similarity."""
+        scores = (self._full_rows(ids) @ queries[:, :, None])[..., 0]
+        best = top_k_indices(scores, top_k)
+        return np.take_along_axis(ids, best, axis=-1), np.take_along_axis(scores, best, axis=-1)
+
+    def take(self, rows: np.ndarray) -> "VectorStore":
+        """Return a new in-memory store holding only the given rows (indices or boolean mask)."""
+        store = self._like()
+        if self._size:
+            rows = np.asarray(rows)
+            if rows.dtype == np.bool_:
+                rows = np.flatnonzero(rows[:self._size])
+            store._data = np.ascontiguousarray(self._full_rows(rows))
+            store._size = store._filled[0] = store._data.shape[0]
+            if self.compact:
+                store._codes = np.ascontiguousarray(self.scan_matrix[rows])
+                store.int8_range = self.int8_range
+            if self.ann is not None:
+                store.ann = self.ann.reassigned(store.scan_matrix)
+        return store
+
+    def write(self, file, start: int = 0):
+        """Write the full-precision rows from row start on to a binary file as raw row-major float32, a block at a time."""
+        for block in range(start, self._size, _BLOCK_ROWS):
+            file.write(np.ascontiguousarray(self._full_slice(block, min(block + _BLOCK_ROWS, self._size))).tobytes())
+
+    def attached(self, path: str) -> "VectorStore":
+        """A copy of a compact store reading its full-precision rows from path, written by write().
+
+        This releases the in-memory full-precision rows; other stores are returned as they are.
+        """
+        if not self.compact or not self._size:
+            return self
+        store = copy.copy(self)
+        store._base = np.memmap(path, dtype=np.float32, mode="r", shape=(self._size, self.dim))
+        store._base_rows = self._size
+        store._data = None
+        return store
+
+    def memory(self) -> dict:
+        """Bytes of row data held in memory (compact rows included) and read from a mapped file."""
+        full = self._size * (self.dim or 0) * 4
+        mapped = self._base_rows * self.dim * 4 if isinstance(self._base, np.memmap) else 0
+        resident = full - mapped
+        if self.compact:
+            resident += self.scan_matrix.nbytes
+        return {"resident_bytes": resident, "mapped_bytes": mapped,
+                "ann_bytes": len(self.ann) * 4 if self.ann is not None else 0}
+
+    @classmethod
+    def load(cls, path: str, dim: int, count: int, mmap: bool = True, precision: str = "float32",
+             search_dims: Optional[int] = None, rescore: int = RESCORE_CANDIDATES, codes_path: Optional[str] = None,
+             int8_range: Optional[float] = None) -> "VectorStore":
+        """Open a raw row-major float32 file of already-normalized rows.
+
+        A memory-mapped store keeps reading the file's rows from it; rows
+        added later are held in memory. A compact store also copies its
+        compact rows; they are loaded from codes_path (an .npy file) if
+        given, else encoded from the file.
+        """
+        store = cls(dim, precision=precision, search_dims=search_dims, rescore=rescore)
+        if count == 0:
+            return store
+        if mmap:
+            rows = np.memmap(path, dtype=np.float32, mode="r", shape=(count, dim))
+        else:
+            rows = np.fromfile(path, dtype=np.float32, count=count * dim).reshape(count, dim)
+        store._size = store._filled[0] = count
+        if not store.compact and not mmap:
+            store._data = rows
+            return store
+        store._base = rows
+        store._base_rows = count
+        store._data = None
+        if not store.compact:
+            return store
+        if codes_path is not None:
+            store._codes = np.load(codes_path, mmap_mode="r" if mmap else None)
+            store.int8_range = int8_range
+        else:
+            store._codes = np.empty((count, store.scan_dim), dtype=store._code_dtype)
+            for start in range(0, count, _BLOCK_ROWS):
+                store._codes[start:start + _BLOCK_ROWS] = store._encode(np.asarray(rows[start:start + _BLOCK_ROWS]))
+        return store
+
+    def clear(self):
+        self._data = np.empty((self._initial_capacity, self.dim), dtype=np.float32) if self.dim else None
+        self._base = None
+        self._base_rows = 0
+        self._codes = None
+        self.int8_range = None
+        self._size = 0
+        self._filled = [0]
+        self.ann = None